@@ -4,6 +4,7 @@ from lms_core.models import (
     Student, Course, Enrollment, Assignment, 
     Quiz, Grade, Forum, Query, ResponseTemplate, KnowledgeBase
 )
+from lms_core.id_allocator import enrollment_ids, grade_ids
 from .models import Teacher
 
 class TeacherSignupForm(forms.ModelForm):
@@ -171,6 +172,15 @@ class GradeForm(forms.ModelForm):
             'graded_date': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
             'feedback': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
         }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['grade_id'].required = False
+        self.fields['grade_id'].widget.attrs['placeholder'] = 'Leave blank to generate'
+    
+    def clean_grade_id(self):
+        # New grades left without an id get the next one from the allocator
+        return self.cleaned_data['grade_id'] or grade_ids.next_id()
 
 class EnrollmentForm(forms.ModelForm):
     # Add choice fields for better UX
@@ -214,6 +224,14 @@ class EnrollmentForm(forms.ModelForm):
                 'max': '100'
             }),
         }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['enrollment_id'].required = False
+    
+    def clean_enrollment_id(self):
+        # New enrollments left without an id get the next one from the allocator
+        return self.cleaned_data['enrollment_id'] or enrollment_ids.next_id()
 
 
 class ForumForm(forms.ModelForm):
@@ -0,0 +1,12 @@
+"""
+Gunicorn configuration for the lms project.
+
+With LMS_AI_PRELOAD=1 the application is imported once in the master
+process, lms.wsgi warms up the AI engine (classifier, knowledge base index)
+and the forked workers share that memory copy-on-write. Without it every
+worker builds the engine lazily on its first AI query.
+"""
+
+import os
+
+preload_app = os.environ.get('LMS_AI_PRELOAD') == '1'
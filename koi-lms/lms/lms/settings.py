@@ -130,3 +130,114 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# AI query engine
+# Fitted indexes (knowledge base BM25 index etc.) are persisted here so that
+# restarted workers load them instead of refitting.
+
+AI_INDEX_DIR = BASE_DIR / 'ai_index'
+
+# In-process cache of AI answers, invalidated by model signals. Other
+# workers drop the same entries when they next check the shared generation
+# (AI_ENGINE_RELOAD_INTERVAL); the TTL (seconds) only bounds entry age.
+AI_RESPONSE_CACHE = {
+    'MAX_ENTRIES': 2048,
+    'TTL': 300,
+}
+
+# Predictions of the trained intent classifier (manage.py
+# train_intent_classifier) below this probability fall back to keywords.
+AI_INTENT_MIN_CONFIDENCE = 0.35
+
+# Async AI endpoints (ai_query_async_view, api_query_async): engine work runs
+# in a bounded thread pool with at most MAX_CONCURRENCY jobs per event loop.
+# Requests wait QUEUE_TIMEOUT seconds for a slot and TIMEOUT seconds for an answer.
+AI_ENGINE_POOL = {
+    'MAX_WORKERS': 4,
+    'MAX_CONCURRENCY': 16,
+    'QUEUE_TIMEOUT': 2.0,
+    'TIMEOUT': 10.0,
+}
+
+# How often (seconds) each worker re-reads the shared AI engine generation
+# to pick up template, keyword and knowledge base changes made elsewhere.
+AI_ENGINE_RELOAD_INTERVAL = 1.0
+
+# Query, Grade and Enrollment ids are handed out from blocks of this many
+# numbers reserved per worker (lms_core.id_allocator). Unused numbers of a
+# block are skipped when the worker exits.
+ID_ALLOCATOR_BLOCK_SIZE = 50
+
+# Answered AI queries are queued in process and written with bulk_create
+# every BATCH_SIZE records or FLUSH_INTERVAL seconds (lms_core.query_log).
+# Queued records are appended to spill files in SPILL_DIR first and replayed
+# after a crash; FSYNC also survives an OS crash at the cost of an fsync per
+# query. Rows the database rejects are moved to SPILL_DIR/dead_letter.jsonl.
+# While the database is down at most MAX_QUEUE records wait in memory, the
+# rest are replayed from the spill files later. ENABLED=False writes each
+# query synchronously.
+AI_QUERY_LOG = {
+    'ENABLED': True,
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+    'SPILL_DIR': BASE_DIR / 'query_log',
+    'FSYNC': False,
+    'MAX_QUEUE': 10000,
+}
+
+# Hits of curated KnowledgeBase keywords are counted in process and added to
+# the KeywordStat table (shown in the admin) at most this often (seconds).
+AI_KEYWORD_STATS_FLUSH_INTERVAL = 30.0
+
+# Concurrent identical AI queries that miss the response cache share one
+# computation (lms_core.single_flight); waiters give up after WAIT_TIMEOUT
+# seconds and answer themselves. Set SHARED_CACHE to a CACHES alias backed by
+# a shared store (Redis, Memcached, database) to also coalesce across
+# workers: the computing worker holds a lock there for up to LOCK_TIMEOUT
+# seconds and publishes its answer for RESULT_TTL seconds.
+AI_SINGLE_FLIGHT = {
+    'WAIT_TIMEOUT': 10.0,
+    'SHARED_CACHE': None,
+    'LOCK_TIMEOUT': 10.0,
+    'RESULT_TTL': 10.0,
+}
+
+# Admission control for the synchronous AI views (lms_core.admission): at most
+# MAX_CONCURRENCY engine calls per worker, MAX_QUEUE more waiting up to
+# QUEUE_TIMEOUT seconds, and a per-student token bucket of RATE requests per
+# second with bursts of BURST (also applied to the async views). Shed requests
+# get the default reply for their intent right away.
+AI_ADMISSION = {
+    'MAX_CONCURRENCY': 8,
+    'MAX_QUEUE': 16,
+    'QUEUE_TIMEOUT': 0.5,
+    'RATE': 1.0,
+    'BURST': 10,
+}
+
+# "Students also asked" suggestions on the AI Assistant page
+# (lms_core.similar_queries). Build the index with
+# `manage.py build_similar_queries`; workers add newly resolved queries every
+# REFRESH_INTERVAL seconds. Up to LIMIT questions asked at least MIN_ASKED
+# times with a cosine similarity of MIN_SCORE are shown. Lookups skip
+# features shared by more than MAX_POSTINGS questions when rarer ones exist,
+# and DELTA_SIZE new questions are merged into the main index at once.
+AI_SIMILAR_QUERIES = {
+    'LIMIT': 3,
+    'MIN_SCORE': 0.35,
+    'MIN_ASKED': 2,
+    'REFRESH_INTERVAL': 30.0,
+    'MAX_POSTINGS': 10000,
+    'DELTA_SIZE': 5000,
+}
+
+# Dashboard, grades, assignments and course pages (lms_core.page_cache) keep
+# their context and rendered content in the CACHE alias for TIMEOUT seconds,
+# under keys versioned per student and per course that model signals bump.
+# With several workers use a shared cache (Redis, Memcached) so a change is
+# seen by all of them at once. Set TIMEOUT to 0 to turn the cache off.
+STUDENT_PAGE_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': 60,
+}
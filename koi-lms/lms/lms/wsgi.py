@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.settings')
 
 application = get_wsgi_application()
+
+# Load the AI engine before gunicorn forks its workers (see gunicorn.conf.py)
+if os.environ.get('LMS_AI_PRELOAD') == '1':
+    from lms_core.ai_engine import warm_up
+    warm_up(close_connections=True)
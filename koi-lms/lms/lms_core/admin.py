@@ -1,8 +1,12 @@
 from django.contrib import admin
+from django.db.models import Sum, Window
+from django.utils.html import format_html_join
 from .models import (
     Student, Course, Enrollment, Assignment, 
-    Quiz, Grade, Forum, Query, ResponseTemplate, KnowledgeBase
+    Quiz, Grade, Forum, Query, ResponseTemplate, KnowledgeBase, IntentKeyword, EngineGeneration,
+    KeywordLookupDay, KeywordStat, StudentStats
 )
+from .kb_index import KnowledgeBaseIndex
 
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
@@ -10,6 +14,12 @@ class StudentAdmin(admin.ModelAdmin):
     list_filter = ['status', 'program', 'international']
     search_fields = ['student_id', 'user__username', 'user__email']
 
+@admin.register(StudentStats)
+class StudentStatsAdmin(admin.ModelAdmin):
+    list_display = ['student', 'grade_count', 'avg_grade', 'gpa', 'total_courses', 'completed_count']
+    search_fields = ['student__student_id']
+    readonly_fields = [field.name for field in StudentStats._meta.fields]
+
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
     list_display = ['course_code', 'course_name', 'instructor', 'term', 'enrolled_count']
@@ -59,6 +69,69 @@ class ResponseTemplateAdmin(admin.ModelAdmin):
 
 @admin.register(KnowledgeBase)
 class KnowledgeBaseAdmin(admin.ModelAdmin):
-    list_display = ['category', 'title', 'created_at']
+    list_display = ['category', 'title', 'keyword_hits', 'created_at']
     list_filter = ['category']
     search_fields = ['title', 'content']
+    readonly_fields = ['keyword_usage']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(total_keyword_hits=Sum('keyword_stats__hits'))
+    
+    @admin.display(description='Keyword hits', ordering='total_keyword_hits')
+    def keyword_hits(self, obj):
+        return obj.total_keyword_hits or 0
+    
+    @admin.display(description='Keyword usage')
+    def keyword_usage(self, obj):
+        # Curated keywords that never answered a query show up with 0 hits
+        hits = {stat.keyword: stat.hits for stat in obj.keyword_stats.all()} if obj.pk else {}
+        keywords = [KnowledgeBaseIndex.normalize_keyword(keyword) for keyword in obj.keywords or []]
+        rows = [(keyword, hits.pop(keyword, 0)) for keyword in keywords] + list(hits.items())
+        return format_html_join('', '<div>{}: {} hits</div>', rows) or '-'
+
+@admin.register(KeywordStat)
+class KeywordStatAdmin(admin.ModelAdmin):
+    list_display = ['keyword', 'article', 'hits', 'hit_share', 'last_hit_at']
+    list_filter = ['article__category']
+    search_fields = ['keyword', 'article__title']
+    readonly_fields = ['article', 'keyword', 'hits', 'last_hit_at']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('article').annotate(
+            total_hits=Window(expression=Sum('hits'))
+        )
+    
+    @admin.display(description='Share of keyword answers')
+    def hit_share(self, obj):
+        return f"{100 * obj.hits / obj.total_hits:.1f}%" if obj.total_hits else '-'
+    
+    def changelist_view(self, request, extra_context=None):
+        totals = KeywordLookupDay.objects.aggregate(lookups=Sum('lookups'), hits=Sum('hits'))
+        if totals['lookups']:
+            extra_context = {
+                'subtitle': f"Hit rate: {100 * totals['hits'] / totals['lookups']:.1f}% "
+                            f"of {totals['lookups']} keyword lookups",
+                **(extra_context or {}),
+            }
+        return super().changelist_view(request, extra_context)
+
+@admin.register(KeywordLookupDay)
+class KeywordLookupDayAdmin(admin.ModelAdmin):
+    list_display = ['date', 'lookups', 'hits', 'hit_rate_percent']
+    date_hierarchy = 'date'
+    readonly_fields = ['date', 'lookups', 'hits']
+    
+    @admin.display(description='Hit rate')
+    def hit_rate_percent(self, obj):
+        return f"{100 * obj.hit_rate:.1f}%"
+
+@admin.register(IntentKeyword)
+class IntentKeywordAdmin(admin.ModelAdmin):
+    list_display = ['intent', 'keyword']
+    list_filter = ['intent']
+    search_fields = ['keyword']
+
+@admin.register(EngineGeneration)
+class EngineGenerationAdmin(admin.ModelAdmin):
+    list_display = ['name', 'generation', 'updated_at']
+    readonly_fields = ['name', 'generation', 'updated_at']
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class Shed(Exception):
+    """The request was not admitted; ``reason`` says why."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """Bounds the AI work a worker takes on.
+
+    At most ``max_concurrency`` requests run the engine at once and at most
+    ``max_queue`` more wait up to ``queue_timeout`` seconds for a slot;
+    anything beyond that is shed immediately instead of tying up the worker.
+    Each client (student) also has a token bucket refilled at ``rate``
+    requests per second up to ``burst``, so one user cannot take every slot.
+    """
+
+    # 'pool_busy' is recorded by the async views when no engine pool slot freed up
+    REASONS = ('rate_limited', 'queue_full', 'timeout', 'pool_busy')
+
+    def __init__(self, max_concurrency=8, max_queue=16, queue_timeout=0.5,
+                 rate=1.0, burst=10, max_clients=10000):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = dict.fromkeys(self.REASONS, 0)
+        self._buckets = OrderedDict()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'AI_ADMISSION', {})
+        return cls(
+            max_concurrency=options.get('MAX_CONCURRENCY', 8),
+            max_queue=options.get('MAX_QUEUE', 16),
+            queue_timeout=options.get('QUEUE_TIMEOUT', 0.5),
+            rate=options.get('RATE', 1.0),
+            burst=options.get('BURST', 10),
+            max_clients=options.get('MAX_CLIENTS', 10000),
+        )
+
+    def _shed(self, reason):
+        # Called with the condition held
+        self.shed[reason] += 1
+        raise Shed(reason)
+
+    def record_shed(self, reason):
+        """Count a request shed elsewhere (e.g. by the async engine pool)."""
+        with self._cond:
+            self.shed[reason] += 1
+
+    def check_rate(self, client):
+        """Take a token from ``client``'s bucket or raise Shed('rate_limited')."""
+        if client is None or self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._cond:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                self._shed('rate_limited')
+            self._buckets[client] = (tokens - 1, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+    def _acquire(self):
+        with self._cond:
+            if self.in_flight >= self.max_concurrency:
+                if self.waiting >= self.max_queue:
+                    self._shed('queue_full')
+                self.waiting += 1
+                try:
+                    deadline = time.monotonic() + self.queue_timeout
+                    while self.in_flight >= self.max_concurrency:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._shed('timeout')
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+
+    def _release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self, client=None):
+        """Run the block in an engine slot, or raise Shed."""
+        self.check_rate(client)
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'shed': dict(self.shed),
+            }
+
+
+def client_key(user, student=None):
+    """Token bucket key: the student, or the user for staff without a profile."""
+    if student is not None:
+        return ('student', student.pk)
+    return ('user', user.pk)
+
+
+admission = AdmissionController.from_settings()
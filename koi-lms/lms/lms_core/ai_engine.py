@@ -1,12 +1,37 @@
 import re
-import json
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-from .models import ResponseTemplate, KnowledgeBase, Assignment, Quiz, Course, Grade
+import logging
+import threading
+from collections import namedtuple
+from django.conf import settings
+from django.db import DatabaseError
+from . import generations
+from .course_index import course_index
+from .intent_classifier import IntentClassifier
+from .instrumentation import stage
+from .intent_matcher import KeywordMatcher
+from .kb_index import kb_index
+from .keyword_stats import keyword_stats
+from .response_cache import response_cache
+from .schedule_digest import schedule_digests
+from .similar_queries import similar_queries
+from .single_flight import single_flight
+from .models import ResponseTemplate, IntentKeyword, Grade
+
+logger = logging.getLogger(__name__)
+
+# Everything a worker must reload together when the shared generation changes
+EngineSnapshot = namedtuple('EngineSnapshot', ['generation', 'templates', 'intent_keywords', 'intent_matcher'])
 
 class AIQueryEngine:
     
+    # Every intent the dataset is labelled with (see koi_lms_dataset_generator.py)
+    QUERY_INTENTS = [
+        'assignment_deadline', 'grade_inquiry', 'course_content',
+        'enrollment_help', 'technical_issue', 'exam_schedule',
+        'fee_payment', 'resource_access', 'extension_request',
+        'general_inquiry', 'policy_question', 'assessment_criteria'
+    ]
+    
     INTENT_KEYWORDS = {
         'assignment_deadline': ['assignment', 'due', 'deadline', 'submit', 'submission'],
         'grade_inquiry': ['grade', 'mark', 'score', 'result', 'performance'],
@@ -20,43 +45,161 @@ class AIQueryEngine:
         'general_inquiry': ['help', 'question', 'how', 'what', 'when', 'where']
     }
     
+    # Timing span names for the per-intent handlers; other intents use kb_retrieval
+    HANDLER_STAGES = {
+        'assignment_deadline': 'assignment_lookup',
+        'grade_inquiry': 'grade_lookup',
+        'exam_schedule': 'exam_lookup',
+        'course_content': 'static_reply',
+        'technical_issue': 'static_reply',
+    }
+    
+    # Intents whose answers stream_response() yields line by line
+    STREAMED_INTENTS = {'assignment_deadline', 'exam_schedule'} | response_cache.KNOWLEDGE_BASE_INTENTS
+    
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(stop_words='english')
-        self.load_templates()
+        self.kb_index = kb_index
+        self.course_index = course_index
+        self.schedule_digests = schedule_digests
+        self.response_cache = response_cache
+        self.single_flight = single_flight
+        self.keywords_version = 0
+        self.snapshot = EngineSnapshot(None, {}, {}, None)
+        self.set_intent_keywords(self.INTENT_KEYWORDS)
+        self.intent_confidence_threshold = getattr(settings, 'AI_INTENT_MIN_CONFIDENCE', 0.35)
+        self._intent_classifier = None
+        self._intent_classifier_loaded = False
+        self.generation_watcher = generations.GenerationWatcher(
+            generations.AI_ENGINE,
+            interval=getattr(settings, 'AI_ENGINE_RELOAD_INTERVAL', 1.0)
+        )
+        self.reload()
     
-    def load_templates(self):
+    @property
+    def templates(self):
+        return self.snapshot.templates
+    
+    @property
+    def intent_keywords(self):
+        return self.snapshot.intent_keywords
+    
+    @property
+    def intent_matcher(self):
+        return self.snapshot.intent_matcher
+    
+    def set_intent_keywords(self, intent_keywords):
+        """Swap in a new keyword vocabulary and compile its matcher once"""
+        self.snapshot = self.snapshot._replace(
+            intent_keywords=intent_keywords,
+            intent_matcher=KeywordMatcher(intent_keywords)
+        )
+        self.keywords_version += 1
+    
+    def reload(self):
+        """Load a new snapshot of templates, keywords and indexes
+        
+        Keeps the current snapshot and returns False if the database
+        cannot be read.
+        """
         try:
-            self.templates = {
-                rt.intent: rt.template 
-                for rt in ResponseTemplate.objects.all()
-            }
-        except:
-            self.templates = {}
+            generation = generations.current(generations.AI_ENGINE)
+            templates = {rt.intent: rt.template for rt in ResponseTemplate.objects.all()}
+            extra_keywords = list(IntentKeyword.objects.values_list('intent', 'keyword'))
+        except DatabaseError as e:
+            logger.warning("Could not reload the AI engine snapshot: %s", e)
+            return False
+        
+        intent_keywords = {intent: list(keywords) for intent, keywords in self.INTENT_KEYWORDS.items()}
+        for intent, keyword in extra_keywords:
+            intent_keywords.setdefault(intent, []).append(keyword)
+        
+        if intent_keywords == self.intent_keywords:
+            matcher = self.intent_matcher
+        else:
+            matcher = KeywordMatcher(intent_keywords)
+            self.keywords_version += 1
+        self.snapshot = EngineSnapshot(generation, templates, intent_keywords, matcher)
+        
+        # Indexes are rebuilt from disk or the database on next use
+        self.kb_index.invalidate()
+        self._intent_classifier_loaded = False
+        self.response_cache.clear()
+        self.generation_watcher.mark(generation)
+        return True
+    
+    def bumped(self, generation):
+        """Record an ``ai_engine`` bump whose change this process already applied
+        
+        The knowledge base receivers patch the index in place before bumping;
+        reloading for their own bump would throw the patch away. A bump by
+        another worker in between still reloads.
+        """
+        if self.generation_watcher.seen is not None and generation == self.generation_watcher.seen + 1:
+            self.snapshot = self.snapshot._replace(generation=generation)
+            self.generation_watcher.mark(generation)
+    
+    def refresh_if_stale(self):
+        """Reload when another worker bumped the shared generation"""
+        try:
+            generation = self.generation_watcher.poll()
+        except DatabaseError:
+            return
+        if generation is not None:
+            self.reload()
+    
+    def get_intent_classifier(self):
+        """Load the trained classifier on first use; None if it was never trained"""
+        if not self._intent_classifier_loaded:
+            self._intent_classifier = IntentClassifier.load()
+            self._intent_classifier_loaded = True
+        return self._intent_classifier
     
     def detect_intent(self, query_text):
-        query_lower = query_text.lower()
-        intent_scores = {}
+        return self.detect_intents([query_text])[0]
+    
+    def detect_intents(self, query_texts):
+        classifier = self.get_intent_classifier()
+        predictions = classifier.predict_many(query_texts) if classifier else [(None, 0.0)] * len(query_texts)
         
-        for intent, keywords in self.INTENT_KEYWORDS.items():
-            score = sum(1 for keyword in keywords if keyword in query_lower)
-            intent_scores[intent] = score
+        intents = []
+        for query_text, (intent, confidence) in zip(query_texts, predictions):
+            if intent is None or confidence < self.intent_confidence_threshold:
+                # Low-confidence predictions fall back to keyword matching
+                intent = self.detect_intent_by_keywords(query_text)
+            intents.append(intent)
+        return intents
+    
+    def detect_intent_by_keywords(self, query_text):
+        intent_scores = self.intent_matcher.scores(query_text)
         
-        if max(intent_scores.values()) > 0:
+        if intent_scores and max(intent_scores.values()) > 0:
             return max(intent_scores, key=intent_scores.get)
         
         return 'general_inquiry'
     
-    def extract_entities(self, query_text):
+    def extract_entities(self, query_text, student=None):
         entities = {
             'course_code': None,
+            'course_id': None,
             'assignment_id': None,
             'date': None
         }
         
-        # Extract course code (e.g., COMP101, WEB201)
-        course_match = re.search(r'\b[A-Z]{3,4}\d{3}\b', query_text)
-        if course_match:
-            entities['course_code'] = course_match.group(0)
+        # Resolve the course by code ("comp101", "COMP 101") or name
+        # ("Data Structures") to the offering the student is taking
+        try:
+            entities['course_code'] = self.course_index.find_course_code(query_text)
+            course = self.course_index.resolve(entities['course_code'], student)
+            if course:
+                entities['course_id'] = course.pk
+        except DatabaseError as e:
+            logger.warning("Could not load the course index: %s", e)
+        
+        if not entities['course_code']:
+            # Unknown codes are still echoed back in the "not found" replies
+            course_match = re.search(r'\b[A-Z]{2,5}\d{3}\b', query_text)
+            if course_match:
+                entities['course_code'] = course_match.group(0)
         
         # Extract assignment number
         assignment_match = re.search(r'assignment\s*(\d+)', query_text, re.IGNORECASE)
@@ -66,71 +209,277 @@ class AIQueryEngine:
         return entities
     
     def generate_response(self, query_text, student=None, context=None):
-        intent = self.detect_intent(query_text)
-        entities = self.extract_entities(query_text)
-        
-        if intent == 'assignment_deadline':
-            return self.handle_assignment_query(entities, student)
-        elif intent == 'grade_inquiry':
-            return self.handle_grade_query(entities, student)
-        elif intent == 'course_content':
-            return self.handle_course_content(entities, student)
-        elif intent == 'technical_issue':
-            return self.handle_technical_issue()
-        elif intent == 'exam_schedule':
-            return self.handle_exam_schedule(entities, student)
+        return self.generate_responses([query_text], [student])[0]
+    
+    def generate_responses(self, queries, students=None, intents=None):
+        """Answer a list of queries with one database round trip per intent
+        
+        ``students`` is either None or a list parallel to ``queries``, and
+        so is ``intents`` when they were already detected.
+        Responses are returned in the same order as the queries.
+        """
+        if students is None:
+            students = [None] * len(queries)
+        
+        with stage('total') as total:
+            responses = self._generate_responses(queries, students, intents, total)
+        return responses
+    
+    def _generate_responses(self, queries, students, intents, total):
+        with stage('reload_check'):
+            self.refresh_if_stale()
+        
+        cache = self.response_cache
+        token = cache.token()
+        
+        with stage('intent_detection') as span:
+            if intents is None:
+                intents = self.detect_intents(queries)
+            span.intent = total.intent = self._span_intent(intents)
+        
+        with stage('entity_extraction', span.intent):
+            entity_list = [
+                self.extract_entities(query_text, student)
+                for query_text, student in zip(queries, students)
+            ]
+        
+        responses = [None] * len(queries)
+        groups = {}
+        flights = {}
+        waiting = []
+        with stage('cache_lookup', span.intent):
+            for position, (query_text, student, intent, entities) in enumerate(zip(queries, students, intents, entity_list)):
+                key = cache.make_key(query_text, intent, entities, student)
+                
+                cached = cache.get(key)
+                if cached is not None:
+                    responses[position] = cached
+                    continue
+                
+                # Identical questions already being answered by another request
+                # (or earlier in this batch) share that computation
+                flight, leader = self.single_flight.begin(key)
+                item = (position, query_text, entities, student, key)
+                if leader:
+                    flights[key] = flight
+                    groups.setdefault(intent, []).append(item)
+                else:
+                    waiting.append((intent, item, flight))
+        
+        try:
+            self._answer_groups(groups, responses, token)
+        finally:
+            for items in groups.values():
+                for position, _, _, _, key in items:
+                    flight = flights.pop(key, None)
+                    if flight is not None:
+                        self.single_flight.finish(key, flight, responses[position])
+        
+        if waiting:
+            retry = {}
+            with stage('coalesced_wait', span.intent):
+                for intent, item, flight in waiting:
+                    answer = self.single_flight.wait(item[4], flight)
+                    if answer is None:
+                        # The leader failed or timed out; answer it here
+                        retry.setdefault(intent, []).append(item)
+                    else:
+                        position, _, entities, student, key = item
+                        responses[position] = dict(answer)
+                        if flight.remote and answer.get('confidence', 0) > 0.3:
+                            # Computed by another worker; keep it in this one's cache too
+                            cache.set(key, answer, cache.tags_for(intent, entities, student), token=token)
+            self._answer_groups(retry, responses, token)
+        
+        return responses
+    
+    def _answer_groups(self, groups, responses, token):
+        """Run the batch handler of each intent and cache the answers"""
+        cache = self.response_cache
+        for intent, items in groups.items():
+            with stage(self.HANDLER_STAGES.get(intent, 'kb_retrieval'), intent):
+                if intent == 'assignment_deadline':
+                    answers = self.handle_assignment_queries([(e, s) for _, _, e, s, _ in items])
+                elif intent == 'grade_inquiry':
+                    answers = self.handle_grade_queries([(e, s) for _, _, e, s, _ in items])
+                elif intent == 'course_content':
+                    answers = [self.handle_course_content(e, s) for _, _, e, s, _ in items]
+                elif intent == 'technical_issue':
+                    answers = [self.handle_technical_issue() for _ in items]
+                elif intent == 'exam_schedule':
+                    answers = self.handle_exam_schedules([(e, s) for _, _, e, s, _ in items])
+                else:
+                    answers = self.handle_general_queries([q for _, q, _, _, _ in items], intent)
+            
+            for (position, _, entities, student, key), answer in zip(items, answers):
+                responses[position] = answer
+                # Error replies (confidence 0.3) are not worth keeping
+                if answer.get('confidence', 0) > 0.3:
+                    cache.set(key, answer, cache.tags_for(intent, entities, student), token=token)
+    
+    def stream_response(self, query_text, student=None):
+        """Answer one query while it is being built, for streaming replies
+        
+        Yields ``('intent', intent)`` before any lookup runs, then
+        ``('text', part)`` for each part of the reply and finally
+        ``('done', response)`` with what generate_response() would return.
+        Deadline, exam and knowledge base replies come line by line as their
+        builders produce them; other intents in one part.
+        """
+        with stage('reload_check'):
+            self.refresh_if_stale()
+        with stage('intent_detection') as span:
+            intent = span.intent = self.detect_intent(query_text)
+        yield 'intent', intent
+        
+        if intent not in self.STREAMED_INTENTS:
+            response = self.generate_responses([query_text], [student], [intent])[0]
+            yield 'text', response['response']
+            yield 'done', response
+            return
+        
+        cache = self.response_cache
+        token = cache.token()
+        with stage('entity_extraction', intent):
+            entities = self.extract_entities(query_text, student)
+        key = cache.make_key(query_text, intent, entities, student)
+        with stage('cache_lookup', intent):
+            response = cache.get(key)
+        
+        if response is None:
+            with stage(self.HANDLER_STAGES.get(intent, 'kb_retrieval'), intent):
+                if intent == 'assignment_deadline':
+                    lines = self.assignment_lines([(entities, student)])[0]
+                elif intent == 'exam_schedule':
+                    lines = self.exam_lines([(entities, student)])[0]
+                else:
+                    lines = self.general_lines([query_text], intent)[0]
+            response = yield from self._text_events(lines)
+            if response.get('confidence', 0) > 0.3:
+                cache.set(key, response, cache.tags_for(intent, entities, student), token=token)
         else:
-            return self.handle_general_query(query_text, intent)
+            yield 'text', response['response']
+        yield 'done', response
+    
+    @staticmethod
+    def _text_events(lines):
+        """Relay a line builder as ``('text', line)`` events and return its full response"""
+        parts = []
+        while True:
+            try:
+                part = next(lines)
+            except StopIteration as stop:
+                return dict(stop.value, response=''.join(parts))
+            parts.append(part)
+            yield 'text', part
+    
+    @classmethod
+    def _collect(cls, lines):
+        """Run a line builder to the end and return its full response"""
+        events = cls._text_events(lines)
+        while True:
+            try:
+                next(events)
+            except StopIteration as stop:
+                return stop.value
+    
+    @staticmethod
+    def _error_lines(intent, message):
+        yield message
+        return {'intent': intent, 'confidence': 0.3}
+    
+    @staticmethod
+    def _span_intent(intents):
+        """Label batch-wide timing spans with the intent when there is only one"""
+        distinct = set(intents)
+        return distinct.pop() if len(distinct) == 1 else 'mixed'
+    
+    def _resolve_course(self, entities, student):
+        """Return the course offering the entities refer to, without a query once warm"""
+        if entities.get('course_id'):
+            return self.course_index.get(entities['course_id'])
+        return self.course_index.resolve(entities['course_code'], student)
     
     def handle_assignment_query(self, entities, student):
+        return self.handle_assignment_queries([(entities, student)])[0]
+    
+    def handle_assignment_queries(self, items):
+        return [self._collect(lines) for lines in self.assignment_lines(items)]
+    
+    def assignment_lines(self, items):
+        """Look up the schedules of ``items`` and return a line builder per item"""
+        try:
+            courses = [self._resolve_course(entities, student) for entities, student in items]
+            course_ids = {course.pk for course in courses if course}
+            digests = self.schedule_digests.assignments(course_ids) if course_ids else {}
+        except Exception as e:
+            return [
+                self._error_lines('assignment_deadline', f"I encountered an error retrieving assignment information: {str(e)}")
+                for _ in items
+            ]
+        
+        return [
+            self._assignment_lines(entities, course, digests)
+            for (entities, _), course in zip(items, courses)
+        ]
+    
+    def _assignment_lines(self, entities, course, digests):
         if not entities['course_code']:
-            return {
-                'intent': 'assignment_deadline',
-                'response': 'Please specify which course you need assignment information for (e.g., COMP101).',
-                'confidence': 0.5
-            }
+            yield 'Please specify which course you need assignment information for (e.g., COMP101).'
+            return {'intent': 'assignment_deadline', 'confidence': 0.5}
+        
+        if not course:
+            yield f"I couldn't find the course {entities['course_code']}. Please check the course code."
+            return {'intent': 'assignment_deadline', 'confidence': 0.6}
+        
+        digest = digests.get(course.pk)
+        if not digest or not digest.data:
+            yield f"There are no upcoming assignments listed for {course.course_code}."
+            return {'intent': 'assignment_deadline', 'confidence': 0.8}
+        
+        yield f"Here are the upcoming assignments for {course.course_code}:\n\n"
+        yield from digest.lines
         
+        return {
+            'intent': 'assignment_deadline',
+            'confidence': 0.9,
+            'data': list(digest.data)
+        }
+    
+    def handle_grade_query(self, entities, student):
+        return self.handle_grade_queries([(entities, student)])[0]
+    
+    def handle_grade_queries(self, items):
+        students = {student.pk: student for _, student in items if student}
         try:
-            course = Course.objects.filter(
-                course_code=entities['course_code']
-            ).first()
-            
-            if not course:
-                return {
-                    'intent': 'assignment_deadline',
-                    'response': f"I couldn't find the course {entities['course_code']}. Please check the course code.",
-                    'confidence': 0.6
-                }
-            
-            assignments = Assignment.objects.filter(course=course).order_by('due_date')
-            
-            if not assignments.exists():
-                return {
-                    'intent': 'assignment_deadline',
-                    'response': f"There are no assignments listed for {course.course_code} yet.",
-                    'confidence': 0.8
-                }
-            
-            response = f"Here are the assignments for {course.course_code}:\n\n"
-            for i, assignment in enumerate(assignments[:5], 1):
-                response += f"{i}. {assignment.title}\n"
-                response += f"   Due: {assignment.due_date.strftime('%d %B %Y, %I:%M %p')}\n"
-                response += f"   Max Marks: {assignment.max_marks}\n\n"
-            
-            return {
-                'intent': 'assignment_deadline',
-                'response': response,
-                'confidence': 0.9,
-                'data': [{'title': a.title, 'due_date': str(a.due_date)} for a in assignments]
-            }
+            courses = [
+                self._resolve_course(entities, student) if student else None
+                for entities, student in items
+            ]
+            grades_by_student = {}
+            if students:
+                grades = Grade.objects.filter(
+                    student__in=students.values()
+                ).select_related('course')
+                for grade in grades:
+                    grades_by_student.setdefault(grade.student_id, []).append(grade)
         except Exception as e:
-            return {
-                'intent': 'assignment_deadline',
-                'response': f"I encountered an error retrieving assignment information: {str(e)}",
+            error = {
+                'intent': 'grade_inquiry',
+                'response': f"Error retrieving grades: {str(e)}",
                 'confidence': 0.3
             }
+            return [
+                dict(error) if student else self._grade_response(entities, student, None, [])
+                for entities, student in items
+            ]
+        
+        return [
+            self._grade_response(entities, student, course, grades_by_student.get(student.pk, []) if student else [])
+            for (entities, student), course in zip(items, courses)
+        ]
     
-    def handle_grade_query(self, entities, student):
+    def _grade_response(self, entities, student, course, student_grades):
         if not student:
             return {
                 'intent': 'grade_inquiry',
@@ -138,44 +487,36 @@ class AIQueryEngine:
                 'confidence': 0.5
             }
         
-        try:
-            if entities['course_code']:
-                course = Course.objects.filter(course_code=entities['course_code']).first()
-                if course:
-                    grades = Grade.objects.filter(student=student, course=course)
-                    response = f"Your grades for {course.course_code}:\n\n"
-                else:
-                    return {
-                        'intent': 'grade_inquiry',
-                        'response': f"Course {entities['course_code']} not found.",
-                        'confidence': 0.6
-                    }
+        if entities['course_code']:
+            if course:
+                grades = [grade for grade in student_grades if grade.course_id == course.pk]
+                response = f"Your grades for {course.course_code}:\n\n"
             else:
-                grades = Grade.objects.filter(student=student)[:10]
-                response = "Your recent grades:\n\n"
-            
-            if not grades.exists():
                 return {
                     'intent': 'grade_inquiry',
-                    'response': 'No grades available yet.',
-                    'confidence': 0.8
+                    'response': f"Course {entities['course_code']} not found.",
+                    'confidence': 0.6
                 }
-            
-            for grade in grades:
-                response += f"• {grade.course.course_code} - {grade.assessment_type}\n"
-                response += f"  Score: {grade.marks_obtained}/{grade.max_marks} ({grade.percentage}%)\n\n"
-            
-            return {
-                'intent': 'grade_inquiry',
-                'response': response,
-                'confidence': 0.9
-            }
-        except Exception as e:
+        else:
+            grades = student_grades[:10]
+            response = "Your recent grades:\n\n"
+        
+        if not grades:
             return {
                 'intent': 'grade_inquiry',
-                'response': f"Error retrieving grades: {str(e)}",
-                'confidence': 0.3
+                'response': 'No grades available yet.',
+                'confidence': 0.8
             }
+        
+        for grade in grades:
+            response += f"• {grade.course.course_code} - {grade.assessment_type}\n"
+            response += f"  Score: {grade.marks_obtained}/{grade.max_marks} ({grade.percentage}%)\n\n"
+        
+        return {
+            'intent': 'grade_inquiry',
+            'response': response,
+            'confidence': 0.9
+        }
     
     def handle_course_content(self, entities, student):
         response = "Course materials are available in your Moodle dashboard. "
@@ -209,82 +550,125 @@ class AIQueryEngine:
         }
     
     def handle_exam_schedule(self, entities, student):
-        if not entities['course_code']:
-            return {
-                'intent': 'exam_schedule',
-                'response': 'Please specify which course you need exam information for.',
-                'confidence': 0.5
-            }
-        
+        return self.handle_exam_schedules([(entities, student)])[0]
+    
+    def handle_exam_schedules(self, items):
+        return [self._collect(lines) for lines in self.exam_lines(items)]
+    
+    def exam_lines(self, items):
+        """Look up the exam schedules of ``items`` and return a line builder per item"""
         try:
-            course = Course.objects.filter(course_code=entities['course_code']).first()
-            if not course:
-                return {
-                    'intent': 'exam_schedule',
-                    'response': f"Course {entities['course_code']} not found.",
-                    'confidence': 0.6
-                }
-            
-            quizzes = Quiz.objects.filter(course=course).order_by('date')
-            
-            if not quizzes.exists():
-                return {
-                    'intent': 'exam_schedule',
-                    'response': f"No exams/quizzes scheduled for {course.course_code} yet.",
-                    'confidence': 0.8
-                }
-            
-            response = f"Exam schedule for {course.course_code}:\n\n"
-            for quiz in quizzes:
-                response += f"• {quiz.title}\n"
-                response += f"  Date: {quiz.date.strftime('%d %B %Y, %I:%M %p')}\n"
-                response += f"  Duration: {quiz.duration_minutes} minutes\n\n"
-            
-            return {
-                'intent': 'exam_schedule',
-                'response': response,
-                'confidence': 0.9
-            }
+            courses = [self._resolve_course(entities, student) for entities, student in items]
+            course_ids = {course.pk for course in courses if course}
+            digests = self.schedule_digests.exams(course_ids) if course_ids else {}
         except Exception as e:
-            return {
-                'intent': 'exam_schedule',
-                'response': f"Error retrieving exam schedule: {str(e)}",
-                'confidence': 0.3
-            }
+            return [self._error_lines('exam_schedule', f"Error retrieving exam schedule: {str(e)}") for _ in items]
+        
+        return [
+            self._exam_lines(entities, course, digests)
+            for (entities, _), course in zip(items, courses)
+        ]
     
-    def handle_general_query(self, query_text, intent):
-        kb_items = KnowledgeBase.objects.all()
+    def _exam_lines(self, entities, course, digests):
+        if not entities['course_code']:
+            yield 'Please specify which course you need exam information for.'
+            return {'intent': 'exam_schedule', 'confidence': 0.5}
         
-        if kb_items.exists():
-            kb_texts = [f"{item.title} {item.content}" for item in kb_items]
-            kb_texts.append(query_text)
-            
-            try:
-                tfidf_matrix = self.vectorizer.fit_transform(kb_texts)
-                cosine_similarities = cosine_similarity(tfidf_matrix[-1:], tfidf_matrix[:-1]).flatten()
-                best_match_idx = cosine_similarities.argmax()
-                
-                if cosine_similarities[best_match_idx] > 0.3:
-                    best_item = list(kb_items)[best_match_idx]
-                    return {
-                        'intent': intent,
-                        'response': f"{best_item.title}\n\n{best_item.content}",
-                        'confidence': float(cosine_similarities[best_match_idx])
-                    }
-            except:
-                pass
+        if not course:
+            yield f"Course {entities['course_code']} not found."
+            return {'intent': 'exam_schedule', 'confidence': 0.6}
         
-        return {
-            'intent': intent,
-            'response': self.get_default_response(intent),
-            'confidence': 0.5
-        }
+        digest = digests.get(course.pk)
+        if not digest or not digest.lines:
+            yield f"No upcoming exams/quizzes scheduled for {course.course_code}."
+            return {'intent': 'exam_schedule', 'confidence': 0.8}
+        
+        yield f"Exam schedule for {course.course_code}:\n\n"
+        yield from digest.lines
+        
+        return {'intent': 'exam_schedule', 'confidence': 0.9}
+    
+    def handle_general_query(self, query_text, intent):
+        return self.handle_general_queries([query_text], intent)[0]
+    
+    def handle_general_queries(self, query_texts, intent):
+        return [self._collect(lines) for lines in self.general_lines(query_texts, intent)]
+    
+    def general_lines(self, query_texts, intent):
+        """Search the knowledge base for ``query_texts`` and return a line builder per query"""
+        try:
+            matches = self.kb_index.search_many(query_texts)
+        except Exception:
+            matches = [None] * len(query_texts)
+        keyword_stats.maybe_flush()
+        return [self._general_lines(match, intent) for match in matches]
+    
+    def _general_lines(self, match, intent):
+        if match and match[3] > 0.3:
+            _, title, passage, score = match
+            yield f"{title}\n\n"
+            yield passage
+            return {'intent': intent, 'confidence': score}
+        
+        yield self.get_default_response(intent)
+        return {'intent': intent, 'confidence': 0.5}
     
     def get_default_response(self, intent):
         default_responses = {
             'general_inquiry': "I'm here to help! You can ask me about:\n• Assignment deadlines\n• Your grades\n• Course materials\n• Exam schedules\n• Technical issues\n\nWhat would you like to know?",
             'enrollment_help': "For enrollment assistance, please visit the Student Portal or contact the Registrar's Office at registrar@koi.edu.au",
             'fee_payment': "For fee payment information, please contact the Finance Office:\nEmail: finance@koi.edu.au\nPhone: +61 3 9602 4110",
+            'policy_question': "KOI policies (academic integrity, late submission, special consideration) are published in the Student Handbook. For clarification, please contact student support at support@koi.edu.au",
+            'assessment_criteria': "Marking criteria and rubrics are published with each assessment on your course page. Please ask your course instructor if anything is unclear.",
         }
         
         return default_responses.get(intent, "I'm not sure how to help with that. Please contact student support at support@koi.edu.au")
+    
+    def degraded_response(self, query_text):
+        """Cheap reply for shed requests: keyword intent and its default answer, no database work"""
+        intent = self.detect_intent_by_keywords(query_text)
+        return {
+            'intent': intent,
+            'response': self.get_default_response(intent),
+            'confidence': 0.0,
+            'degraded': True
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide engine, building it on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AIQueryEngine()
+    return _engine
+
+
+def engine_bumped(generation):
+    """Tell the engine of this process, if it was built, about its own ``ai_engine`` bump"""
+    if _engine is not None:
+        _engine.bumped(generation)
+
+
+def warm_up(close_connections=False):
+    """Build the engine and load its indexes ahead of the first query
+    
+    Call with ``close_connections=True`` before forking workers (gunicorn
+    ``preload_app``) so that children don't inherit open database
+    connections but do share the loaded models copy-on-write.
+    """
+    engine = get_engine()
+    engine.kb_index.ensure()
+    engine.course_index.ensure()
+    engine.get_intent_classifier()
+    similar_queries.ensure()
+    
+    if close_connections:
+        from django.db import connections
+        connections.close_all()
+    return engine
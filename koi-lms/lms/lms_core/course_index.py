@@ -0,0 +1,147 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import generations
+from .intent_matcher import KeywordMatcher
+from .models import Course, Enrollment
+
+
+class CourseIndex:
+    """In-memory lookup from course codes and names to course offerings.
+
+    Resolves "COMP101", "comp 101" or "Data Structures" to a canonical code
+    and picks the offering that matters to the asking student without a
+    database query once warm. The course map is rebuilt when the shared
+    ``courses`` generation moves; each student's enrollments are cached for
+    ``enrollment_ttl`` seconds and dropped by Enrollment signals.
+    """
+
+    CODE_PATTERN = re.compile(r'\b([A-Za-z]{2,5})\s?(\d{3})\b')
+
+    # Short names ("Data Structures") never end on one of these words
+    NAME_STOPWORDS = {'and', 'of', 'to', 'for', 'in', 'the', 'with'}
+
+    # Preference order for picking the offering a student is asking about
+    ENROLLMENT_PREFERENCE = ('Enrolled', 'Completed', 'Failed', 'Withdrawn')
+
+    def __init__(self, enrollment_ttl=300, max_students=10000, check_interval=1.0):
+        self.enrollment_ttl = enrollment_ttl
+        self.max_students = max_students
+        self._state = None
+        self._enrollments = OrderedDict()
+        self._lock = threading.Lock()
+        self.watcher = generations.GenerationWatcher(generations.COURSES, interval=check_interval)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(check_interval=getattr(settings, 'AI_ENGINE_RELOAD_INTERVAL', 1.0))
+
+    def ensure(self):
+        generation = self.watcher.poll()
+        state = self._state
+        if state is not None and generation is None:
+            return state
+
+        with self._lock:
+            if self._state is None or generation is not None:
+                self._state = self._build()
+                self.watcher.mark(generation if generation is not None else generations.current(generations.COURSES))
+            return self._state
+
+    def _build(self):
+        offerings = {}
+        courses = {}
+        names = {}
+        for course in Course.objects.all():
+            offerings.setdefault(course.course_code.lower(), []).append(course)
+            courses[course.pk] = course
+            names.setdefault(course.course_code, set()).add(course.course_name)
+        return {
+            'offerings': offerings,
+            'courses': courses,
+            'name_matcher': KeywordMatcher(self._name_aliases(names)),
+        }
+
+    @classmethod
+    def _name_aliases(cls, names):
+        """Full course names plus unambiguous leading words of at least two words."""
+        aliases = {code: set(course_names) for code, course_names in names.items()}
+        owners = {}
+        for code, course_names in names.items():
+            for name in course_names:
+                words = name.lower().split()
+                for length in range(2, len(words)):
+                    if words[length - 1] not in cls.NAME_STOPWORDS:
+                        owners.setdefault(' '.join(words[:length]), set()).add(code)
+        for prefix, codes in owners.items():
+            if len(codes) == 1:
+                aliases[next(iter(codes))].add(prefix)
+        return aliases
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def invalidate_student(self, student_pk):
+        with self._lock:
+            self._enrollments.pop(student_pk, None)
+
+    def find_course_code(self, text):
+        """Return the canonical code of the course mentioned in ``text``, if any."""
+        state = self.ensure()
+        for letters, digits in self.CODE_PATTERN.findall(text):
+            offerings = state['offerings'].get(f"{letters}{digits}".lower())
+            if offerings:
+                return offerings[0].course_code
+
+        names = state['name_matcher'].find(text)
+        if names:
+            longest = max(names, key=len)
+            return state['name_matcher'].keyword_labels[longest][0]
+        return None
+
+    def get(self, course_pk):
+        return self.ensure()['courses'].get(course_pk)
+
+    def resolve(self, course_code, student=None):
+        """Pick the offering of ``course_code`` that is relevant to ``student``.
+
+        Prefers the term the student is currently enrolled in, then any
+        other term they took, then the first offering.
+        """
+        if not course_code:
+            return None
+        offerings = self.ensure()['offerings'].get(course_code.lower())
+        if not offerings:
+            return None
+
+        if student is not None:
+            enrollments = self.student_enrollments(student)
+            for status in self.ENROLLMENT_PREFERENCE:
+                taken = [course for course in offerings if enrollments.get(course.pk) == status]
+                if taken:
+                    return max(taken, key=lambda course: course.start_date)
+        return offerings[0]
+
+    def student_enrollments(self, student):
+        """Return ``{course pk: enrollment status}`` for ``student``."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._enrollments.get(student.pk)
+            if entry is not None and entry[0] > now:
+                self._enrollments.move_to_end(student.pk)
+                return entry[1]
+
+        enrollments = dict(Enrollment.objects.filter(student=student).values_list('course_id', 'status'))
+        with self._lock:
+            self._enrollments[student.pk] = (now + self.enrollment_ttl, enrollments)
+            while len(self._enrollments) > self.max_students:
+                self._enrollments.popitem(last=False)
+        return enrollments
+
+
+course_index = CourseIndex.from_settings()
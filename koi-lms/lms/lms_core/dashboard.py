@@ -0,0 +1,83 @@
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Assignment, Enrollment, Grade
+from .student_stats import ENROLLMENT_STATUSES, stats_for
+
+# Upcoming assignments listed per active course, and overall
+UPCOMING_PER_COURSE = 3
+UPCOMING_LIMIT = 5
+
+RECENT_GRADES_LIMIT = 5
+
+
+def upcoming_assignments(course_ids, now=None, per_course=UPCOMING_PER_COURSE, limit=UPCOMING_LIMIT):
+    """The next ``per_course`` assignments of each course, soonest ``limit`` overall.
+
+    One query: the per-course cut is a ROW_NUMBER() window over the courses.
+    """
+    now = now or timezone.now()
+    assignments = list(
+        Assignment.objects.filter(course_id__in=course_ids, due_date__gte=now)
+        .select_related('course')
+        .annotate(course_rank=Window(RowNumber(), partition_by=F('course_id'), order_by=F('due_date').asc()))
+        .filter(course_rank__lte=per_course)
+        .order_by('due_date')[:limit]
+    )
+    for assignment in assignments:
+        assignment.days_until_due = (assignment.due_date - now).days
+    return assignments
+
+
+def latest_grades(student):
+    """``{course pk: Grade}`` holding the most recently graded grade of each course."""
+    grades = (
+        Grade.objects.filter(student=student)
+        .annotate(course_rank=Window(
+            RowNumber(), partition_by=F('course_id'), order_by=[F('graded_date').desc(), F('pk').desc()]
+        ))
+        .filter(course_rank=1)
+    )
+    return {grade.course_id: grade for grade in grades}
+
+
+def dashboard_data(student):
+    """Everything the student dashboard shows, in a fixed number of queries.
+
+    Enrollment lists, upcoming assignments and recent grades take four
+    queries however many courses the student takes; status counts, the
+    average grade and the GPA come from the student's StudentStats row.
+    """
+    enrollments = list(
+        Enrollment.objects.filter(student=student).select_related('course').order_by('-enrollment_date')
+    )
+    stats = stats_for(student)
+    latest = latest_grades(student)
+
+    by_status = {status: [] for status in ENROLLMENT_STATUSES}
+    for enrollment in enrollments:
+        enrollment.latest_grade = latest.get(enrollment.course_id)
+        by_status.setdefault(enrollment.status, []).append(enrollment)
+
+    return {
+        'student': student,
+        'enrollments': enrollments,
+        'enrolled_courses': by_status['Enrolled'],
+        'completed_courses': by_status['Completed'],
+        'failed_courses': by_status['Failed'],
+        'withdrawn_courses': by_status['Withdrawn'],
+        'active_courses': by_status['Enrolled'],
+        'upcoming_assignments': upcoming_assignments([enrollment.course_id for enrollment in by_status['Enrolled']]),
+        'recent_grades': list(
+            Grade.objects.filter(student=student).select_related('course').order_by('-graded_date')[:RECENT_GRADES_LIMIT]
+        ),
+        'stats': stats,
+        'avg_grade': round(stats.avg_grade, 2),
+        'gpa': round(stats.gpa, 2),
+        'total_courses': stats.total_courses,
+        'enrolled_count': stats.enrolled_count,
+        'completed_count': stats.completed_count,
+        'failed_count': stats.failed_count,
+        'withdrawn_count': stats.withdrawn_count,
+    }
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class EngineBusy(Exception):
+    """No engine slot became free within the queue timeout."""
+
+
+class EngineTimeout(Exception):
+    """The engine did not answer within the per-request timeout."""
+
+
+class EnginePool:
+    """Runs blocking AI engine calls for async views in a bounded thread pool.
+
+    ``max_concurrency`` caps how many engine jobs may be queued or running at
+    once per event loop; requests wait at most ``queue_timeout`` seconds for a
+    slot and ``timeout`` seconds for the answer. A slot is only given back
+    when the worker thread has really finished, so a timed-out request cannot
+    pile more work onto a saturated pool.
+    """
+
+    def __init__(self, max_workers=4, max_concurrency=16, queue_timeout=2.0, timeout=10.0):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'AI_ENGINE_POOL', {})
+        return cls(
+            max_workers=options.get('MAX_WORKERS', 4),
+            max_concurrency=options.get('MAX_CONCURRENCY', 16),
+            queue_timeout=options.get('QUEUE_TIMEOUT', 2.0),
+            timeout=options.get('TIMEOUT', 10.0),
+        )
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='ai-engine'
+                    )
+        return self._executor
+
+    def _semaphore(self, loop):
+        # asyncio primitives are bound to the loop they are used on
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    @staticmethod
+    def _call(func, args, kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Worker threads live outside the request cycle that normally
+            # closes database connections
+            close_old_connections()
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(loop)
+
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise EngineBusy()
+
+        def finished(future):
+            semaphore.release()
+            if not future.cancelled():
+                # Mark the exception as retrieved when nobody awaits it any more
+                future.exception()
+
+        future = loop.run_in_executor(self.executor, self._call, func, args, kwargs)
+        future.add_done_callback(finished)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise EngineTimeout()
+
+
+engine_pool = EnginePool.from_settings()
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import EngineGeneration
+
+# Templates, intent keywords, the knowledge base index and the classifier
+AI_ENGINE = 'ai_engine'
+
+# The in-memory course code and name index
+COURSES = 'courses'
+
+# Per-course assignment and exam schedule digests
+SCHEDULES = 'schedules'
+
+# Cached AI engine answers built from courses, assignments, quizzes and grades
+RESPONSES = 'responses'
+
+# Bumps made by this process, so its own watchers don't wait for the interval
+_local_bumps = {}
+_local_lock = threading.Lock()
+
+
+def current(name):
+    """Return the shared generation counter for ``name`` (0 if never bumped)."""
+    return EngineGeneration.objects.filter(name=name).values_list('generation', flat=True).first() or 0
+
+
+def bump(name):
+    """Atomically increment the shared counter so every worker reloads.
+
+    Returns the new value of the counter.
+    """
+    with transaction.atomic():
+        updated = EngineGeneration.objects.filter(name=name).update(generation=F('generation') + 1)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    EngineGeneration.objects.create(name=name, generation=1)
+            except IntegrityError:
+                # Another worker created the row first
+                EngineGeneration.objects.filter(name=name).update(generation=F('generation') + 1)
+        # Read inside the transaction, while the row is still locked by the update
+        generation = current(name)
+
+    with _local_lock:
+        _local_bumps[name] = _local_bumps.get(name, 0) + 1
+    return generation
+
+
+class GenerationWatcher:
+    """Cheap per-request check of a shared generation counter.
+
+    The counter is read from the database at most once every ``interval``
+    seconds, or immediately after this process bumped it itself.
+    """
+
+    def __init__(self, name, interval=1.0):
+        self.name = name
+        self.interval = interval
+        self.seen = None
+        self._checked_at = 0.0
+        self._local_seen = 0
+
+    def mark(self, generation):
+        self.seen = generation
+        self._checked_at = time.monotonic()
+        self._local_seen = _local_bumps.get(self.name, 0)
+
+    def poll(self):
+        """Return the new generation if it changed since mark(), else None."""
+        local = _local_bumps.get(self.name, 0)
+        now = time.monotonic()
+        if local == self._local_seen and now - self._checked_at < self.interval:
+            return None
+
+        generation = current(self.name)
+        self._checked_at = now
+        self._local_seen = local
+        if generation == self.seen:
+            return None
+        return generation
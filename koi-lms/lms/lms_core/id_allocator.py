@@ -0,0 +1,102 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Length
+
+from .models import Enrollment, Grade, IdSequence, Query
+
+
+class IdAllocator:
+    """Hands out formatted ids such as ``Q000123`` without touching the target table.
+
+    Each process reserves ``block_size`` numbers at a time with one atomic
+    ``UPDATE ... SET next_value = next_value + n`` on its ``IdSequence`` row,
+    which is race-free across workers on SQLite and PostgreSQL alike, and
+    then serves ids from memory. Ids are unique and increasing per worker
+    but not gapless.
+
+    Inside a caller's transaction (the admin saves in one) only the id asked
+    for is reserved, in that transaction: a rollback undoes the reservation
+    and the row using it together, where a block kept in memory would be
+    handed out again by the sequence.
+    """
+
+    def __init__(self, name, model, field, prefix, width, block_size=None):
+        self.name = name
+        self.model = model
+        self.field = field
+        self.prefix = prefix
+        self.width = width
+        self.block_size = block_size or getattr(settings, 'ID_ALLOCATOR_BLOCK_SIZE', 50)
+        self._next = 0
+        self._end = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def format(self, number):
+        return f"{self.prefix}{number:0{self.width}d}"
+
+    def next_id(self):
+        if transaction.get_connection().in_atomic_block:
+            first, _ = self._reserve(1)
+            return self.format(first)
+        with self._lock:
+            if self._pid != os.getpid():
+                # A block reserved before fork() would be shared by every child
+                self._next = self._end = 0
+                self._pid = os.getpid()
+            if self._next >= self._end:
+                self._next, self._end = self._reserve(self.block_size)
+            number = self._next
+            self._next += 1
+        return self.format(number)
+
+    def _reserve(self, count):
+        """Reserve ``count`` numbers and return the ``(first, end)`` range."""
+        with transaction.atomic():
+            updated = IdSequence.objects.filter(name=self.name).update(next_value=F('next_value') + count)
+            if not updated:
+                start = self.highest_existing() + 1
+                try:
+                    with transaction.atomic():
+                        IdSequence.objects.create(name=self.name, next_value=start + count)
+                    return start, start + count
+                except IntegrityError:
+                    # Another worker seeded the sequence first
+                    IdSequence.objects.filter(name=self.name).update(next_value=F('next_value') + count)
+            end = IdSequence.objects.filter(name=self.name).values_list('next_value', flat=True).get()
+        return end - count, end
+
+    def highest_existing(self):
+        """Largest number already used by an id of this format (0 if none)."""
+        last = (
+            self.model.objects
+            .filter(**{f'{self.field}__regex': rf'^{self.prefix}[0-9]{{{self.width},}}$'})
+            .annotate(id_length=Length(self.field))
+            .order_by('-id_length', f'-{self.field}')
+            .values_list(self.field, flat=True)
+            .first()
+        )
+        return int(last[len(self.prefix):]) if last else 0
+
+    def sync(self):
+        """Move the sequence past ids inserted without the allocator (e.g. imports)."""
+        start = self.highest_existing() + 1
+        with transaction.atomic():
+            updated = IdSequence.objects.filter(name=self.name, next_value__lt=start).update(next_value=start)
+            if not updated and not IdSequence.objects.filter(name=self.name).exists():
+                try:
+                    with transaction.atomic():
+                        IdSequence.objects.create(name=self.name, next_value=start)
+                except IntegrityError:
+                    pass
+        with self._lock:
+            self._next = self._end = 0
+
+
+query_ids = IdAllocator('query', Query, 'query_id', 'Q', 6)
+grade_ids = IdAllocator('grade', Grade, 'grade_id', 'GRD', 8)
+enrollment_ids = IdAllocator('enrollment', Enrollment, 'enrollment_id', 'ENR', 6)
@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.db import connection
+
+logger = logging.getLogger('lms_core.timing')
+
+
+class LatencyRecorder:
+    """In-process latency histograms keyed by ``(intent, stage)``.
+
+    Each key keeps a bounded window of the most recent samples, which is
+    enough for p50/p95/p99 without unbounded memory growth.
+    """
+
+    def __init__(self, max_samples=2048):
+        self.max_samples = max_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, intent, stage, duration_ms, queries=0):
+        with self._lock:
+            samples = self._samples.get((intent, stage))
+            if samples is None:
+                samples = self._samples[(intent, stage)] = deque(maxlen=self.max_samples)
+            samples.append((duration_ms, queries))
+
+    def summary(self):
+        """Return ``{intent: {stage: {count, p50_ms, p95_ms, p99_ms, avg_queries}}}``."""
+        import numpy as np
+
+        with self._lock:
+            snapshot = {key: list(samples) for key, samples in self._samples.items()}
+
+        report = {}
+        for (intent, stage), samples in sorted(snapshot.items()):
+            durations = np.array([duration for duration, _ in samples])
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+            report.setdefault(intent, {})[stage] = {
+                'count': len(samples),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+                'avg_queries': round(sum(queries for _, queries in samples) / len(samples), 2),
+            }
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class Span:
+    """A timed stage; ``intent`` may be filled in once it is known."""
+
+    def __init__(self, stage, intent):
+        self.stage = stage
+        self.intent = intent
+        self.queries = 0
+        self.duration_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper counting the queries issued inside the span
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+latency_recorder = LatencyRecorder()
+
+
+@contextmanager
+def stage(name, intent='all', recorder=None):
+    """Time a block, count its database queries, log it and record it."""
+    span = Span(name, intent)
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(span):
+            yield span
+    finally:
+        span.duration_ms = (time.perf_counter() - start) * 1000
+        (recorder or latency_recorder).record(span.intent, span.stage, span.duration_ms, span.queries)
+        logger.info(
+            "stage=%s intent=%s duration_ms=%.3f queries=%d",
+            span.stage, span.intent, span.duration_ms, span.queries,
+            extra={'ai_stage': span.stage, 'ai_intent': span.intent,
+                   'duration_ms': span.duration_ms, 'queries': span.queries},
+        )
@@ -0,0 +1,102 @@
+import logging
+import os
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IntentClassifier:
+    """Linear intent classifier over TF-IDF features.
+
+    Only the fitted vectorizer and the weight matrix are kept, so a
+    prediction is one sparse dot product followed by a softmax and its cost
+    stays flat as intents are added.
+    """
+
+    FILENAME = 'intent_classifier.joblib'
+
+    def __init__(self, vectorizer, intents, weights, bias):
+        self.vectorizer = vectorizer
+        self.intents = [str(intent) for intent in intents]
+        self.weights = weights
+        self.bias = bias
+
+    @classmethod
+    def default_path(cls):
+        index_dir = getattr(settings, 'AI_INDEX_DIR', settings.BASE_DIR / 'ai_index')
+        return Path(index_dir) / cls.FILENAME
+
+    @classmethod
+    def train(cls, texts, labels):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        import numpy as np
+
+        vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True)
+        features = vectorizer.fit_transform(texts)
+        model = LogisticRegression(max_iter=1000, C=10.0)
+        model.fit(features, labels)
+
+        return cls(
+            vectorizer,
+            model.classes_,
+            np.ascontiguousarray(model.coef_.T),
+            model.intercept_.copy(),
+        )
+
+    def predict_many(self, texts):
+        """Return ``[(intent, probability), ...]`` for each text."""
+        import numpy as np
+
+        if not texts:
+            return []
+
+        scores = self.vectorizer.transform(texts) @ self.weights + self.bias
+        if len(self.intents) == 2:
+            # Binary logistic regression stores a single column for the positive class
+            scores = np.hstack([np.zeros_like(scores), scores])
+
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        best = probabilities.argmax(axis=1)
+        return [
+            (self.intents[idx], float(probabilities[row, idx]))
+            for row, idx in enumerate(best)
+        ]
+
+    def predict(self, text):
+        return self.predict_many([text])[0]
+
+    def save(self, path=None):
+        import joblib
+
+        path = Path(path or self.default_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        joblib.dump({
+            'vectorizer': self.vectorizer,
+            'intents': self.intents,
+            'weights': self.weights,
+            'bias': self.bias,
+        }, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """Load a saved classifier, or return None if there is none."""
+        import joblib
+
+        path = Path(path or cls.default_path())
+        try:
+            data = joblib.load(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable intent classifier %s: %s", path, e)
+            return None
+        return cls(data['vectorizer'], data['intents'], data['weights'], data['bias'])
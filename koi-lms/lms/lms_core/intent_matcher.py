@@ -0,0 +1,81 @@
+import re
+
+
+class KeywordMatcher:
+    """Finds every keyword of a ``{label: [keywords]}`` mapping in one pass.
+
+    All keywords are merged into a character trie and compiled into a single
+    regular expression, so matching costs one scan over the text whatever
+    the size of the vocabulary. Keywords only match whole words, optionally
+    followed by a common inflection ("grades", "enrolled", "payments"), so
+    "test" no longer matches inside "latest".
+    """
+
+    SUFFIXES = ('s', 'es', 'd', 'ed', 'ing', 'ment', 'ments')
+
+    def __init__(self, keyword_map):
+        self.labels = list(keyword_map)
+        self.keyword_labels = {}
+
+        for label, keywords in keyword_map.items():
+            for keyword in keywords:
+                normalized = self.normalize(keyword)
+                if not normalized:
+                    continue
+                labels = self.keyword_labels.setdefault(normalized, [])
+                if label not in labels:
+                    labels.append(label)
+
+        if self.keyword_labels:
+            suffixes = '|'.join(self.SUFFIXES)
+            self.regex = re.compile(
+                r'\b(' + self._trie_pattern(self.keyword_labels) + r')(?:' + suffixes + r')?\b',
+                re.IGNORECASE
+            )
+        else:
+            self.regex = None
+
+    @staticmethod
+    def normalize(text):
+        return ' '.join(text.lower().split())
+
+    @classmethod
+    def _trie_pattern(cls, keywords):
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = True
+        return cls._node_pattern(trie)
+
+    @classmethod
+    def _node_pattern(cls, node):
+        is_end = '' in node
+        alternatives = [
+            (r'\s+' if char == ' ' else re.escape(char)) + cls._node_pattern(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not alternatives:
+            return ''
+
+        if len(alternatives) == 1 and not is_end:
+            return alternatives[0]
+
+        pattern = '(?:' + '|'.join(alternatives) + ')'
+        return pattern + '?' if is_end else pattern
+
+    def find(self, text):
+        """Return the set of distinct keywords present in ``text``."""
+        if self.regex is None:
+            return set()
+        return {self.normalize(match.group(1)) for match in self.regex.finditer(text)}
+
+    def scores(self, text):
+        """Return ``{label: number of distinct keywords matched}``."""
+        scores = dict.fromkeys(self.labels, 0)
+        for keyword in self.find(text):
+            for label in self.keyword_labels[keyword]:
+                scores[label] += 1
+        return scores
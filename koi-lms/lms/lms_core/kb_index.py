@@ -0,0 +1,570 @@
+import atexit
+import logging
+import math
+import os
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .keyword_stats import keyword_stats
+from .models import KnowledgeBase
+
+# numpy, scipy, scikit-learn and joblib are imported inside the methods that
+# need them so that importing this module (and the app registry) stays cheap
+
+logger = logging.getLogger(__name__)
+
+_stop_words = None
+
+
+def _get_stop_words():
+    global _stop_words
+    if _stop_words is None:
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        _stop_words = ENGLISH_STOP_WORDS
+    return _stop_words
+
+
+class KnowledgeBaseIndex:
+    """BM25 inverted index over passages of the KnowledgeBase.
+
+    Long articles are split into passages of at most ``PASSAGE_WORDS``
+    words on paragraph and sentence boundaries, and each passage is indexed
+    together with its article title. BM25 weights are precomputed into a
+    term x passage matrix, so a query only reads the posting rows of its
+    own terms and never scores passages that share no term with it.
+
+    Curated ``KnowledgeBase.keywords`` go into a phrase -> article hash map.
+    A query containing one of them is answered from that article by
+    looking up its word n-grams, before any BM25 scoring runs.
+
+    The index is persisted with joblib so that restarted workers load it
+    from disk. A saved or deleted article only touches its own passages:
+    they are tombstoned in the main matrix or added to a small delta
+    segment, and the document frequencies of their terms are adjusted.
+    IDF is applied per query term from those frequencies, while the average
+    passage length stays that of the last full weighing. A background timer
+    persists the index ``SAVE_DELAY`` seconds after a change, refitting it
+    first once ``COMPACT_SIZE`` passages were added or removed since.
+    """
+
+    FILENAME = 'kb_bm25.joblib'
+
+    # Bumped when the persisted state layout changes
+    FORMAT = 3
+
+    # Seconds between a change and persisting it, so bursts are saved once
+    SAVE_DELAY = 2.0
+
+    # Added plus removed passages that trigger a refit when saving
+    COMPACT_SIZE = 1000
+
+    PASSAGE_WORDS = 120
+
+    # BM25 term-frequency saturation and length normalisation
+    K1 = 1.2
+    B = 0.75
+
+    TOKEN_PATTERN = re.compile(r'\b\w\w+\b')
+    WORD_PATTERN = re.compile(r'\w+')
+
+    # Confidence reported for answers found through a curated keyword
+    KEYWORD_SCORE = 0.95
+    SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._lock = threading.RLock()
+        self._state = None
+        self._save_timer = None
+        self._save_pid = None
+
+    @classmethod
+    def tokenize(cls, text):
+        stop_words = _get_stop_words()
+        return [
+            token for token in cls.TOKEN_PATTERN.findall(text.lower())
+            if token not in stop_words
+        ]
+
+    @classmethod
+    def split_passages(cls, content):
+        """Split article content into passages of at most ``PASSAGE_WORDS`` words."""
+        passages = []
+        for paragraph in re.split(r'\n\s*\n', content):
+            paragraph = ' '.join(paragraph.split())
+            if not paragraph:
+                continue
+            if len(paragraph.split()) <= cls.PASSAGE_WORDS:
+                passages.append(paragraph)
+                continue
+
+            chunk, words = [], 0
+            for sentence in cls.SENTENCE_PATTERN.split(paragraph):
+                sentence_words = sentence.split()
+                if chunk and words + len(sentence_words) > cls.PASSAGE_WORDS:
+                    passages.append(' '.join(chunk))
+                    chunk, words = [], 0
+                while len(sentence_words) > cls.PASSAGE_WORDS:
+                    # A run-on "sentence" longer than a passage
+                    passages.append(' '.join(sentence_words[:cls.PASSAGE_WORDS]))
+                    sentence_words = sentence_words[cls.PASSAGE_WORDS:]
+                chunk.extend(sentence_words)
+                words += len(sentence_words)
+            if chunk:
+                passages.append(' '.join(chunk))
+        return passages or [content.strip()]
+
+    @classmethod
+    def normalize_keyword(cls, keyword):
+        return ' '.join(cls.WORD_PATTERN.findall(str(keyword).lower()))
+
+    @classmethod
+    def _keyword_map(cls, article_keywords):
+        """``{phrase: [article pk, ...]}`` from ``{article pk: [phrase, ...]}``."""
+        keywords = {}
+        for pk, phrases in article_keywords.items():
+            for phrase in phrases:
+                keywords.setdefault(phrase, []).append(pk)
+        return keywords
+
+    def _article_keywords(self, keywords):
+        if not isinstance(keywords, list):
+            return []
+        phrases = []
+        for keyword in keywords:
+            phrase = self.normalize_keyword(keyword)
+            if phrase and phrase not in phrases:
+                phrases.append(phrase)
+        return phrases
+
+    def _default_path(self):
+        index_dir = getattr(settings, 'AI_INDEX_DIR', settings.BASE_DIR / 'ai_index')
+        return Path(index_dir) / self.FILENAME
+
+    def get_path(self):
+        return self.path or self._default_path()
+
+    def _signature(self):
+        stats = KnowledgeBase.objects.aggregate(count=Count('pk'), latest=Max('updated_at'))
+        return (stats['count'], stats['latest'].isoformat() if stats['latest'] else None)
+
+    def _tokenize_article(self, vocabulary, title, content):
+        """Passages and their ``{term id: count}`` rows, growing ``vocabulary``."""
+        passages = self.split_passages(content)
+        rows = []
+        for passage in passages:
+            counts = {}
+            for token in self.tokenize(f"{title} {passage}"):
+                term = vocabulary.setdefault(token, len(vocabulary))
+                counts[term] = counts.get(term, 0) + 1
+            rows.append(counts)
+        return passages, rows
+
+    @staticmethod
+    def _tf_matrix(rows, n_terms):
+        import numpy as np
+        from scipy import sparse
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in rows])
+        indices = np.fromiter((term for row in rows for term in row), dtype=np.int32, count=indptr[-1])
+        data = np.fromiter((count for row in rows for count in row.values()), dtype=np.float32, count=indptr[-1])
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), n_terms))
+
+    def _fit(self, docs):
+        """Build a fresh state dict from ``[(pk, title, content, keywords), ...]``."""
+        vocabulary = {}
+        passages, passage_ids, rows = [], [], []
+        titles = {}
+        article_keywords = {}
+        for pk, title, content, keywords in docs:
+            titles[pk] = title
+            article_keywords[pk] = self._article_keywords(keywords)
+            article_passages, article_rows = self._tokenize_article(vocabulary, title, content)
+            passages.extend(article_passages)
+            passage_ids.extend([pk] * len(article_passages))
+            rows.extend(article_rows)
+        return self._assemble(vocabulary, rows, passages, passage_ids, titles, article_keywords)
+
+    def _assemble(self, vocabulary, rows, passages, passage_ids, titles, article_keywords):
+        state = {
+            'vocabulary': vocabulary,
+            'tf': self._tf_matrix(rows, len(vocabulary)),
+            'passages': passages,
+            'passage_ids': passage_ids,
+            'titles': titles,
+            'article_keywords': article_keywords,
+            'signature': None,
+            'format': self.FORMAT,
+        }
+        self._weigh(state)
+        return state
+
+    def _compact(self, state):
+        """Refit the live passages of ``state`` into a new main matrix."""
+        vocabulary = {}
+        passages, passage_ids, rows = [], [], []
+        for idx, (pk, passage) in enumerate(zip(state['passage_ids'], state['passages'])):
+            if idx in state['deleted']:
+                continue
+            counts = {}
+            for token in self.tokenize(f"{state['titles'][pk]} {passage}"):
+                term = vocabulary.setdefault(token, len(vocabulary))
+                counts[term] = counts.get(term, 0) + 1
+            passages.append(passage)
+            passage_ids.append(pk)
+            rows.append(counts)
+        compacted = self._assemble(
+            vocabulary, rows, passages, passage_ids, dict(state['titles']), dict(state['article_keywords'])
+        )
+        compacted['signature'] = state['signature']
+        return compacted
+
+    def _saturate(self, count, length, average_length):
+        """BM25 term-frequency part of an impact; IDF is applied at query time."""
+        norm = self.K1 * (1 - self.B + self.B * length / average_length)
+        return count * (self.K1 + 1) / (count + norm)
+
+    def _weigh(self, state):
+        """Precompute the term-frequency part of the BM25 impacts and the document frequencies."""
+        import numpy as np
+
+        tf = state['tf']
+        n_passages = tf.shape[0]
+        lengths = np.asarray(tf.sum(axis=1)).ravel()
+        average_length = float(lengths.mean()) if n_passages else 0.0
+
+        impact = tf.copy()
+        if impact.nnz:
+            row_length = np.repeat(lengths, np.diff(impact.indptr))
+            impact.data = self._saturate(impact.data, row_length, average_length).astype(np.float32)
+
+        # Term-major, so a query term's postings are one contiguous slice
+        state['impact'] = impact.T.tocsr()
+        state['df'] = np.bincount(tf.indices, minlength=tf.shape[1]).astype(np.int64)
+        state['n_passages'] = n_passages
+        state['average_length'] = average_length
+        # Passages spliced in or out since: removed ids, and the rows and postings of added ones
+        state['deleted'] = set()
+        state['delta_rows'] = {}
+        state['delta_postings'] = {}
+
+        article_passages = {}
+        for idx, pk in enumerate(state['passage_ids']):
+            article_passages.setdefault(pk, []).append(idx)
+        state['article_passages'] = article_passages
+        state['keywords'] = self._keyword_map(state['article_keywords'])
+        state['keyword_words'] = max((len(phrase.split()) for phrase in state['keywords']), default=0)
+
+    @staticmethod
+    def _idf(df, n_passages):
+        import numpy as np
+
+        return np.log(1 + (n_passages - df + 0.5) / (df + 0.5))
+
+    def build(self):
+        """Rebuild the index from the database and persist it."""
+        with self._lock:
+            docs = list(KnowledgeBase.objects.order_by('pk').values_list('pk', 'title', 'content', 'keywords'))
+            state = self._fit(docs)
+            state['signature'] = self._signature()
+            self._state = state
+            self._save()
+            return state
+
+    def _schedule_save(self):
+        # Called with the lock held; persisting happens off the request that changed an article
+        if self._save_timer is not None and self._save_pid == os.getpid():
+            return
+        self._save_pid = os.getpid()
+        self._save_timer = threading.Timer(self.SAVE_DELAY, self._scheduled_save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _scheduled_save(self):
+        with self._lock:
+            if self._save_timer is not threading.current_thread():
+                # Flushed or invalidated meanwhile
+                return
+            self._save_timer = None
+            self._write_state()
+
+    def flush(self):
+        """Persist a pending change now instead of after ``SAVE_DELAY``."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+            if timer is None or self._save_pid != os.getpid():
+                return
+            timer.cancel()
+            self._write_state()
+
+    def _write_state(self):
+        state = self._state
+        if state is None:
+            return
+        if len(state['delta_rows']) + len(state['deleted']) >= self.COMPACT_SIZE:
+            self._state = self._compact(state)
+        self._save()
+
+    def _save(self):
+        import joblib
+
+        path = self.get_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+            joblib.dump(self._state, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not persist knowledge base index to %s: %s", path, e)
+
+    def _load(self):
+        """Load the persisted index if it still matches the database."""
+        import joblib
+
+        path = self.get_path()
+        try:
+            state = joblib.load(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Discarding unreadable knowledge base index %s: %s", path, e)
+            return None
+
+        if state.get('format') != self.FORMAT or state.get('signature') != self._signature():
+            return None
+        return state
+
+    def ensure(self):
+        """Return the current state, loading or building it on first use.
+
+        Workers call invalidate() when the shared engine generation changes,
+        which makes the next call pick up the index another worker persisted.
+        """
+        state = self._state
+        if state is not None:
+            return state
+
+        with self._lock:
+            if self._state is None:
+                self._state = self._load() or self.build()
+            return self._state
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+            self._save_timer = None
+
+    def search(self, query_text):
+        """Return ``(pk, title, passage, score)`` for the best passage, or None."""
+        return self.search_many([query_text])[0]
+
+    def search_many(self, query_texts):
+        """Best passage for each query, from a curated keyword when one matches."""
+        state = self.ensure()
+        results = []
+        for query_text in query_texts:
+            match = self._keyword_match(state, query_text)
+            if match is None:
+                top = self._top_k(state, query_text, 1)
+                match = top[0] if top else None
+            results.append(match)
+        return results
+
+    def _keyword_match(self, state, query_text):
+        """Answer from the article whose curated keywords cover most of the query.
+
+        Every word n-gram of the query up to the longest keyword is one hash
+        lookup, so the cost does not grow with the number of keywords.
+        """
+        keywords = state['keywords']
+        if not keywords:
+            return None
+
+        words = self.WORD_PATTERN.findall(query_text.lower())
+        matched = {}
+        for size in range(1, min(state['keyword_words'], len(words)) + 1):
+            for start in range(len(words) - size + 1):
+                phrase = ' '.join(words[start:start + size])
+                for pk in keywords.get(phrase, ()):
+                    matched.setdefault(pk, []).append(phrase)
+
+        if not matched:
+            keyword_stats.record()
+            return None
+
+        # Most matched words wins; longer phrases are more specific than single words
+        pk = max(matched, key=lambda pk: (sum(len(phrase.split()) for phrase in matched[pk]), -pk))
+        phrase = max(matched[pk], key=len)
+        keyword_stats.record(pk, phrase)
+
+        article_passages = [state['passages'][idx] for idx in state['article_passages'][pk]]
+        passage = next(
+            (passage for passage in article_passages if f' {phrase} ' in f' {self.normalize_keyword(passage)} '),
+            article_passages[0]
+        )
+        return (pk, state['titles'][pk], passage, self.KEYWORD_SCORE)
+
+    def top_k(self, query_text, k=5):
+        """The ``k`` best passages as ``[(pk, title, passage, score), ...]``."""
+        return self._top_k(self.ensure(), query_text, k)
+
+    def _top_k(self, state, query_text, k):
+        """Score only the passages sharing a term with the query.
+
+        ``score`` is the BM25 score relative to an average-length passage
+        containing every query term once, capped at 1; query terms missing
+        from the knowledge base count against it.
+        """
+        import numpy as np
+
+        terms = set(self.tokenize(query_text))
+        n_passages = state['n_passages']
+        if not terms or not n_passages:
+            return []
+
+        vocabulary, df = state['vocabulary'], state['df']
+        known = [vocabulary[term] for term in terms if term in vocabulary and df[vocabulary[term]] > 0]
+        if not known:
+            return []
+        idf = self._idf(df[known], n_passages)
+        max_idf = math.log(1 + (n_passages + 0.5) / 0.5)
+        ceiling = idf.sum() + (len(terms) - len(known)) * max_idf
+
+        impact = state['impact']
+        main = [(term, weight) for term, weight in zip(known, idf) if term < impact.shape[0]]
+        if main:
+            main_terms = np.array([term for term, _ in main])
+            starts, ends = impact.indptr[main_terms], impact.indptr[main_terms + 1]
+            passages = np.concatenate([impact.indices[s:e] for s, e in zip(starts, ends)])
+            impacts = np.concatenate([impact.data[s:e] * weight for s, e, (_, weight) in zip(starts, ends, main)])
+        else:
+            passages, impacts = np.zeros(0, dtype=np.int32), np.zeros(0)
+        if len(passages) * 8 > impact.shape[1]:
+            # Common terms: accumulating into a dense array beats sorting the postings
+            scores = np.bincount(passages, weights=impacts)
+            candidates = np.flatnonzero(scores)
+            scores = scores[candidates]
+        else:
+            candidates, positions = np.unique(passages, return_inverse=True)
+            scores = np.bincount(positions, weights=impacts)
+
+        if state['delta_postings'] or state['deleted']:
+            totals = dict(zip(candidates.tolist(), scores.tolist()))
+            for term, weight in zip(known, idf.tolist()):
+                for idx, saturated in state['delta_postings'].get(term, ()):
+                    totals[idx] = totals.get(idx, 0.0) + weight * saturated
+            for idx in state['deleted']:
+                totals.pop(idx, None)
+            candidates = np.fromiter(totals.keys(), dtype=np.int64, count=len(totals))
+            scores = np.fromiter(totals.values(), dtype=np.float64, count=len(totals))
+            if not len(candidates):
+                return []
+
+        if len(candidates) > k:
+            best = np.argpartition(-scores, k)[:k]
+        else:
+            best = np.arange(len(candidates))
+        best = best[np.argsort(-scores[best], kind='stable')]
+
+        results = []
+        for idx in best:
+            passage = candidates[idx]
+            pk = state['passage_ids'][passage]
+            results.append((pk, state['titles'][pk], state['passages'][passage], min(float(scores[idx] / ceiling), 1.0)))
+        return results
+
+    def _drop_passage(self, state, idx):
+        """Take a passage out of the document frequencies and the postings."""
+        row = state['delta_rows'].pop(idx, None)
+        if row is None:
+            tf = state['tf']
+            terms = tf.indices[tf.indptr[idx]:tf.indptr[idx + 1]].tolist()
+            state['deleted'].add(idx)
+        else:
+            terms = list(row)
+            postings = state['delta_postings']
+            for term in terms:
+                postings[term] = [entry for entry in postings[term] if entry[0] != idx]
+        for term in terms:
+            state['df'][term] -= 1
+        state['n_passages'] -= 1
+
+    def _add_passage(self, state, pk, passage, row):
+        idx = len(state['passages'])
+        state['passages'].append(passage)
+        state['passage_ids'].append(pk)
+        state['article_passages'][pk] = state['article_passages'].get(pk, []) + [idx]
+        state['delta_rows'][idx] = row
+
+        length = sum(row.values())
+        if not state['average_length']:
+            state['average_length'] = float(length or 1)
+        postings = state['delta_postings']
+        for term, count in row.items():
+            state['df'][term] += 1
+            postings[term] = postings.get(term, []) + [(idx, self._saturate(count, length, state['average_length']))]
+        state['n_passages'] += 1
+
+    def _splice(self, pk, title=None, content=None, keywords=None):
+        """Replace an article's passages (or drop them when ``content`` is None).
+
+        Searches read the state without the lock, so the containers touched
+        here are copied and the new state is swapped in whole. The matrices
+        are shared with the old state; only its delta segment changes.
+        """
+        import numpy as np
+
+        state = dict(self.ensure())
+        for key in ('vocabulary', 'titles', 'article_keywords', 'article_passages', 'keywords',
+                    'delta_rows', 'delta_postings'):
+            state[key] = dict(state[key])
+        state['passages'] = list(state['passages'])
+        state['passage_ids'] = list(state['passage_ids'])
+        state['deleted'] = set(state['deleted'])
+        state['df'] = state['df'].copy()
+
+        for idx in state['article_passages'].pop(pk, []):
+            self._drop_passage(state, idx)
+        state['titles'].pop(pk, None)
+        for phrase in state['article_keywords'].pop(pk, []):
+            others = [other for other in state['keywords'][phrase] if other != pk]
+            if others:
+                state['keywords'][phrase] = others
+            else:
+                del state['keywords'][phrase]
+
+        if content is not None:
+            state['titles'][pk] = title
+            state['article_keywords'][pk] = self._article_keywords(keywords)
+            for phrase in state['article_keywords'][pk]:
+                state['keywords'][phrase] = state['keywords'].get(phrase, []) + [pk]
+            passages, rows = self._tokenize_article(state['vocabulary'], title, content)
+            if len(state['vocabulary']) > len(state['df']):
+                grown = np.zeros(len(state['vocabulary']) - len(state['df']), dtype=state['df'].dtype)
+                state['df'] = np.concatenate([state['df'], grown])
+            for passage, row in zip(passages, rows):
+                self._add_passage(state, pk, passage, row)
+        state['keyword_words'] = max((len(phrase.split()) for phrase in state['keywords']), default=0)
+        state['signature'] = self._signature()
+        self._state = state
+        self._schedule_save()
+
+    def update(self, item):
+        """Re-index the passages of a saved KnowledgeBase article."""
+        with self._lock:
+            self._splice(item.pk, item.title, item.content, item.keywords)
+
+    def remove(self, pk):
+        """Drop the passages of a deleted KnowledgeBase article."""
+        with self._lock:
+            if pk in self.ensure()['titles']:
+                self._splice(pk)
+
+
+kb_index = KnowledgeBaseIndex()
+atexit.register(kb_index.flush)
@@ -0,0 +1,59 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """A cursor that was not produced by ``KeysetPaginator``."""
+
+
+class KeysetPaginator:
+    """Seek pagination of a queryset ordered on ``(field, pk)``.
+
+    Each page is read with ``WHERE (field, pk) > (last field, last pk)``
+    instead of an OFFSET, so a page deep into a long list costs what the
+    first one does and rows added meanwhile don't shift later pages. The
+    cursor handed back to the client is the key of the last row shown.
+    """
+
+    def __init__(self, queryset, field, descending=False, page_size=20):
+        self.queryset = queryset
+        self.field = field
+        self.descending = descending
+        self.page_size = page_size
+
+    def encode(self, obj):
+        value = getattr(obj, self.field)
+        key = [value.isoformat() if value is not None else None, obj.pk]
+        return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+    def decode(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            value = self.queryset.model._meta.get_field(self.field).to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            raise InvalidCursor(cursor)
+        if value is None:
+            # The paginated fields are NOT NULL, so only a forged cursor
+            # holds null, and filtering on "> None" is an error
+            raise InvalidCursor(cursor)
+        return value, pk
+
+    def page(self, cursor=None):
+        """Return ``(rows, next cursor)``; the cursor is None on the last page."""
+        queryset = self.queryset
+        if cursor:
+            value, pk = self.decode(cursor)
+            lookup = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) | Q(**{self.field: value, f'pk__{lookup}': pk})
+            )
+        prefix = '-' if self.descending else ''
+        rows = list(queryset.order_by(f'{prefix}{self.field}', f'{prefix}pk')[:self.page_size + 1])
+        if len(rows) <= self.page_size:
+            return rows, None
+        rows = rows[:self.page_size]
+        return rows, self.encode(rows[-1])
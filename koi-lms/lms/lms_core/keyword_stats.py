@@ -0,0 +1,107 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import KeywordLookupDay, KeywordStat
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordStats:
+    """Hit counts of curated KnowledgeBase keywords.
+
+    Lookups and hits are counted in memory on the query path and added to
+    the ``KeywordStat`` rows, and the day's ``KeywordLookupDay`` totals, at
+    most every ``flush_interval`` seconds, so curators can see in the admin
+    which keywords actually answer questions and how often any does.
+    """
+
+    def __init__(self, flush_interval=30.0):
+        self.flush_interval = flush_interval
+        self.lookups = 0
+        self.hits = 0
+        self._pending = {}
+        self._pending_days = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(flush_interval=getattr(settings, 'AI_KEYWORD_STATS_FLUSH_INTERVAL', 30.0))
+
+    def record(self, article_pk=None, keyword=None):
+        """Count one keyword lookup, and its hit when ``keyword`` matched."""
+        now = timezone.now()
+        with self._lock:
+            self.lookups += 1
+            lookups, hits = self._pending_days.get(now.date(), (0, 0))
+            self._pending_days[now.date()] = (lookups + 1, hits + (keyword is not None))
+            if keyword is not None:
+                self.hits += 1
+                key = (article_pk, keyword)
+                count, _ = self._pending.get(key, (0, None))
+                self._pending[key] = (count + 1, now)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            }
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            days, self._pending_days = self._pending_days, {}
+            self._flushed_at = time.monotonic()
+        if not pending and not days:
+            return
+
+        try:
+            with transaction.atomic():
+                for day, (lookups, hits) in days.items():
+                    self._add_day(day, lookups, hits)
+                for (article_pk, keyword), (count, last_hit_at) in pending.items():
+                    updated = KeywordStat.objects.filter(article_id=article_pk, keyword=keyword).update(
+                        hits=F('hits') + count, last_hit_at=last_hit_at
+                    )
+                    if not updated:
+                        try:
+                            with transaction.atomic():
+                                KeywordStat.objects.create(
+                                    article_id=article_pk, keyword=keyword, hits=count, last_hit_at=last_hit_at
+                                )
+                        except IntegrityError:
+                            # Created by another worker, or the article is gone
+                            KeywordStat.objects.filter(article_id=article_pk, keyword=keyword).update(
+                                hits=F('hits') + count, last_hit_at=last_hit_at
+                            )
+        except DatabaseError as e:
+            logger.warning("Could not save knowledge base keyword stats: %s", e)
+
+    @staticmethod
+    def _add_day(day, lookups, hits):
+        counters = {'lookups': F('lookups') + lookups, 'hits': F('hits') + hits}
+        if KeywordLookupDay.objects.filter(date=day).update(**counters):
+            return
+        try:
+            with transaction.atomic():
+                KeywordLookupDay.objects.create(date=day, lookups=lookups, hits=hits)
+        except IntegrityError:
+            # Created by another worker
+            KeywordLookupDay.objects.filter(date=day).update(**counters)
+
+
+keyword_stats = KeywordStats.from_settings()
+atexit.register(keyword_stats.flush)
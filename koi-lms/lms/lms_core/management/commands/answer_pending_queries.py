@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from lms_core.ai_engine import AIQueryEngine
+from lms_core.models import Query
+
+
+class Command(BaseCommand):
+    help = 'Answer Pending queries in batches with the AI engine and mark them Resolved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of queries answered per engine batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Generate answers without saving them')
+
+    def handle(self, *args, **options):
+        engine = AIQueryEngine()
+        batch_size = options['batch_size']
+        pending = Query.objects.filter(status='Pending').select_related('student').order_by('pk')
+
+        answered = 0
+        last_pk = 0
+        while True:
+            # Seek on pk so that rows resolved by the previous batch don't shift the window
+            batch = list(pending.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            responses = engine.generate_responses(
+                [query.query_text for query in batch],
+                [query.student for query in batch],
+            )
+            for query, response in zip(batch, responses):
+                query.response_text = response['response']
+                query.status = 'Resolved'
+
+            if not options['dry_run']:
+                Query.objects.bulk_update(batch, ['response_text', 'status'])
+            answered += len(batch)
+
+        verb = 'Would answer' if options['dry_run'] else 'Answered'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {answered} pending queries'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from lms_core.similar_queries import similar_queries
+
+
+class Command(BaseCommand):
+    help = 'Build the "students also asked" index from resolved queries and save it with joblib'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of Query rows read per database round trip')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        state = similar_queries.build(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+
+        asked = sum(state['counts'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {state["n_docs"]} distinct questions from {asked} resolved queries '
+            f'in {elapsed:.1f}s, saved to {similar_queries.get_path()}'
+        ))
+        self.stdout.write('Workers load the new index when they restart; until then they '
+                          'keep adding newly logged queries to the one they have.')
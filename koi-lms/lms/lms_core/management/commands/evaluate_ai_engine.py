@@ -0,0 +1,300 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from lms_core.ai_engine import AIQueryEngine, warm_up
+from lms_core.instrumentation import latency_recorder
+from lms_core.models import Assignment, Course, Enrollment, Grade, KnowledgeBase, Quiz, Student
+
+
+def latency_summary(durations):
+    """Latency percentiles (ms) of a list of per-query durations in seconds"""
+    if not durations:
+        return {}
+    ms = np.array(durations) * 1000
+    p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99])
+    return {
+        'count': len(durations),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p90_ms': round(float(p90), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Replay a labelled query CSV through the AI engine and report intent accuracy, '
+            'a confusion matrix, throughput and latency percentiles as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=None,
+                            help='CSV with query_text and intent columns (and optionally student_id). '
+                                 'Defaults to data/queries.csv')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Only replay the first N rows (after shuffling)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed for the replay order, so runs are comparable')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Threads for the concurrent throughput run')
+        parser.add_argument('--rounds', type=int, default=1,
+                            help='Replay the queries this many times in the throughput runs')
+        parser.add_argument('--keep-cache', action='store_true',
+                            help='Do not clear the response cache before each round, so later rounds '
+                                 'measure cache hits')
+        parser.add_argument('--output', default=None,
+                            help='Where to write the JSON report (defaults to ai_eval/<timestamp>.json)')
+        parser.add_argument('--baseline', default=None,
+                            help='A previous JSON report to compare against')
+
+    def handle(self, *args, **options):
+        rows = self.load_rows(options)
+        students = Student.objects.select_related('user').in_bulk(
+            {student_id for _, _, student_id in rows if student_id}, field_name='student_id'
+        )
+        texts = [text for text, _, _ in rows]
+        labels = [intent for _, intent, _ in rows]
+        query_students = [students.get(student_id) for _, _, student_id in rows]
+
+        engine = warm_up()
+        # One throwaway pass so lazily loaded models don't count against the first query
+        engine.generate_responses(texts[:1], query_students[:1])
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'csv': str(options['csv_path']),
+            'seed': options['seed'],
+            'queries': len(rows),
+            'rounds': options['rounds'],
+            'workers': options['workers'],
+            'dataset': self.dataset_fingerprint(),
+        }
+
+        def reset():
+            if not options['keep_cache']:
+                engine.response_cache.clear()
+
+        latency_recorder.reset()
+        predicted, single = self.run_single(engine, texts, query_students, options['rounds'], reset)
+        report['stages'] = latency_recorder.summary()
+        # Every round is scored; each one starts from a cold cache unless --keep-cache
+        report['accuracy'] = self.accuracy(labels * options['rounds'], predicted)
+        report['single_thread'] = single
+
+        report['concurrent'] = self.run_concurrent(
+            engine, texts, query_students, options['rounds'], options['workers'], reset
+        )
+        report['batch'] = self.run_batch(engine, texts, query_students, options['rounds'], reset)
+        cache = engine.response_cache
+        report['response_cache'] = {'hits': cache.hits, 'misses': cache.misses, 'evictions': cache.evictions}
+
+        path = self.write_report(report, options['output'])
+        self.print_report(report)
+        if options['baseline']:
+            self.print_comparison(report, options['baseline'])
+        self.stdout.write(self.style.SUCCESS(f'Report written to {path}'))
+
+    def load_rows(self, options):
+        path = Path(options['csv'] or Path(settings.BASE_DIR).parent / 'data' / 'queries.csv')
+        if not path.exists():
+            raise CommandError(f'File not found: {path}')
+        options['csv_path'] = path
+
+        df = pd.read_csv(path)
+        missing = {'query_text', 'intent'} - set(df.columns)
+        if missing:
+            raise CommandError(f'{path} has no {", ".join(sorted(missing))} column')
+
+        rows = []
+        for _, row in df.iterrows():
+            if not isinstance(row['query_text'], str) or not row['query_text'].strip():
+                continue
+            student_id = row.get('student_id')
+            rows.append((row['query_text'].strip(), row['intent'],
+                         student_id if isinstance(student_id, str) else None))
+        if not rows:
+            raise CommandError(f'No labelled queries in {path}')
+
+        random.Random(options['seed']).shuffle(rows)
+        return rows[:options['limit']] if options['limit'] else rows
+
+    def dataset_fingerprint(self):
+        """Row counts of the tables the engine reads, so reports from different data stand out"""
+        models = [Course, Student, Enrollment, Assignment, Quiz, Grade, KnowledgeBase]
+        return {
+            'vendor': connection.vendor,
+            'name': str(connection.settings_dict['NAME']),
+            'rows': {model.__name__: model.objects.count() for model in models},
+        }
+
+    def run_single(self, engine, texts, students, rounds, reset):
+        durations = []
+        predicted = []
+        elapsed = 0.0
+        for _ in range(rounds):
+            reset()
+            start = time.perf_counter()
+            for text, student in zip(texts, students):
+                query_start = time.perf_counter()
+                response = engine.generate_response(text, student)
+                durations.append(time.perf_counter() - query_start)
+                predicted.append(response['intent'])
+            elapsed += time.perf_counter() - start
+        return predicted, self.throughput(len(durations), elapsed, durations)
+
+    def run_concurrent(self, engine, texts, students, rounds, workers, reset):
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+        durations = []
+        elapsed = 0.0
+        for _ in range(rounds):
+            reset()
+            round_durations, round_elapsed = self.concurrent_round(engine, list(zip(texts, students)), workers)
+            durations.extend(round_durations)
+            elapsed += round_elapsed
+        return self.throughput(len(durations), elapsed, durations)
+
+    def concurrent_round(self, engine, work, workers):
+        durations = [[] for _ in range(workers)]
+        errors = []
+        barrier = threading.Barrier(workers + 1)
+
+        def worker(index):
+            try:
+                barrier.wait()
+                for text, student in work[index::workers]:
+                    query_start = time.perf_counter()
+                    engine.generate_response(text, student)
+                    durations[index].append(time.perf_counter() - query_start)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise CommandError(f'Concurrent run failed: {errors[0]!r}')
+
+        return [duration for worker_durations in durations for duration in worker_durations], elapsed
+
+    def run_batch(self, engine, texts, students, rounds, reset):
+        durations = []
+        for _ in range(rounds):
+            reset()
+            start = time.perf_counter()
+            engine.generate_responses(texts, students)
+            durations.append(time.perf_counter() - start)
+        elapsed = sum(durations)
+        return {
+            'queries': len(texts) * rounds,
+            'seconds': round(elapsed, 4),
+            'qps': round(len(texts) * rounds / elapsed, 2) if elapsed else 0.0,
+        }
+
+    @staticmethod
+    def throughput(count, elapsed, durations):
+        return {
+            'queries': count,
+            'seconds': round(elapsed, 4),
+            'qps': round(count / elapsed, 2) if elapsed else 0.0,
+            'latency': latency_summary(durations),
+        }
+
+    @staticmethod
+    def accuracy(labels, predicted):
+        intents = sorted(set(labels) | set(predicted))
+        confusion = {label: Counter() for label in intents}
+        for label, prediction in zip(labels, predicted):
+            confusion[label][prediction] += 1
+
+        per_intent = {}
+        for intent in intents:
+            support = sum(confusion[intent].values())
+            predicted_as = sum(confusion[label][intent] for label in intents)
+            correct = confusion[intent][intent]
+            per_intent[intent] = {
+                'support': support,
+                'precision': round(correct / predicted_as, 4) if predicted_as else 0.0,
+                'recall': round(correct / support, 4) if support else 0.0,
+            }
+
+        correct = sum(1 for label, prediction in zip(labels, predicted) if label == prediction)
+        return {
+            'overall': round(correct / len(labels), 4) if labels else 0.0,
+            'per_intent': per_intent,
+            # confusion[label][predicted] = count; zero cells are left out
+            'confusion': {label: dict(sorted(row.items())) for label, row in confusion.items() if row},
+        }
+
+    def write_report(self, report, output):
+        if output:
+            path = Path(output)
+        else:
+            path = Path(settings.BASE_DIR) / 'ai_eval' / f'{timezone.now():%Y%m%d-%H%M%S}.json'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2))
+        return path
+
+    def print_report(self, report):
+        accuracy = report['accuracy']
+        self.stdout.write(f'Replayed {report["queries"]} queries from {report["csv"]} (seed {report["seed"]})')
+        self.stdout.write(f'Intent accuracy: {accuracy["overall"]:.1%}')
+        for intent, scores in accuracy['per_intent'].items():
+            if intent not in AIQueryEngine.QUERY_INTENTS:
+                intent = f'{intent} (unknown)'
+            self.stdout.write(
+                f'  {intent:<26} support {scores["support"]:>4}  '
+                f'precision {scores["precision"]:.2f}  recall {scores["recall"]:.2f}'
+            )
+
+        for name in ('single_thread', 'concurrent'):
+            run = report[name]
+            latency = run['latency']
+            label = 'single thread' if name == 'single_thread' else f'{report["workers"]} workers'
+            self.stdout.write(
+                f'{label:<14} {run["qps"]:>9.1f} q/s  p50 {latency.get("p50_ms", 0):.2f} ms  '
+                f'p95 {latency.get("p95_ms", 0):.2f} ms  p99 {latency.get("p99_ms", 0):.2f} ms'
+            )
+        self.stdout.write(f'{"batch":<14} {report["batch"]["qps"]:>9.1f} q/s')
+
+    def print_comparison(self, report, baseline_path):
+        try:
+            baseline = json.loads(Path(baseline_path).read_text())
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read baseline {baseline_path}: {e}')
+
+        if baseline.get('dataset', {}).get('rows') != report['dataset']['rows']:
+            self.stdout.write(self.style.WARNING('Baseline was measured on different data; compare with care'))
+        for key in ('csv', 'seed', 'queries', 'rounds', 'workers'):
+            if baseline.get(key) != report[key]:
+                self.stdout.write(self.style.WARNING(f'Baseline used a different {key}: {baseline.get(key)}'))
+
+        def change(old, new):
+            return f'{(new - old) / old:+.1%}' if old else 'n/a'
+
+        old_accuracy = baseline['accuracy']['overall']
+        new_accuracy = report['accuracy']['overall']
+        self.stdout.write(f'vs baseline: accuracy {old_accuracy:.1%} -> {new_accuracy:.1%}')
+        for name in ('single_thread', 'concurrent', 'batch'):
+            old_qps, new_qps = baseline[name]['qps'], report[name]['qps']
+            self.stdout.write(f'  {name:<14} {old_qps:>9.1f} -> {new_qps:>9.1f} q/s ({change(old_qps, new_qps)})')
+        old_p95 = baseline['single_thread']['latency'].get('p95_ms', 0)
+        new_p95 = report['single_thread']['latency'].get('p95_ms', 0)
+        self.stdout.write(f'  single p95     {old_p95:.2f} -> {new_p95:.2f} ms ({change(old_p95, new_p95)})')
@@ -2,6 +2,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from django.utils import timezone
+from lms_core.id_allocator import enrollment_ids, grade_ids, query_ids
 from lms_core.models import (
     Student, Course, Enrollment, Assignment, Quiz, Grade, Forum, Query, ResponseTemplate, KnowledgeBase
 )
@@ -37,6 +38,10 @@ class Command(BaseCommand):
         # Knowledge Base
         self.import_knowledge_base(data_dir / 'knowledge_base.json')
 
+        # New ids must not collide with the imported ones
+        for allocator in (query_ids, grade_ids, enrollment_ids):
+            allocator.sync()
+
         self.stdout.write(self.style.SUCCESS('✅ Data import completed successfully!'))
 
     # ---------------------- Students ----------------------
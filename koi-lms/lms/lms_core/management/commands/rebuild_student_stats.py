@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from lms_core.models import Student
+from lms_core.student_stats import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute every StudentStats row and Student.gpa from the Grade and Enrollment tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows written per INSERT / UPDATE statement')
+        parser.add_argument('--student', action='append', dest='students', default=None,
+                            help='Only rebuild this student id (may be repeated)')
+
+    def handle(self, *args, **options):
+        student_pks = None
+        if options['students']:
+            student_pks = list(
+                Student.objects.filter(student_id__in=options['students']).values_list('pk', flat=True)
+            )
+
+        start = time.perf_counter()
+        count = rebuild(student_pks, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats of {count} students in {elapsed:.1f}s'))
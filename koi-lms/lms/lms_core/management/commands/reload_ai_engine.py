@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from lms_core import generations
+
+
+class Command(BaseCommand):
+    help = 'Make every running worker reload AI templates, keywords and indexes'
+
+    def handle(self, *args, **options):
+        generations.bump(generations.AI_ENGINE)
+        generation = generations.current(generations.AI_ENGINE)
+        self.stdout.write(self.style.SUCCESS(f'AI engine generation is now {generation}'))
@@ -0,0 +1,100 @@
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from lms_core import generations
+from lms_core.ai_engine import AIQueryEngine
+from lms_core.intent_classifier import IntentClassifier
+from lms_core.models import Query
+
+
+class Command(BaseCommand):
+    help = 'Train the AI intent classifier from labelled queries and save it with joblib'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', action='append', dest='csv_files',
+                            help='Labelled CSV with query_text and intent columns (repeatable). '
+                                 'Defaults to data/queries.csv and data/intent_examples.csv')
+        parser.add_argument('--no-db', action='store_true',
+                            help='Do not read labelled rows from the Query table')
+        parser.add_argument('--output', default=None,
+                            help='Where to save the model (defaults to AI_INDEX_DIR)')
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Share of the queries held out, per intent, to measure accuracy '
+                                 'before training on all of them (0 to skip)')
+
+    def handle(self, *args, **options):
+        intents = set(AIQueryEngine.QUERY_INTENTS)
+        examples = set()
+
+        if not options['no_db']:
+            rows = Query.objects.filter(intent__in=intents).values_list('query_text', 'intent')
+            examples.update((text.strip(), intent) for text, intent in rows if text.strip())
+
+        data_dir = Path(settings.BASE_DIR).parent / 'data'
+        csv_files = options['csv_files'] or [data_dir / 'queries.csv', data_dir / 'intent_examples.csv']
+        for filepath in csv_files:
+            filepath = Path(filepath)
+            if not filepath.exists():
+                self.stdout.write(self.style.WARNING(f'File not found: {filepath}'))
+                continue
+            df = pd.read_csv(filepath)
+            for _, row in df.iterrows():
+                if row['intent'] in intents and isinstance(row['query_text'], str):
+                    examples.add((row['query_text'].strip(), row['intent']))
+
+        if not examples:
+            raise CommandError('No labelled queries found to train on.')
+
+        # Repeated templates would only re-weight a handful of phrasings
+        texts, labels = zip(*sorted(examples))
+        counts = Counter(labels)
+        if len(counts) < 2:
+            raise CommandError('At least two intents are needed to train a classifier.')
+
+        holdout = self.holdout_accuracy(texts, labels, options['holdout']) if options['holdout'] > 0 else None
+
+        classifier = IntentClassifier.train(list(texts), list(labels))
+        path = classifier.save(options['output'])
+        if not options['output']:
+            # Running workers pick the new model up on their next request
+            generations.bump(generations.AI_ENGINE)
+
+        for intent in AIQueryEngine.QUERY_INTENTS:
+            self.stdout.write(f'  {intent:<22} {counts.get(intent, 0)} examples')
+        missing = intents - set(counts)
+        if missing:
+            self.stdout.write(self.style.WARNING(f'No examples for: {", ".join(sorted(missing))}'))
+        if holdout is not None:
+            accuracy, held_out = holdout
+            self.stdout.write(f'Held-out accuracy {accuracy:.1%} on {held_out} queries')
+        self.stdout.write(self.style.SUCCESS(f'Trained on {len(labels)} unique queries, saved to {path}'))
+
+    def holdout_accuracy(self, texts, labels, fraction):
+        """Accuracy of a model trained without a stratified share of the queries, on that share.
+
+        Returns ``(accuracy, held-out queries)``, or None when there are too
+        few queries to hold some of every intent out.
+        """
+        from sklearn.model_selection import train_test_split
+
+        counts = Counter(labels)
+        # An intent with a single query can only be trained on
+        pool = [idx for idx, label in enumerate(labels) if counts[label] > 1]
+        try:
+            train, test = train_test_split(
+                pool, test_size=fraction, stratify=[labels[idx] for idx in pool], random_state=0
+            )
+        except ValueError as e:
+            self.stdout.write(self.style.WARNING(f'Skipping the held-out accuracy: {e}'))
+            return None
+        train += [idx for idx, label in enumerate(labels) if counts[label] == 1]
+        if len({labels[idx] for idx in train}) < 2:
+            return None
+
+        classifier = IntentClassifier.train([texts[idx] for idx in train], [labels[idx] for idx in train])
+        predictions = classifier.predict_many([texts[idx] for idx in test])
+        correct = sum(1 for (predicted, _), idx in zip(predictions, test) if predicted == labels[idx])
+        return correct / len(test), len(test)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms_core', '0002_alter_student_enrollment_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngineGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IntentKeyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('intent', models.CharField(max_length=50)),
+                ('keyword', models.CharField(max_length=100)),
+            ],
+            options={
+                'ordering': ['intent', 'keyword'],
+                'unique_together': {('intent', 'keyword')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms_core', '0004_idsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeywordStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keyword', models.CharField(max_length=200)),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_stats', to='lms_core.knowledgebase')),
+            ],
+            options={
+                'ordering': ['-hits'],
+                'unique_together': {('article', 'keyword')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms_core', '0005_keywordstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentStats',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='lms_core.student')),
+                ('grade_count', models.IntegerField(default=0)),
+                ('grade_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_courses', models.IntegerField(default=0)),
+                ('enrolled_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('withdrawn_count', models.IntegerField(default=0)),
+                ('gpa_points', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('gpa_courses', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Student stats',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms_core', '0006_studentstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['due_date', 'id'], name='lms_core_as_due_dat_084f78_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(fields=['created_date', 'id'], name='lms_core_fo_created_7b0269_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['date', 'id'], name='lms_core_qu_date_10490a_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms_core', '0007_list_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeywordLookupDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('lookups', models.PositiveBigIntegerField(default=0)),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
@@ -23,6 +23,34 @@ class Student(models.Model):
     class Meta:
         ordering = ['student_id']
 
+# Running totals behind a student's pages, kept up to date by Grade and Enrollment signals
+class StudentStats(models.Model):
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    grade_count = models.IntegerField(default=0)
+    grade_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_courses = models.IntegerField(default=0)
+    enrolled_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    withdrawn_count = models.IntegerField(default=0)
+    # Grade points of the latest grade of each completed course, and how many there are
+    gpa_points = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    gpa_courses = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.student_id}: {self.grade_count} grades, GPA {self.gpa:.2f}"
+    
+    @property
+    def avg_grade(self):
+        return self.grade_total / self.grade_count if self.grade_count else 0
+    
+    @property
+    def gpa(self):
+        return float(self.gpa_points) / self.gpa_courses if self.gpa_courses else 0.0
+    
+    class Meta:
+        verbose_name_plural = 'Student stats'
+
 class Course(models.Model):
     course_id = models.CharField(max_length=50, unique=True)
     course_code = models.CharField(max_length=20)
@@ -79,6 +107,8 @@ class Assignment(models.Model):
     
     class Meta:
         ordering = ['due_date']
+        # Keyset pagination of the student lists seeks on (due_date, id)
+        indexes = [models.Index(fields=['due_date', 'id'])]
 
 class Quiz(models.Model):
     quiz_id = models.CharField(max_length=50, unique=True)
@@ -97,6 +127,8 @@ class Quiz(models.Model):
     
     class Meta:
         ordering = ['date']
+        # Keyset pagination of the student lists seeks on (date, id)
+        indexes = [models.Index(fields=['date', 'id'])]
 
 class Grade(models.Model):
     grade_id = models.CharField(max_length=20, unique=True)
@@ -132,6 +164,8 @@ class Forum(models.Model):
     
     class Meta:
         ordering = ['-created_date']
+        # Keyset pagination of the student lists seeks on (created_date, id)
+        indexes = [models.Index(fields=['created_date', 'id'])]
 
 class Query(models.Model):
     query_id = models.CharField(max_length=20, unique=True)
@@ -174,3 +208,63 @@ class KnowledgeBase(models.Model):
     
     class Meta:
         ordering = ['category', 'title']
+
+class KeywordStat(models.Model):
+    article = models.ForeignKey(KnowledgeBase, on_delete=models.CASCADE, related_name='keyword_stats')
+    keyword = models.CharField(max_length=200)
+    hits = models.PositiveBigIntegerField(default=0)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.keyword} -> {self.article.title}: {self.hits}"
+    
+    class Meta:
+        unique_together = ['article', 'keyword']
+        ordering = ['-hits']
+
+class KeywordLookupDay(models.Model):
+    date = models.DateField(unique=True)
+    lookups = models.PositiveBigIntegerField(default=0)
+    hits = models.PositiveBigIntegerField(default=0)
+    
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+    
+    def __str__(self):
+        return f"{self.date}: {self.hits}/{self.lookups}"
+    
+    class Meta:
+        ordering = ['-date']
+
+class IntentKeyword(models.Model):
+    intent = models.CharField(max_length=50)
+    keyword = models.CharField(max_length=100)
+    
+    def __str__(self):
+        return f"{self.intent} - {self.keyword}"
+    
+    class Meta:
+        unique_together = ['intent', 'keyword']
+        ordering = ['intent', 'keyword']
+
+class EngineGeneration(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    generation = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.generation}"
+    
+    class Meta:
+        ordering = ['name']
+
+class IdSequence(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name} -> {self.next_value}"
+    
+    class Meta:
+        ordering = ['name']
@@ -0,0 +1,143 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Enrollment, Student
+
+
+class PageCache:
+    """Versioned cache of student page contexts and rendered fragments.
+
+    Page keys embed a version number of the student and of each course the
+    page shows. Grade and Enrollment signals bump the student's version;
+    Course, Assignment, Quiz and Forum signals bump the course's. Entries
+    built from old rows are never read again and simply expire, so a page
+    whose data has not changed costs a few cache reads and no queries.
+
+    Versions live in the cache itself. With several workers point ``CACHE``
+    at a shared backend (Redis, Memcached); with the default per-process
+    cache other workers keep serving their copy for up to ``TIMEOUT``
+    seconds after a change.
+    """
+
+    def __init__(self, alias='default', timeout=60):
+        self.alias = alias
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'STUDENT_PAGE_CACHE', {})
+        return cls(alias=options.get('CACHE', 'default'), timeout=options.get('TIMEOUT', 60))
+
+    @property
+    def enabled(self):
+        return bool(self.alias) and self.timeout > 0
+
+    def _cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _version_key(kind, pk):
+        return f'lms:page:v:{kind}:{pk}'
+
+    @staticmethod
+    def _student_key(user_pk):
+        return f'lms:page:student:{user_pk}'
+
+    def bump(self, kind, *pks):
+        """Move the ``'student'`` or ``'course'`` version of ``pks`` on."""
+        if not self.enabled:
+            return
+        cache = self._cache()
+        for pk in set(pks) - {None}:
+            key = self._version_key(kind, pk)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # An evicted counter restarts past any value it may have had
+                if not cache.add(key, time.time_ns(), None):
+                    cache.incr(key)
+
+    def forget_student(self, user_pk):
+        """Drop the cached user -> student mapping of ``user_pk``."""
+        if self.enabled:
+            self._cache().delete(self._student_key(user_pk))
+
+    def _versions(self, cache, keys):
+        versions = cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                cache.add(key, time.time_ns(), None)
+                versions[key] = cache.get(key)
+        return versions
+
+    def _student_pk(self, cache, user):
+        key = self._student_key(user.pk)
+        student_pk = cache.get(key)
+        if student_pk is None:
+            student_pk = Student.objects.filter(user=user).values_list('pk', flat=True).first()
+            if student_pk is not None:
+                cache.set(key, student_pk, None)
+        return student_pk
+
+    def _courses(self, cache, student_pk, student_version):
+        """``{course_id: course pk}`` of the student's enrollments at ``student_version``."""
+        key = f'lms:page:courses:{student_pk}:{student_version}'
+        courses = cache.get(key)
+        if courses is None:
+            courses = dict(
+                Enrollment.objects.filter(student_id=student_pk).values_list('course__course_id', 'course_id')
+            )
+            cache.set(key, courses, self.timeout)
+        return courses
+
+    def page_key(self, page, user, course_id=None, *extra):
+        """Cache key of ``page`` for the user's student, or None if it cannot be cached.
+
+        The key covers all of the student's courses, or just ``course_id``'s
+        for a course page; ``extra`` tells apart variants such as page numbers.
+        """
+        if not self.enabled or not user.is_authenticated:
+            return None
+        cache = self._cache()
+        student_pk = self._student_pk(cache, user)
+        if student_pk is None:
+            return None
+
+        student_key = self._version_key('student', student_pk)
+        student_version = self._versions(cache, [student_key])[student_key]
+        courses = self._courses(cache, student_pk, student_version)
+        if course_id is None:
+            course_pks = sorted(courses.values())
+        elif course_id in courses:
+            course_pks = [courses[course_id]]
+        else:
+            return None
+
+        course_versions = self._versions(cache, [self._version_key('course', pk) for pk in course_pks])
+        digest = hashlib.sha1(repr((sorted(course_versions.items()), extra)).encode('utf-8')).hexdigest()
+        return f'lms:page:{page}:{student_pk}:{student_version}:{digest}'
+
+    def get(self, key):
+        """The context cached under ``key``, or None."""
+        return self._cache().get(key) if key else None
+
+    def set(self, key, context):
+        if key:
+            self._cache().set(key, context, self.timeout)
+
+    def fragment_context(self, key):
+        """Variables for ``{% cache page_cache_timeout <name> page_key using=page_cache_alias %}``.
+
+        Pages without a key get a timeout of 0, so their fragments are never stored.
+        """
+        return {
+            'page_key': key,
+            'page_cache_timeout': self.timeout if key else 0,
+            'page_cache_alias': self.alias or 'default',
+        }
+
+
+page_cache = PageCache.from_settings()
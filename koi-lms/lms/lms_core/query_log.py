@@ -0,0 +1,339 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .id_allocator import query_ids
+from .instrumentation import latency_recorder
+from .models import Query
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLog:
+    """Write-behind log of answered AI queries.
+
+    ``log()`` appends the record to a per-process spill file and queues it;
+    a background thread writes the queue with one ``bulk_create`` once it
+    holds ``batch_size`` records or ``flush_interval`` seconds have passed.
+    Spill segments are deleted only after their records are in the
+    database. Each process holds an ``flock`` on the segments it owns, so
+    a segment nobody holds belongs to a process that died (or gave it up)
+    and is replayed by the next one that starts logging.
+
+    Rows the database rejects outright (say, a student deleted since, or a
+    ``query_id`` already used by another query) go to ``dead_letter.jsonl``
+    instead of blocking the queue. While the
+    database is unreachable at most ``max_queue`` records wait in memory;
+    beyond that the segments are released and replayed from disk later.
+    """
+
+    FIELDS = ('query_id', 'student_id', 'query_text', 'intent', 'status', 'priority', 'response_text')
+
+    DEAD_LETTER = 'dead_letter.jsonl'
+
+    def __init__(self, spill_dir, batch_size=100, flush_interval=1.0, fsync=False, enabled=True, max_queue=10000):
+        self.spill_dir = Path(spill_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.enabled = enabled
+        self.max_queue = max_queue
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dead_letters = 0
+        self.released = 0
+        self._queue = []
+        self._segments = []
+        self._segment = None
+        self._segment_seq = 0
+        self._token = None
+        self._needs_replay = False
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'AI_QUERY_LOG', {})
+        return cls(
+            spill_dir=options.get('SPILL_DIR', settings.BASE_DIR / 'query_log'),
+            batch_size=options.get('BATCH_SIZE', 100),
+            flush_interval=options.get('FLUSH_INTERVAL', 1.0),
+            fsync=options.get('FSYNC', False),
+            enabled=options.get('ENABLED', True),
+            max_queue=options.get('MAX_QUEUE', 10000),
+        )
+
+    def log(self, student=None, **fields):
+        """Record an answered query and return it as an unsaved ``Query``."""
+        query = Query(
+            query_id=fields.pop('query_id', None) or query_ids.next_id(),
+            student=student,
+            timestamp=fields.pop('timestamp', None) or timezone.now(),
+            **fields
+        )
+        if not self.enabled:
+            query.save()
+            return query
+
+        line = json.dumps(self._record(query)) + '\n'
+
+        with self._lock:
+            self._start()
+            self._segment.write(line)
+            self._segment.flush()
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+            self._queue.append(query)
+            if len(self._queue) >= self.max_queue:
+                self._release_segments()
+            elif len(self._queue) >= self.batch_size:
+                self._wakeup.notify()
+        return query
+
+    def _record(self, query):
+        record = {field: getattr(query, field) for field in self.FIELDS}
+        record['timestamp'] = query.timestamp.isoformat()
+        return record
+
+    def pending(self, student=None):
+        """Queued queries not written yet, newest first."""
+        with self._lock:
+            queued = list(self._queue)
+        if student is not None:
+            queued = [query for query in queued if query.student_id == student.pk]
+        return queued[::-1]
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._queue)
+        return {
+            'queue_depth': depth,
+            'flushed': self.flushed,
+            'failed_flushes': self.failed_flushes,
+            'released': self.released,
+            'dead_letters': self.dead_letters,
+        }
+
+    def _start(self):
+        # Called with the lock held; (re)starts after fork, where the thread is gone
+        if self._pid == os.getpid():
+            return
+        # Segments inherited over fork() share the parent's lock; let go of them
+        for segment in self._segments + [self._segment]:
+            if segment is not None:
+                segment.close()
+        self._pid = os.getpid()
+        # pids are reused, so segment names carry a token of their own
+        self._token = f'{self._pid}-{uuid.uuid4().hex[:12]}'
+        self._segment_seq = 0
+        self._queue = []
+        self._segments = []
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name='query-log', daemon=True)
+        self._thread.start()
+
+    def _open_segment(self):
+        self._segment_seq += 1
+        path = self.spill_dir / f'queries.{self._token}.{self._segment_seq}.jsonl'
+        self._segment = open(path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            # Held as long as the file is open, and dropped by the OS if this process dies
+            fcntl.flock(self._segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _release_segments(self):
+        # Called with the lock held when the database has been failing for a
+        # while: unlock the segments, drop their records from memory and
+        # replay them from disk once writes succeed again
+        logger.warning("Query log queue is full; %d queued queries left to replay from %s",
+                       len(self._queue), self.spill_dir)
+        for segment in self._segments + [self._segment]:
+            segment.close()
+        self.released += len(self._queue)
+        self._queue = []
+        self._segments = []
+        self._needs_replay = True
+        self._open_segment()
+
+    def _run(self):
+        self.replay()
+        while True:
+            with self._lock:
+                if len(self._queue) < self.batch_size:
+                    self._wakeup.wait(self.flush_interval)
+            written = self.flush()
+            if self._needs_replay and written is not None:
+                self._needs_replay = False
+                self.replay()
+
+    def flush(self):
+        """Write every queued query; returns the number written, None if the database failed."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._queue or self._pid != os.getpid():
+                    return 0
+                batch, self._queue = self._queue, []
+                # Records logged from now on go to a new segment
+                self._segments.append(self._segment)
+                segments, self._segments = self._segments, []
+                self._open_segment()
+
+            start = time.perf_counter()
+            try:
+                written = self._write(batch)
+            except DatabaseError as e:
+                logger.warning("Could not write %d queued queries, will retry: %s", len(batch), e)
+                self.failed_flushes += 1
+                with self._lock:
+                    self._queue[:0] = batch
+                    self._segments[:0] = segments
+                    if len(self._queue) >= self.max_queue:
+                        self._release_segments()
+                return None
+            finally:
+                close_old_connections()
+
+            latency_recorder.record('query_log', 'flush', (time.perf_counter() - start) * 1000, 1)
+            self.flushed += written
+            for segment in segments:
+                # Unlinked before the lock goes, so no other process replays it
+                Path(segment.name).unlink(missing_ok=True)
+                segment.close()
+            return written
+
+    def _write(self, queries):
+        """Insert ``queries``; rows the database rejects go to the dead letter file.
+
+        A row whose ``query_id`` is taken by the very same record was written
+        before, by a worker that died before unlinking its segment, and is
+        skipped; one taken by another query is rejected like any other row.
+        Returns the number of rows written. Errors other than integrity
+        errors (the database being down) are raised.
+        """
+        try:
+            with transaction.atomic():
+                Query.objects.bulk_create(queries, batch_size=self.batch_size)
+            return len(queries)
+        except IntegrityError:
+            pass
+
+        # Find the rows at fault one at a time
+        written = 0
+        rejected = []
+        for query in queries:
+            try:
+                with transaction.atomic():
+                    Query.objects.bulk_create([query])
+                written += 1
+            except IntegrityError as e:
+                if not self._already_written(query):
+                    rejected.append((query, e))
+        if rejected:
+            self._dead_letter(rejected)
+        return written
+
+    @staticmethod
+    def _already_written(query):
+        return Query.objects.filter(
+            query_id=query.query_id, student_id=query.student_id, query_text=query.query_text,
+            timestamp=query.timestamp,
+        ).exists()
+
+    def _dead_letter(self, rejected):
+        logger.error("Query log moved %d queries the database rejected to %s",
+                     len(rejected), self.spill_dir / self.DEAD_LETTER)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_dir / self.DEAD_LETTER, 'a', encoding='utf-8') as dead_letter:
+            for query, error in rejected:
+                record = self._record(query)
+                record['error'] = str(error)
+                dead_letter.write(json.dumps(record) + '\n')
+            dead_letter.flush()
+            os.fsync(dead_letter.fileno())
+        self.dead_letters += len(rejected)
+
+    def close(self):
+        """Flush and remove this process's spill segment; registered with atexit."""
+        self.flush()
+        with self._lock:
+            if self._pid != os.getpid() or self._queue:
+                return
+            Path(self._segment.name).unlink(missing_ok=True)
+            self._segment.close()
+            self._pid = None
+
+    def replay(self):
+        """Write the spill segments no live process holds a lock on."""
+        if fcntl is None:
+            logger.warning("Query log spill files can't be replayed without fcntl.flock")
+            return 0
+        with self._lock:
+            own = {Path(segment.name) for segment in self._segments + [self._segment] if segment is not None}
+
+        replayed = 0
+        for path in sorted(self.spill_dir.glob('queries.*.jsonl')):
+            if path in own:
+                continue
+            try:
+                segment = open(path, encoding='utf-8')
+            except FileNotFoundError:
+                # Replayed by another process meanwhile
+                continue
+            with segment:
+                try:
+                    fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Its process is alive and still owns it
+                    continue
+                if not path.exists():
+                    continue
+                try:
+                    queries = self._read_segment(segment)
+                    self._write(queries)
+                except (OSError, DatabaseError) as e:
+                    logger.warning("Could not replay query log segment %s, will retry: %s", path, e)
+                    self._needs_replay = True
+                    continue
+                finally:
+                    close_old_connections()
+                # Unlinked while still locked, so nobody else replays it too
+                path.unlink(missing_ok=True)
+            replayed += len(queries)
+        if replayed:
+            logger.info("Replayed %d queries from the query log spill files", replayed)
+        return replayed
+
+    @staticmethod
+    def _read_segment(segment):
+        queries = []
+        for line in segment:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-write
+                continue
+            record['timestamp'] = parse_datetime(record['timestamp'])
+            queries.append(Query(**record))
+        return queries
+
+
+query_log = QueryLog.from_settings()
+atexit.register(query_log.close)
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from . import generations
+from .models import EngineGeneration
+
+
+class ResponseCache:
+    """Bounded LRU cache of AI engine responses with tag-based invalidation.
+
+    Every entry carries the tags of the data it was built from, e.g.
+    ``('course', 7)``, ``('course_code', 'COMP101')`` or ``('student', 42)``.
+    Model signals invalidate exactly the entries holding a tag, so cached
+    deadlines and grades are dropped as soon as the underlying rows change
+    in this process. The tags are also published to the other workers: the
+    shared ``responses`` generation is bumped and every published tag gets
+    an ``EngineGeneration`` row holding that generation. A worker that sees
+    the generation move drops the entries of the tags published since its
+    last check, and nothing else.
+    """
+
+    # Intents whose answers depend on who is asking
+    STUDENT_SCOPED_INTENTS = {'grade_inquiry'}
+
+    # Published to drop every entry, e.g. when a course code is renamed
+    EVERYTHING = ('*',)
+
+    # Names of the per-tag generation rows
+    TAG_PREFIX = 'responses:'
+
+    # Intents answered from the knowledge base
+    KNOWLEDGE_BASE_INTENTS = {
+        'general_inquiry', 'enrollment_help', 'fee_payment', 'resource_access',
+        'extension_request', 'policy_question', 'assessment_criteria',
+    }
+
+    def __init__(self, max_entries=2048, ttl=300, check_interval=1.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.watcher = generations.GenerationWatcher(generations.RESPONSES, interval=check_interval)
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self._invalidations = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'AI_RESPONSE_CACHE', {})
+        return cls(
+            max_entries=options.get('MAX_ENTRIES', 2048),
+            ttl=options.get('TTL', 300),
+            check_interval=getattr(settings, 'AI_ENGINE_RELOAD_INTERVAL', 1.0),
+        )
+
+    @staticmethod
+    def normalize(query_text):
+        return ' '.join(query_text.lower().split())
+
+    def make_key(self, query_text, intent, entities, student=None):
+        student_pk = student.pk if student and intent in self.STUDENT_SCOPED_INTENTS else None
+        return (
+            self.normalize(query_text),
+            intent,
+            tuple(sorted(entities.items())),
+            student_pk,
+        )
+
+    def tags_for(self, intent, entities, student=None):
+        """Return the data dependencies of a response."""
+        tags = set()
+        if entities.get('course_id'):
+            tags.add(('course', entities['course_id']))
+        if entities.get('course_code'):
+            # Also covers "course not found" answers until the course is created
+            tags.add(('course_code', entities['course_code']))
+        if intent in self.STUDENT_SCOPED_INTENTS and student:
+            tags.add(('student', student.pk))
+        if intent in self.KNOWLEDGE_BASE_INTENTS:
+            tags.add(('kb',))
+        return tags
+
+    def token(self):
+        """Snapshot to pass to set(), taken before reading from the database.
+
+        Also drops the entries of the tags other processes published since
+        the last check.
+        """
+        try:
+            generation = self.watcher.poll()
+            if generation is not None:
+                if self.watcher.seen is not None:
+                    self._drop_published(self.watcher.seen)
+                self.watcher.mark(generation)
+        except DatabaseError:
+            pass
+        return self._invalidations
+
+    @classmethod
+    def _tag_name(cls, tag):
+        return cls.TAG_PREFIX + ':'.join(str(part) for part in tag)
+
+    @classmethod
+    def _parse_tag(cls, name):
+        kind, *rest = name[len(cls.TAG_PREFIX):].split(':', 1)
+        if kind in ('course', 'student'):
+            return (kind, int(rest[0]))
+        return (kind, *rest)
+
+    def publish(self, *tags):
+        """Have the other workers drop the entries of ``tags`` (every entry for EVERYTHING)."""
+        with transaction.atomic():
+            # The tag rows commit with the bump, so a worker that sees the
+            # new generation also sees them
+            generation = generations.bump(generations.RESPONSES)
+            for tag in tags:
+                EngineGeneration.objects.update_or_create(
+                    name=self._tag_name(tag), defaults={'generation': generation}
+                )
+
+    def _drop_published(self, seen):
+        names = EngineGeneration.objects.filter(
+            name__startswith=self.TAG_PREFIX, generation__gt=seen
+        ).values_list('name', flat=True)
+        tags = {self._parse_tag(name) for name in names}
+        if self.EVERYTHING in tags:
+            self.clear()
+        elif tags:
+            self.invalidate(*tags)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, response, tags = entry
+            if expires <= time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(response)
+
+    def set(self, key, response, tags=(), token=None):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            if token is not None and token != self._invalidations:
+                # Something was invalidated while the response was being built,
+                # it may already be stale
+                return
+
+            if key in self._entries:
+                self._discard(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, dict(response), frozenset(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._invalidations += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache.from_settings()
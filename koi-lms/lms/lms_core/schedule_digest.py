@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import generations
+from .models import Assignment, Quiz
+
+# Pre-rendered reply lines of a course's upcoming assignments, plus the raw
+# listing; ``expires`` is the first due date, when the digest goes stale
+AssignmentDigest = namedtuple('AssignmentDigest', ['lines', 'data', 'expires'])
+
+# Pre-rendered reply lines of a course's upcoming quizzes and exams
+ExamDigest = namedtuple('ExamDigest', ['lines', 'expires'])
+
+
+class ScheduleDigests:
+    """Per-course upcoming assignment and exam schedules, formatted once.
+
+    Deadline and exam-schedule answers are built from these digests, so a
+    warm course costs a dictionary lookup instead of a query and a
+    ``strftime`` per row. A digest only lists rows that are not due yet and
+    is rebuilt once the first of them is. Assignment and Quiz signals drop
+    the digest of the course they belong to (both courses when a row moves);
+    other workers drop all of theirs when the shared ``schedules``
+    generation moves.
+    """
+
+    KINDS = ('assignments', 'exams')
+
+    # Deadline answers list this many assignments
+    MAX_ASSIGNMENT_LINES = 5
+
+    def __init__(self, max_courses=5000, check_interval=1.0):
+        self.max_courses = max_courses
+        self._digests = {kind: OrderedDict() for kind in self.KINDS}
+        self._lock = threading.Lock()
+        self._invalidations = 0
+        self.watcher = generations.GenerationWatcher(generations.SCHEDULES, interval=check_interval)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(check_interval=getattr(settings, 'AI_ENGINE_RELOAD_INTERVAL', 1.0))
+
+    def assignments(self, course_ids):
+        """Return ``{course pk: AssignmentDigest}`` for ``course_ids``."""
+        return self._get('assignments', course_ids)
+
+    def exams(self, course_ids):
+        """Return ``{course pk: ExamDigest}`` for ``course_ids``."""
+        return self._get('exams', course_ids)
+
+    def invalidate(self, course_pk=None, kind=None):
+        """Drop the digests of one course (all courses when None)."""
+        with self._lock:
+            self._invalidations += 1
+            for name in ([kind] if kind else self.KINDS):
+                if course_pk is None:
+                    self._digests[name].clear()
+                else:
+                    self._digests[name].pop(course_pk, None)
+
+    def bumped(self, generation):
+        """Record a ``schedules`` bump made by this process after invalidating.
+
+        This worker already dropped the affected course, so unless another
+        worker bumped the counter in between, the rest can be kept.
+        """
+        with self._lock:
+            if self.watcher.seen is not None and generation == self.watcher.seen + 1:
+                self.watcher.mark(generation)
+
+    def _get(self, kind, course_ids):
+        generation = self.watcher.poll()
+        if generation is not None:
+            self.invalidate()
+            self.watcher.mark(generation)
+
+        digests = self._digests[kind]
+        found = {}
+        now = timezone.now()
+        with self._lock:
+            for course_pk in course_ids:
+                digest = digests.get(course_pk)
+                if digest is not None and digest.expires is not None and digest.expires <= now:
+                    # Its first row is past due
+                    del digests[course_pk]
+                    digest = None
+                if digest is not None:
+                    digests.move_to_end(course_pk)
+                    found[course_pk] = digest
+            token = self._invalidations
+
+        missing = [course_pk for course_pk in course_ids if course_pk not in found]
+        if not missing:
+            return found
+
+        build = self._build_assignments if kind == 'assignments' else self._build_exams
+        built = build(missing, now)
+        found.update(built)
+        with self._lock:
+            # Rows read before an invalidation may already be stale
+            if token == self._invalidations:
+                digests.update(built)
+                while len(digests) > self.max_courses:
+                    digests.popitem(last=False)
+        return found
+
+    def _build_assignments(self, course_ids, now):
+        rows = {course_pk: [] for course_pk in course_ids}
+        assignments = Assignment.objects.filter(
+            course_id__in=course_ids, due_date__gte=now
+        ).order_by('due_date').values_list('course_id', 'title', 'due_date', 'max_marks')
+        for course_pk, title, due_date, max_marks in assignments:
+            rows[course_pk].append((title, due_date, max_marks))
+
+        digests = {}
+        for course_pk, assignments in rows.items():
+            lines = tuple(
+                f"{i}. {title}\n"
+                f"   Due: {due_date.strftime('%d %B %Y, %I:%M %p')}\n"
+                f"   Max Marks: {max_marks}\n\n"
+                for i, (title, due_date, max_marks) in enumerate(assignments[:self.MAX_ASSIGNMENT_LINES], 1)
+            )
+            data = tuple({'title': title, 'due_date': str(due_date)} for title, due_date, _ in assignments)
+            expires = assignments[0][1] if assignments else None
+            digests[course_pk] = AssignmentDigest(lines, data, expires)
+        return digests
+
+    def _build_exams(self, course_ids, now):
+        rows = {course_pk: [] for course_pk in course_ids}
+        quizzes = Quiz.objects.filter(course_id__in=course_ids, date__gte=now).order_by('date').values_list(
+            'course_id', 'title', 'date', 'duration_minutes'
+        )
+        for course_pk, title, date, duration_minutes in quizzes:
+            rows[course_pk].append((
+                f"• {title}\n"
+                f"  Date: {date.strftime('%d %B %Y, %I:%M %p')}\n"
+                f"  Duration: {duration_minutes} minutes\n\n",
+                date,
+            ))
+        return {
+            course_pk: ExamDigest(tuple(line for line, _ in lines), lines[0][1] if lines else None)
+            for course_pk, lines in rows.items()
+        }
+
+
+schedule_digests = ScheduleDigests.from_settings()
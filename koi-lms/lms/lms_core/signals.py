@@ -0,0 +1,224 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import generations, student_stats
+from .ai_engine import engine_bumped
+from .course_index import course_index
+from .kb_index import kb_index
+from .page_cache import page_cache
+from .models import (
+    Assignment, Course, Enrollment, Forum, Grade, IntentKeyword, KnowledgeBase, Quiz, ResponseTemplate, Student,
+    StudentStats,
+)
+from .response_cache import response_cache
+from .schedule_digest import schedule_digests
+
+
+# Stored fields of a row that its cache tags and student stats depend on
+SNAPSHOT_FIELDS = {
+    Course: ('course_code',),
+    Assignment: ('course_id',),
+    Quiz: ('course_id',),
+    Forum: ('course_id',),
+    Grade: student_stats.snapshot_fields(Grade),
+    Enrollment: student_stats.snapshot_fields(Enrollment),
+}
+
+
+def _snapshot(sender, instance):
+    return dict(zip(SNAPSHOT_FIELDS[sender], (getattr(instance, field) for field in SNAPSHOT_FIELDS[sender])))
+
+
+def _response_tags(sender, pk, values):
+    """Response cache tags that depend on a row with the given snapshot ``values``."""
+    if sender is Course:
+        return {('course', pk), ('course_code', values['course_code'])}
+    if sender in (Assignment, Quiz):
+        return {('course', values['course_id'])}
+    if sender is Grade:
+        return {('student', values['student_id'])}
+    return set()
+
+
+@receiver(pre_save, sender=Course)
+@receiver(pre_save, sender=Assignment)
+@receiver(pre_save, sender=Quiz)
+@receiver(pre_save, sender=Grade)
+@receiver(pre_save, sender=Enrollment)
+@receiver(pre_save, sender=Forum)
+def remember_previous_row(sender, instance, **kwargs):
+    # A row moved to another course or student must also drop the answers
+    # and pages cached for the one it left
+    row = None
+    if instance.pk:
+        row = sender.objects.filter(pk=instance.pk).values_list(*SNAPSHOT_FIELDS[sender]).first()
+    instance._previous_values = dict(zip(SNAPSHOT_FIELDS[sender], row)) if row else {}
+    if sender in (Grade, Enrollment):
+        student_stats.remember(instance, row)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=Quiz)
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=Grade)
+def invalidate_cached_responses(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_values', {})
+    tags = _response_tags(sender, instance.pk, _snapshot(sender, instance))
+    if previous:
+        tags |= _response_tags(sender, instance.pk, previous)
+    if sender is Course and previous and previous['course_code'] != instance.course_code:
+        # A renamed course code shows up in grade listings of any student
+        tags = {response_cache.EVERYTHING}
+        response_cache.clear()
+    else:
+        response_cache.invalidate(*tags)
+
+    def invalidate():
+        # Answers built by other threads before the commit saw the old rows,
+        # and other workers still hold theirs
+        if response_cache.EVERYTHING in tags:
+            response_cache.clear()
+        else:
+            response_cache.invalidate(*tags)
+        response_cache.publish(*tags)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    def refresh_index():
+        course_index.invalidate()
+        generations.bump(generations.COURSES)
+
+    transaction.on_commit(refresh_index)
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=Quiz)
+def schedule_changed(sender, instance, **kwargs):
+    kind = 'assignments' if sender is Assignment else 'exams'
+    course_pks = {instance.course_id, getattr(instance, '_previous_values', {}).get('course_id')} - {None}
+
+    def invalidate():
+        for course_pk in course_pks:
+            schedule_digests.invalidate(course_pk, kind)
+
+    invalidate()
+    # Digests built by other threads before the commit saw the old rows
+    transaction.on_commit(invalidate)
+    transaction.on_commit(lambda: schedule_digests.bumped(generations.bump(generations.SCHEDULES)))
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    # The student's preferred course offering may have moved to another term
+    student_pk = instance.student_id
+    course_index.invalidate_student(student_pk)
+    transaction.on_commit(lambda: course_index.invalidate_student(student_pk))
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Grade)
+@receiver(post_delete, sender=Enrollment)
+def student_pages_changed(sender, instance, **kwargs):
+    student_pks = (instance.student_id, getattr(instance, '_previous_values', {}).get('student_id'))
+    page_cache.bump('student', *student_pks)
+    # Pages built by other threads before the commit saw the old rows
+    transaction.on_commit(lambda: page_cache.bump('student', *student_pks))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=Quiz)
+@receiver(post_save, sender=Forum)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=Forum)
+def course_pages_changed(sender, instance, **kwargs):
+    if sender is Course:
+        course_pks = (instance.pk,)
+    else:
+        course_pks = (instance.course_id, getattr(instance, '_previous_values', {}).get('course_id'))
+    page_cache.bump('course', *course_pks)
+    transaction.on_commit(lambda: page_cache.bump('course', *course_pks))
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_changed(sender, instance, **kwargs):
+    user_pk, student_pk = instance.user_id, instance.pk
+
+    def forget():
+        page_cache.forget_student(user_pk)
+        page_cache.bump('student', student_pk)
+
+    forget()
+    transaction.on_commit(forget)
+
+
+@receiver(post_save, sender=Student)
+def student_created(sender, instance, created, **kwargs):
+    if created:
+        StudentStats.objects.get_or_create(student=instance)
+
+
+@receiver(pre_delete, sender=Grade)
+@receiver(pre_delete, sender=Enrollment)
+def remember_deleted_stats(sender, instance, **kwargs):
+    # Deleted instances hold their stored values already
+    student_stats.remember(instance, tuple(_snapshot(sender, instance).values()))
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_save, sender=Enrollment)
+def update_student_stats(sender, instance, **kwargs):
+    # Same transaction as the row itself, so a rollback undoes both
+    student_stats.apply_change(instance)
+
+
+@receiver(post_delete, sender=Grade)
+@receiver(post_delete, sender=Enrollment)
+def remove_from_student_stats(sender, instance, **kwargs):
+    student_stats.apply_change(instance, deleted=True)
+
+
+@receiver(post_save, sender=KnowledgeBase)
+def knowledge_base_saved(sender, instance, **kwargs):
+    def update_index():
+        kb_index.update(instance)
+        response_cache.invalidate(('kb',))
+        engine_bumped(generations.bump(generations.AI_ENGINE))
+
+    transaction.on_commit(update_index)
+
+
+@receiver(post_delete, sender=KnowledgeBase)
+def knowledge_base_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def update_index():
+        kb_index.remove(pk)
+        response_cache.invalidate(('kb',))
+        engine_bumped(generations.bump(generations.AI_ENGINE))
+
+    transaction.on_commit(update_index)
+
+
+@receiver(post_save, sender=ResponseTemplate)
+@receiver(post_save, sender=IntentKeyword)
+@receiver(post_delete, sender=ResponseTemplate)
+@receiver(post_delete, sender=IntentKeyword)
+def engine_data_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: generations.bump(generations.AI_ENGINE))
@@ -0,0 +1,494 @@
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+
+from .models import Query
+from .response_cache import ResponseCache
+
+# numpy, scipy, scikit-learn and joblib are imported inside the methods that
+# need them so that importing this module (and the app registry) stays cheap
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarQueryIndex:
+    """Nearest-neighbour search over the questions students already asked.
+
+    Resolved ``Query`` rows are deduplicated by their normalised text; each
+    distinct question keeps how often it was asked and its latest answer.
+    Questions are hashed into word unigram and bigram features weighted by
+    IDF, so new ones can be added without refitting a vocabulary, and kept
+    in a term-major matrix: a lookup only reads the postings of its own
+    features, skipping features shared by more than ``max_postings``
+    questions when rarer ones exist, then re-scores the best candidates
+    with the exact cosine similarity.
+
+    The index is built offline (``manage.py build_similar_queries``) and
+    persisted under ``AI_INDEX_DIR``; until it exists there are no
+    suggestions. A background thread of each worker then reads the rows
+    logged since, every ``refresh_interval`` seconds, into a small delta
+    segment that is merged into the main matrix once it holds ``delta_size``
+    questions.
+    """
+
+    FILENAME = 'similar_queries.joblib'
+
+    # Bumped when the persisted state layout changes
+    FORMAT = 1
+
+    N_FEATURES = 2 ** 20
+
+    WORD_PATTERN = re.compile(r'\w+')
+
+    # Separates the questions, answers and intents of the persisted lists
+    SEPARATOR = '\0'
+
+    # Answers to these intents are about the student who asked: their grades,
+    # or the deadlines and exams of their own courses when none is named
+    PRIVATE_INTENTS = ResponseCache.STUDENT_SCOPED_INTENTS | {'assignment_deadline', 'exam_schedule'}
+
+    # Rows read per refresh, so a worker that fell behind catches up gradually
+    REFRESH_BATCH = 10000
+
+    def __init__(self, path=None, limit=3, min_score=0.35, min_asked=2, refresh_interval=30.0,
+                 max_postings=10000, delta_size=5000):
+        self.path = Path(path) if path else None
+        self.limit = limit
+        self.min_score = min_score
+        self.min_asked = min_asked
+        self.refresh_interval = refresh_interval
+        self.max_postings = max_postings
+        self.delta_size = delta_size
+        self._vectorizer = None
+        self._state = None
+        self._loaded_at = None
+        self._refresher_pid = None
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'AI_SIMILAR_QUERIES', {})
+        return cls(
+            limit=options.get('LIMIT', 3),
+            min_score=options.get('MIN_SCORE', 0.35),
+            min_asked=options.get('MIN_ASKED', 2),
+            refresh_interval=options.get('REFRESH_INTERVAL', 30.0),
+            max_postings=options.get('MAX_POSTINGS', 10000),
+            delta_size=options.get('DELTA_SIZE', 5000),
+        )
+
+    @classmethod
+    def normalize(cls, query_text):
+        return ' '.join(cls.WORD_PATTERN.findall(query_text.lower()))
+
+    def get_path(self):
+        if self.path:
+            return self.path
+        index_dir = getattr(settings, 'AI_INDEX_DIR', settings.BASE_DIR / 'ai_index')
+        return Path(index_dir) / self.FILENAME
+
+    def _hash(self, texts):
+        """Raw term counts of ``texts`` as a CSR matrix of hashed features."""
+        if self._vectorizer is None:
+            import numpy as np
+            from sklearn.feature_extraction.text import HashingVectorizer
+
+            self._vectorizer = HashingVectorizer(
+                # Single characters too: "Assignment 2" and "Assignment 3" differ
+                n_features=self.N_FEATURES, ngram_range=(1, 2), stop_words='english', token_pattern=r'(?u)\b\w+\b',
+                alternate_sign=False, norm=None, dtype=np.float32,
+            )
+        return self._vectorizer.transform(texts)
+
+    @staticmethod
+    def _idf(df, n_docs, features):
+        import numpy as np
+
+        return np.log((1 + n_docs) / (1 + df[features])) + 1
+
+    def _weigh(self, counts, df, n_docs):
+        """IDF-weight and L2-normalise hashed term counts, row by row."""
+        import numpy as np
+        from sklearn.preprocessing import normalize
+
+        weighted = counts.tocsr(copy=True)
+        weighted.data *= self._idf(df, n_docs, weighted.indices).astype(np.float32)
+        return normalize(weighted, copy=False)
+
+    def _empty_state(self):
+        import numpy as np
+        from scipy import sparse
+
+        docs = sparse.csr_matrix((0, self.N_FEATURES), dtype=np.float32)
+        return {
+            'format': self.FORMAT,
+            'texts': [],
+            'intents': [],
+            'answers': [],
+            'counts': [],
+            'keys': {},
+            'docs': docs,
+            'postings': docs.T.tocsr(),
+            'df': np.zeros(self.N_FEATURES, dtype=np.int32),
+            'n_docs': 0,
+            'last_pk': 0,
+            'delta': [],
+            'delta_postings': {},
+        }
+
+    def build(self, batch_size=5000):
+        """Rebuild the index from every resolved Query and persist it."""
+        import numpy as np
+
+        state = self._empty_state()
+        rows = Query.objects.filter(status='Resolved').order_by('pk').values_list(
+            'pk', 'query_text', 'intent', 'response_text'
+        )
+        for pk, query_text, intent, response_text in rows.iterator(chunk_size=batch_size):
+            self._count(state, query_text, intent, response_text)
+            state['last_pk'] = pk
+
+        counts = self._hash(state['texts']) if state['texts'] else state['docs']
+        df = np.bincount(counts.indices, minlength=self.N_FEATURES).astype(np.int32)
+        state['docs'] = self._weigh(counts, df, len(state['texts']))
+        state['postings'] = state['docs'].T.tocsr()
+        state['df'] = df
+        state['n_docs'] = len(state['texts'])
+
+        self._save(state)
+        with self._lock:
+            self._state = state
+        return state
+
+    def _count(self, state, query_text, intent, response_text):
+        """Record one asked question; returns its id when it is a new question."""
+        key = self.normalize(query_text)
+        if not key:
+            return None
+        idx = state['keys'].get(key)
+        if idx is not None:
+            state['counts'][idx] += 1
+            state['intents'][idx] = intent
+            if response_text:
+                state['answers'][idx] = response_text.replace(self.SEPARATOR, '')
+            return None
+
+        idx = state['keys'][key] = len(state['texts'])
+        state['texts'].append(' '.join(query_text.replace(self.SEPARATOR, '').split()))
+        state['intents'].append(intent)
+        state['answers'].append(response_text.replace(self.SEPARATOR, '') if response_text else '')
+        state['counts'].append(1)
+        return idx
+
+    def _save(self, state):
+        import joblib
+        import numpy as np
+
+        keys = [None] * len(state['texts'])
+        for key, idx in state['keys'].items():
+            keys[idx] = key
+        # Pickling a million small strings one by one is slow, one joined string is not
+        persisted = {
+            'format': self.FORMAT,
+            'texts': self.SEPARATOR.join(state['texts']),
+            'intents': self.SEPARATOR.join(state['intents']),
+            'answers': self.SEPARATOR.join(state['answers']),
+            'keys': self.SEPARATOR.join(keys),
+            'counts': np.array(state['counts'], dtype=np.int64),
+            'docs': state['docs'],
+            'postings': state['postings'],
+            'df': state['df'],
+            'n_docs': state['n_docs'],
+            'last_pk': state['last_pk'],
+        }
+        path = self.get_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+            joblib.dump(persisted, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not persist similar query index to %s: %s", path, e)
+
+    def _load(self):
+        import joblib
+
+        path = self.get_path()
+        try:
+            state = joblib.load(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Discarding unreadable similar query index %s: %s", path, e)
+            return None
+        if state.get('format') != self.FORMAT:
+            return None
+        for name in ('texts', 'intents', 'answers', 'keys'):
+            state[name] = state[name].split(self.SEPARATOR) if state[name] or state['counts'].size else []
+        state['keys'] = {key: idx for idx, key in enumerate(state['keys'])}
+        state['counts'] = state['counts'].tolist()
+        state['delta'] = []
+        state['delta_postings'] = {}
+        # Questions added after the last merge were saved without their vectors
+        self._append_delta(state, range(state['n_docs'], len(state['texts'])))
+        return state
+
+    def ensure(self):
+        """Return the current state, loading it on first use; None while there is no index.
+
+        A missing index is looked for again every ``refresh_interval`` seconds.
+        """
+        state = self._state
+        if state is None:
+            with self._lock:
+                now = time.monotonic()
+                if self._state is None and (self._loaded_at is None or now - self._loaded_at >= self.refresh_interval):
+                    self._loaded_at = now
+                    self._state = self._load()
+                    if self._state is None:
+                        logger.warning(
+                            "No similar query index at %s, run manage.py build_similar_queries", self.get_path()
+                        )
+                state = self._state
+        if state is not None:
+            self._start_refresher()
+        return state
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+            self._loaded_at = None
+
+    def _start_refresher(self):
+        # (Re)started after fork, where the thread is gone
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher_pid = os.getpid()
+            threading.Thread(target=self._run, name='similar-queries', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                # Everything logged since the index was saved, a batch at a time
+                while self.refresh() == self.REFRESH_BATCH:
+                    pass
+            except DatabaseError as e:
+                logger.warning("Could not refresh the similar query index: %s", e)
+                close_old_connections()
+            time.sleep(self.refresh_interval)
+
+    def refresh(self):
+        """Add the resolved queries logged since the index was last updated.
+
+        Reads at most ``REFRESH_BATCH`` rows and returns how many it read.
+        """
+        state = self._state
+        if state is None:
+            return 0
+        rows = list(
+            Query.objects.filter(status='Resolved', pk__gt=state['last_pk']).order_by('pk').values_list(
+                'pk', 'query_text', 'intent', 'response_text'
+            )[:self.REFRESH_BATCH]
+        )
+        if rows:
+            self.add_many(rows)
+        return len(rows)
+
+    def add_many(self, rows):
+        """Add ``[(pk, query_text, intent, response_text), ...]`` to the delta segment."""
+        with self._lock:
+            state = self._state
+            new = []
+            for pk, query_text, intent, response_text in rows:
+                if pk <= state['last_pk']:
+                    continue
+                idx = self._count(state, query_text, intent, response_text)
+                if idx is not None:
+                    new.append(idx)
+                state['last_pk'] = pk
+            self._append_delta(state, new)
+            merge = len(state['delta']) >= self.delta_size
+        if merge:
+            self.merge()
+
+    def _append_delta(self, state, ids):
+        """Vectorise new questions into the delta segment (ids follow the main matrix)."""
+        import numpy as np
+
+        ids = list(ids)
+        if not ids:
+            return
+        vectors = self._weigh(self._hash([state['texts'][idx] for idx in ids]), state['df'], state['n_docs'])
+        for row, idx in enumerate(ids):
+            start, end = vectors.indptr[row], vectors.indptr[row + 1]
+            entry = (idx, vectors.indices[start:end].astype(np.int64), vectors.data[start:end])
+            state['delta'].append(entry)
+            self._index_delta(state['delta_postings'], entry)
+
+    @staticmethod
+    def _index_delta(delta_postings, entry):
+        idx, features, weights = entry
+        for feature, weight in zip(features.tolist(), weights.tolist()):
+            delta_postings.setdefault(feature, []).append((idx, weight))
+
+    def merge(self):
+        """Fold the delta segment into the main matrix and persist the result."""
+        import numpy as np
+        from scipy import sparse
+
+        if not self._merge_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                state = self._state
+                delta = list(state['delta'])
+                docs, df, n_docs = state['docs'], state['df'], state['n_docs']
+            if not delta:
+                return
+
+            # Rows are built outside the lock; lookups keep using the old matrices
+            indptr = np.zeros(len(delta) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(features) for _, features, _ in delta])
+            indices = np.concatenate([features for _, features, _ in delta]).astype(np.int32)
+            data = np.concatenate([weights for _, _, weights in delta]).astype(np.float32)
+            rows = sparse.csr_matrix((data, indices, indptr), shape=(len(delta), self.N_FEATURES))
+            merged_docs = sparse.vstack([docs, rows], format='csr')
+            merged_df = df + np.bincount(indices, minlength=self.N_FEATURES).astype(np.int32)
+            postings = merged_docs.T.tocsr()
+
+            with self._lock:
+                if self._state is not state:
+                    # Rebuilt or invalidated meanwhile
+                    return
+                remaining = state['delta'][len(delta):]
+                delta_postings = {}
+                for entry in remaining:
+                    self._index_delta(delta_postings, entry)
+                state.update({
+                    'docs': merged_docs,
+                    'postings': postings,
+                    'df': merged_df,
+                    'n_docs': n_docs + len(delta),
+                    'delta': remaining,
+                    'delta_postings': delta_postings,
+                })
+                # Copies, so that questions added while saving don't change it
+                snapshot = dict(state, texts=list(state['texts']), intents=list(state['intents']),
+                                answers=list(state['answers']), counts=list(state['counts']),
+                                keys=dict(state['keys']))
+            self._save(snapshot)
+        finally:
+            self._merge_lock.release()
+
+    def similar(self, query_text, limit=None):
+        """Questions like ``query_text`` that others asked, best first.
+
+        Returns ``[{'query_text', 'intent', 'response', 'asked', 'score'}, ...]``
+        without the question itself and without answers about one student.
+        """
+        import numpy as np
+
+        limit = self.limit if limit is None else limit
+        state = self.ensure()
+        key = self.normalize(query_text)
+        if state is None or not key or not state['texts'] or limit <= 0:
+            return []
+
+        counts = self._hash([query_text])
+        if not counts.nnz:
+            return []
+        with self._lock:
+            # One row: weighing it by hand avoids the overhead of sparse operations
+            order = np.argsort(counts.indices)
+            features = counts.indices[order].astype(np.int64)
+            weights = counts.data[order] * self._idf(state['df'], state['n_docs'], features)
+            weights /= np.sqrt((weights ** 2).sum())
+
+            scores = self._score_main(state, features, weights, limit * 10)
+            for feature, weight in zip(features.tolist(), weights.tolist()):
+                for idx, doc_weight in state['delta_postings'].get(feature, ()):
+                    scores[idx] = scores.get(idx, 0.0) + weight * doc_weight
+
+            results = []
+            for idx, score in sorted(scores.items(), key=lambda item: -item[1]):
+                if score < self.min_score or len(results) >= limit:
+                    break
+                # A score of 1 is the asked question itself, give or take stop words
+                if (state['counts'][idx] < self.min_asked or state['intents'][idx] in self.PRIVATE_INTENTS
+                        or score > 0.999 or self.normalize(state['texts'][idx]) == key):
+                    continue
+                results.append({
+                    'query_text': state['texts'][idx],
+                    'intent': state['intents'][idx],
+                    'response': state['answers'][idx],
+                    'asked': state['counts'][idx],
+                    'score': round(min(score, 1.0), 4),
+                })
+            return results
+
+    def _score_main(self, state, features, weights, k):
+        """Exact cosine similarity of the ``k`` best main-segment candidates.
+
+        ``features`` are the query's sorted feature ids and ``weights`` its
+        normalised weights.
+        """
+        import numpy as np
+
+        postings = state['postings']
+        if not postings.nnz:
+            return {}
+        lengths = postings.indptr[features + 1] - postings.indptr[features]
+        present = lengths > 0
+        if not present.any():
+            return {}
+
+        selective = present & (lengths <= self.max_postings)
+        if selective.any():
+            chosen = np.flatnonzero(selective)
+        else:
+            # Every feature is common: take the rarest one's first postings
+            chosen = [int(np.argmin(np.where(present, lengths, lengths.max() + 1)))]
+
+        candidates, partial = [], []
+        for position in chosen:
+            start = postings.indptr[features[position]]
+            end = min(postings.indptr[features[position] + 1], start + self.max_postings)
+            candidates.append(postings.indices[start:end])
+            partial.append(postings.data[start:end] * weights[position])
+        candidates = np.concatenate(candidates)
+        partial = np.concatenate(partial)
+
+        if len(candidates) * 8 > state['n_docs']:
+            totals = np.bincount(candidates, weights=partial)
+            ids = np.flatnonzero(totals)
+            totals = totals[ids]
+        else:
+            ids, positions = np.unique(candidates, return_inverse=True)
+            totals = np.bincount(positions, weights=partial)
+        if len(ids) > k:
+            best = np.argpartition(-totals, k)[:k]
+            ids = ids[best]
+
+        # Features skipped above still count towards the final score
+        docs = state['docs']
+        scores = {}
+        for idx in ids.tolist():
+            start, end = docs.indptr[idx], docs.indptr[idx + 1]
+            doc_features = docs.indices[start:end]
+            positions = np.minimum(np.searchsorted(features, doc_features), len(features) - 1)
+            shared = features[positions] == doc_features
+            scores[idx] = float((docs.data[start:end][shared] * weights[positions[shared]]).sum())
+        return scores
+
+
+similar_queries = SimilarQueryIndex.from_settings()
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One in-progress computation that other callers can wait for."""
+
+    def __init__(self, remote=False):
+        self.event = threading.Event()
+        self.result = None
+        # Another worker holds the shared lock; the answer arrives through the cache
+        self.remote = remote
+        self.polling = False
+
+
+class SingleFlight:
+    """Coalesces concurrent computations of the same key.
+
+    The first caller for a key becomes its leader and computes the result;
+    callers arriving while it runs wait for that result instead of repeating
+    the work. Across worker processes the leader can also take a lock in a
+    shared Django cache (``shared_cache``, e.g. Redis or Memcached) and
+    publish its result there, so leaders in other workers wait for it too.
+
+    Usage::
+
+        flight, leader = flights.begin(key)
+        if leader:
+            try:
+                result = compute()
+            finally:
+                flights.finish(key, flight, result)
+        else:
+            result = flights.wait(key, flight)  # None: compute it yourself
+    """
+
+    def __init__(self, wait_timeout=10.0, shared_cache=None, lock_timeout=10.0,
+                 result_ttl=10.0, poll_interval=0.05):
+        self.wait_timeout = wait_timeout
+        self.shared_cache = shared_cache
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'AI_SINGLE_FLIGHT', {})
+        return cls(
+            wait_timeout=options.get('WAIT_TIMEOUT', 10.0),
+            shared_cache=options.get('SHARED_CACHE'),
+            lock_timeout=options.get('LOCK_TIMEOUT', 10.0),
+            result_ttl=options.get('RESULT_TTL', 10.0),
+            poll_interval=options.get('POLL_INTERVAL', 0.05),
+        )
+
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.shared_cache]
+
+    @staticmethod
+    def _cache_key(key, kind):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return f'lms:flight:{kind}:{digest}'
+
+    def begin(self, key):
+        """Return ``(flight, is_leader)`` for ``key``."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+
+        if self.shared_cache and not self._acquire_shared(key):
+            # Another worker computes it; this thread waits for its answer on
+            # behalf of every local caller
+            flight.remote = True
+            return flight, False
+        return flight, True
+
+    def finish(self, key, flight, result):
+        """Publish the leader's ``result`` (None when it failed) to the waiters."""
+        if self.shared_cache and not flight.remote:
+            try:
+                cache = self._cache()
+                if result is not None:
+                    cache.set(self._cache_key(key, 'result'), result, self.result_ttl)
+                cache.delete(self._cache_key(key, 'lock'))
+            except Exception as e:
+                logger.warning("Could not publish a coalesced AI response: %s", e)
+        self._publish(key, flight, result)
+
+    def wait(self, key, flight, timeout=None):
+        """Wait for the leader's result; None if it failed or took too long."""
+        timeout = self.wait_timeout if timeout is None else timeout
+        if flight.remote and not flight.event.is_set():
+            with self._lock:
+                # Only the first local waiter polls the shared cache
+                polling = not flight.polling
+                flight.polling = True
+            if polling:
+                self._publish(key, flight, self._poll_shared(key, timeout))
+        if not flight.event.wait(timeout):
+            return None
+        return flight.result
+
+    def _publish(self, key, flight, result):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.result = result
+        flight.event.set()
+
+    def _acquire_shared(self, key):
+        try:
+            return self._cache().add(self._cache_key(key, 'lock'), 1, self.lock_timeout)
+        except Exception as e:
+            logger.warning("Shared single-flight lock unavailable, computing locally: %s", e)
+            return True
+
+    def _poll_shared(self, key, timeout):
+        cache = self._cache()
+        result_key, lock_key = self._cache_key(key, 'result'), self._cache_key(key, 'lock')
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                result = cache.get(result_key)
+                if result is not None:
+                    return result
+                if cache.get(lock_key) is None:
+                    # The other worker gave up without an answer
+                    return cache.get(result_key)
+            except Exception as e:
+                logger.warning("Could not read a coalesced AI response: %s", e)
+                return None
+            time.sleep(self.poll_interval)
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._flights), 'coalesced': self.coalesced}
+
+
+single_flight = SingleFlight.from_settings()
@@ -33,8 +33,159 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     });
+    
+    // Stream AI Assistant answers instead of waiting for the whole page
+    const queryForm = document.getElementById('ai-query-form');
+    if (queryForm && window.fetch && window.ReadableStream && window.TextDecoder) {
+        queryForm.addEventListener('submit', function(e) {
+            const queryText = queryForm.querySelector('textarea[name="query_text"]').value.trim();
+            if (!queryText) return;
+            e.preventDefault();
+            streamAnswer(queryForm, queryText);
+        });
+    }
+    
+    // Load the next rows of long lists as the student scrolls
+    document.querySelectorAll('[data-load-more]').forEach(setupLoadMore);
 });
 
+// Fetch the next keyset page of a list when its "Load more" marker comes into view
+function setupLoadMore(marker) {
+    const target = document.getElementById(marker.dataset.target);
+    const link = marker.querySelector('a');
+    let loading = false;
+    let observer = null;
+    
+    async function loadMore() {
+        if (loading || !marker.dataset.cursor) return;
+        loading = true;
+        try {
+            const url = marker.dataset.url + '?cursor=' + encodeURIComponent(marker.dataset.cursor);
+            const response = await fetch(url, {headers: {'Accept': 'application/json'}});
+            const data = await response.json();
+            if (!response.ok || !data.success) throw new Error(data.error || response.statusText);
+            
+            target.insertAdjacentHTML('beforeend', data.html);
+            if (!data.next_cursor) {
+                if (observer) observer.disconnect();
+                marker.remove();
+                return;
+            }
+            marker.dataset.cursor = data.next_cursor;
+            link.href = '?cursor=' + encodeURIComponent(data.next_cursor);
+            if (observer) {
+                // Fires again right away if the marker is still in view
+                observer.unobserve(marker);
+                observer.observe(marker);
+            }
+        } catch (error) {
+            // The link still opens the next page the plain way
+            console.error('Could not load more rows:', error);
+            if (observer) observer.disconnect();
+            link.removeEventListener('click', onClick);
+        } finally {
+            loading = false;
+        }
+    }
+    
+    function onClick(e) {
+        e.preventDefault();
+        loadMore();
+    }
+    
+    if (!target || !link || !window.fetch) return;
+    link.addEventListener('click', onClick);
+    if ('IntersectionObserver' in window) {
+        observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadMore();
+        }, {rootMargin: '200px'});
+        observer.observe(marker);
+    }
+}
+
+// Send a query to the streaming API and render the answer as it arrives
+async function streamAnswer(form, queryText) {
+    const card = document.getElementById('ai-stream-card');
+    const responseText = document.getElementById('ai-stream-response');
+    const intentLabel = document.getElementById('ai-stream-intent');
+    const confidenceBadge = document.getElementById('ai-stream-confidence');
+    const submitButton = form.querySelector('button[type="submit"]');
+    
+    let response;
+    try {
+        response = await fetch(form.dataset.streamUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': form.querySelector('[name="csrfmiddlewaretoken"]').value
+            },
+            body: JSON.stringify({query: queryText})
+        });
+    } catch (error) {
+        form.submit();
+        return;
+    }
+    if (!response.ok || !(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+        // Fall back to the regular form post
+        form.submit();
+        return;
+    }
+    
+    ['ai-response-card', 'ai-suggestions-card', 'ai-stream-suggestions'].forEach(id => {
+        const previous = document.getElementById(id);
+        if (previous) previous.classList.add('d-none');
+    });
+    document.getElementById('ai-stream-query').textContent = queryText;
+    responseText.textContent = '';
+    intentLabel.textContent = '';
+    confidenceBadge.textContent = 'Answering\u2026';
+    card.classList.remove('d-none');
+    submitButton.disabled = true;
+    
+    const handlers = {
+        intent: data => { intentLabel.textContent = data.intent; },
+        chunk: data => { responseText.textContent += data.text; },
+        done: data => {
+            intentLabel.textContent = data.intent;
+            confidenceBadge.textContent = `Confidence: ${Math.round(data.confidence * 100)}%`;
+            showSuggestions(data.suggestions || []);
+            form.reset();
+        },
+        error: data => {
+            responseText.textContent = `Sorry, something went wrong: ${data.error}`;
+            confidenceBadge.textContent = 'Error';
+        }
+    };
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    try {
+        while (true) {
+            const {done, value} = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, {stream: true});
+            // Messages are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let data = '';
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                if (handlers[event] && data) handlers[event](JSON.parse(data));
+            }
+        }
+    } catch (error) {
+        handlers.error({error: 'the connection was interrupted'});
+    } finally {
+        submitButton.disabled = false;
+    }
+}
+
 // Function to format dates
 function formatDate(dateString) {
     const date = new Date(dateString);
@@ -57,3 +208,37 @@ function getTimeRemaining(deadline) {
     if (hours > 0) return `${hours} hour${hours > 1 ? 's' : ''} remaining`;
     return 'Due soon';
 }
+
+// Render "students also asked" entries sent with a streamed answer
+function showSuggestions(suggestions) {
+    const card = document.getElementById('ai-stream-suggestions');
+    const list = document.getElementById('ai-stream-suggestions-list');
+    list.replaceChildren();
+    suggestions.forEach(suggestion => {
+        const item = document.createElement('div');
+        item.className = 'list-group-item';
+        const badge = document.createElement('span');
+        badge.className = 'badge bg-secondary float-end';
+        badge.textContent = `Asked ${suggestion.asked} times`;
+        const question = document.createElement('p');
+        question.className = 'mb-1';
+        const strong = document.createElement('strong');
+        strong.textContent = suggestion.query_text;
+        question.appendChild(strong);
+        item.append(badge, question);
+        if (suggestion.response) {
+            const details = document.createElement('details');
+            const summary = document.createElement('summary');
+            summary.className = 'small text-muted';
+            summary.textContent = 'Show answer';
+            const answer = document.createElement('div');
+            answer.className = 'small mt-2';
+            answer.style.whiteSpace = 'pre-line';
+            answer.textContent = suggestion.response;
+            details.append(summary, answer);
+            item.appendChild(details);
+        }
+        list.appendChild(item);
+    });
+    card.classList.toggle('d-none', suggestions.length === 0);
+}
@@ -0,0 +1,227 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When, Window,
+)
+from django.db.models.functions import Round, RowNumber
+
+from .models import Enrollment, Grade, Student, StudentStats
+
+ENROLLMENT_STATUSES = ('Enrolled', 'Completed', 'Failed', 'Withdrawn')
+
+# StudentStats counter of each status; other statuses only count towards total_courses
+STATUS_FIELDS = {status: f'{status.lower()}_count' for status in ENROLLMENT_STATUSES}
+
+COUNTER_FIELDS = ('grade_count', 'grade_total', 'total_courses', *STATUS_FIELDS.values(), 'gpa_points', 'gpa_courses')
+
+
+def grade_points(percentage):
+    """GPA points of a course percentage (HD 4.0, D 3.5, C 3.0, P 2.0, F 0).
+
+    Every course counts the same towards the GPA for now, so the GPA is the
+    mean of the points of the completed courses.
+    """
+    if percentage >= 85:
+        return 4.0
+    if percentage >= 75:
+        return 3.5
+    if percentage >= 65:
+        return 3.0
+    if percentage >= 50:
+        return 2.0
+    return 0.0
+
+
+def _points(completed, latest):
+    """GPA points of a course from whether it is completed and its latest ``(graded_date, pk, percentage)``."""
+    return Decimal(grade_points(latest[2])) if completed and latest else None
+
+
+def _course_grades(student_pk, course_pk, limit):
+    """The course's ``limit`` latest ``(graded_date, pk, percentage)`` and whether it is completed.
+
+    Completion is read along with the grades; for a course without grades,
+    whose GPA points are None either way, it is False.
+    """
+    completed = Enrollment.objects.filter(student_id=student_pk, course_id=course_pk, status='Completed')
+    rows = list(
+        Grade.objects.filter(student_id=student_pk, course_id=course_pk)
+        .annotate(completed=Exists(completed))
+        .order_by('-graded_date', '-pk')
+        .values_list('graded_date', 'pk', 'percentage', 'completed')[:limit]
+    )
+    return bool(rows and rows[0][3]), [row[:3] for row in rows]
+
+
+def _value_field(model):
+    return 'percentage' if model is Grade else 'status'
+
+
+def snapshot_fields(model):
+    """Fields of a stored Grade or Enrollment row that remember() needs."""
+    return ('student_id', 'course_id', _value_field(model))
+
+
+def remember(instance, row):
+    """Snapshot what a Grade or Enrollment adds to the stats before it is saved or deleted.
+
+    ``row`` holds the stored values of ``snapshot_fields()``, None for a new
+    row. Along with it go the latest grades of the one or two courses
+    involved: two of them for a Grade, so the latest is still known if this
+    one stops being it, and one for an Enrollment, which only changes
+    whether the course is completed.
+    """
+    pairs = {(instance.student_id, instance.course_id)}
+    if row:
+        pairs.add(row[:2])
+    limit = 2 if type(instance) is Grade else 1
+    instance._stats_before = row, {pair: _course_grades(*pair, limit) for pair in pairs}
+
+
+def _gpa_change(model, instance, grades_before, deleted):
+    """``{(student pk, course pk): (points before, points after)}`` of the courses involved."""
+    after_pair = None if deleted else (instance.student_id, instance.course_id)
+    changes = {}
+    for pair, (completed, latest) in grades_before.items():
+        old = _points(completed, latest[0] if latest else None)
+        if model is Grade:
+            # A course without grades read False; a first grade needs the real status
+            if not latest and pair == after_pair:
+                completed = Enrollment.objects.filter(
+                    student_id=pair[0], course_id=pair[1], status='Completed'
+                ).exists()
+            latest = [grade for grade in latest if grade[1] != instance.pk]
+            if pair == after_pair:
+                latest.append((instance.graded_date, instance.pk, instance.percentage))
+            new = _points(completed, max(latest) if latest else None)
+        else:
+            new = _points(pair == after_pair and instance.status == 'Completed', latest[0] if latest else None)
+        changes[pair] = old, new
+    return changes
+
+
+def _add_row(model, row, sign, deltas):
+    student_pk, _, value = row
+    counters = deltas[student_pk]
+    if model is Grade:
+        counters['grade_count'] += sign
+        counters['grade_total'] += sign * Decimal(str(value))
+    else:
+        counters['total_courses'] += sign
+        if value in STATUS_FIELDS:
+            counters[STATUS_FIELDS[value]] += sign
+
+
+def apply_change(instance, deleted=False):
+    """Move the stats of the students a saved or deleted row belongs to (and belonged to).
+
+    Counts, totals and the GPA change by the old and new row and the latest
+    grades remember() read before the save; only the first grade of a
+    course reads whether it is completed. Rows
+    changed by ``bulk_create()`` or ``update()`` send no signals, and a
+    ``QuerySet.delete()`` of several grades of one course snapshots them all
+    before any is gone, so ``rebuild_student_stats`` puts everything right
+    after bulk changes.
+    """
+    model = type(instance)
+    before, grades_before = getattr(instance, '_stats_before', (None, {}))
+    deltas = defaultdict(Counter)
+    if before:
+        _add_row(model, before, -1, deltas)
+    if not deleted:
+        _add_row(model, (instance.student_id, instance.course_id, getattr(instance, _value_field(model))), 1, deltas)
+
+    for (student_pk, _), (old, new) in _gpa_change(model, instance, grades_before, deleted).items():
+        if new != old:
+            counters = deltas[student_pk]
+            counters['gpa_points'] += (new or 0) - (old or 0)
+            counters['gpa_courses'] += (new is not None) - (old is not None)
+
+    for student_pk, counters in deltas.items():
+        changes = {field: F(field) + delta for field, delta in counters.items() if delta}
+        # Students without a row yet get one built from scratch by stats_for()
+        if changes and StudentStats.objects.filter(student_id=student_pk).update(**changes):
+            if 'gpa_points' in changes or 'gpa_courses' in changes:
+                sync_gpa(student_pk)
+
+
+def _stored_gpa():
+    """``Student.gpa`` computed from the student's StudentStats row, for ``update()``."""
+    gpa = Case(
+        When(gpa_courses=0, then=Value(Decimal(0))),
+        default=Round(ExpressionWrapper(F('gpa_points') / F('gpa_courses'), output_field=DecimalField()), 2),
+        output_field=DecimalField(),
+    )
+    return Subquery(StudentStats.objects.filter(student_id=OuterRef('pk')).annotate(gpa=gpa).values('gpa')[:1])
+
+
+def sync_gpa(student_pk):
+    """Copy the student's computed GPA into ``Student.gpa`` in one query."""
+    Student.objects.filter(pk=student_pk).update(gpa=_stored_gpa())
+
+
+def rebuild(student_pks=None, batch_size=1000):
+    """Recompute the stats and ``Student.gpa`` of ``student_pks`` (every student when None).
+
+    Three grouped queries read the totals of all the students at once; the
+    rows are then upserted in batches. Returns the number of students.
+    """
+    def scoped(queryset):
+        return queryset if student_pks is None else queryset.filter(student_id__in=student_pks)
+
+    students = Student.objects.all() if student_pks is None else Student.objects.filter(pk__in=student_pks)
+    stats = {pk: StudentStats(student_id=pk) for pk in students.values_list('pk', flat=True)}
+
+    grades = scoped(Grade.objects).values('student_id').annotate(count=Count('pk'), total=Sum('percentage')).order_by()
+    for row in grades:
+        if row['student_id'] in stats:
+            stats[row['student_id']].grade_count = row['count']
+            stats[row['student_id']].grade_total = row['total'] or 0
+
+    enrollments = scoped(Enrollment.objects).values('student_id').annotate(
+        total=Count('pk'),
+        **{field: Count('pk', filter=Q(status=status)) for status, field in STATUS_FIELDS.items()}
+    ).order_by()
+    for row in enrollments:
+        if row['student_id'] in stats:
+            stats[row['student_id']].total_courses = row['total']
+            for field in STATUS_FIELDS.values():
+                setattr(stats[row['student_id']], field, row[field])
+
+    completed = Enrollment.objects.filter(
+        student_id=OuterRef('student_id'), course_id=OuterRef('course_id'), status='Completed'
+    )
+    latest = (
+        scoped(Grade.objects).filter(Exists(completed))
+        .annotate(course_rank=Window(
+            RowNumber(),
+            partition_by=[F('student_id'), F('course_id')],
+            order_by=[F('graded_date').desc(), F('pk').desc()],
+        ))
+        .filter(course_rank=1)
+        .values_list('student_id', 'percentage')
+    )
+    for student_pk, percentage in latest:
+        if student_pk in stats:
+            stats[student_pk].gpa_points += Decimal(grade_points(percentage))
+            stats[student_pk].gpa_courses += 1
+
+    with transaction.atomic():
+        StudentStats.objects.bulk_create(
+            stats.values(), batch_size=batch_size,
+            update_conflicts=True, unique_fields=['student'], update_fields=COUNTER_FIELDS,
+        )
+        # Rounded by the database like sync_gpa(), so both agree
+        students.update(gpa=_stored_gpa())
+    return len(stats)
+
+
+def stats_for(student):
+    """The student's StudentStats row, built from the raw rows if it does not exist yet."""
+    stats = StudentStats.objects.filter(student=student).first()
+    if stats is None:
+        rebuild([student.pk])
+        stats = StudentStats.objects.get(student=student)
+    return stats
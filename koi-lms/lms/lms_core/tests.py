@@ -1,3 +1,1273 @@
-from django.test import TestCase
+import asyncio
+import base64
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import ai_engine, generations, views
+from .admission import AdmissionController, Shed, admission
+from .ai_engine import AIQueryEngine, get_engine
+from .course_index import course_index
+from .dashboard import dashboard_data
+from .engine_pool import EngineBusy, EnginePool, EngineTimeout
+from .id_allocator import IdAllocator
+from .instrumentation import latency_recorder
+from .intent_classifier import IntentClassifier
+from .intent_matcher import KeywordMatcher
+from .kb_index import KnowledgeBaseIndex, kb_index
+from .keyword_stats import KeywordStats, keyword_stats
+from .models import (
+    Assignment, Course, EngineGeneration, Enrollment, Grade, IntentKeyword, KeywordLookupDay, KeywordStat,
+    KnowledgeBase, Query, Quiz, ResponseTemplate, Student, StudentStats,
+)
+from .query_log import QueryLog
+from .response_cache import ResponseCache, response_cache
+from .schedule_digest import ScheduleDigests, schedule_digests
+from .similar_queries import SimilarQueryIndex
+from .single_flight import SingleFlight
+from .student_stats import COUNTER_FIELDS, rebuild
+
+
+class StudentDataMixin:
+    """A student with ``add_enrollments(n)`` more courses, assignments and grades."""
+
+    STATUSES = ['Enrolled', 'Completed', 'Failed', 'Withdrawn']
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('student', password='secret', first_name='Sam', last_name='Lee')
+        self.student = Student.objects.create(user=self.user, student_id='KOI900001', program='IT')
+        self.courses = 0
+
+    def add_enrollments(self, count):
+        now = timezone.now()
+        for _ in range(count):
+            self.courses += 1
+            n = self.courses
+            course = Course.objects.create(
+                course_id=f'C{n:03d}', course_code=f'TEST{100 + n}', course_name=f'Test Course {n}',
+                instructor='Dr Test', term='T1 2025', level=1, credits=3, department='IT',
+                start_date=date(2025, 2, 1), end_date=date(2025, 6, 1), description='',
+            )
+            status = self.STATUSES[(n - 1) % len(self.STATUSES)]
+            Enrollment.objects.create(
+                enrollment_id=f'ENR9{n:05d}', student=self.student, course=course,
+                enrollment_date=date(2025, 1, 1) + timedelta(days=n), status=status,
+            )
+            for a in range(4):
+                Assignment.objects.create(
+                    assignment_id=f'A{n:03d}{a}', course=course, title=f'Assignment {a + 1}',
+                    assignment_type='Essay', description='', max_marks=100, weight=25,
+                    due_date=now + timedelta(days=n + a), submission_type='Online',
+                )
+            for g in range(2):
+                Grade.objects.create(
+                    grade_id=f'G{n:03d}{g}', student=self.student, course=course,
+                    assessment_id=f'A{n:03d}{g}', assessment_type='Assignment',
+                    marks_obtained=60 + 10 * g, max_marks=100, percentage=60 + 10 * g,
+                    submitted_date=now - timedelta(days=10 - g), graded_date=now - timedelta(days=5 - g),
+                )
+
+
+class EngineMixin:
+    """The shared AI engine with empty caches, its indexes kept under a temporary AI_INDEX_DIR."""
+
+    def setUp(self):
+        super().setUp()
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        index_settings = override_settings(AI_INDEX_DIR=index_dir)
+        index_settings.enable()
+        self.addCleanup(index_settings.disable)
+        self.engine = get_engine()
+        self.engine._intent_classifier_loaded = False
+        for index in (kb_index, course_index, schedule_digests):
+            index.invalidate()
+        response_cache.clear()
+        # Drops a save still pending from a spliced article before AI_INDEX_DIR goes away
+        self.addCleanup(kb_index.invalidate)
+        # Counted keyword hits are written while the test database is still there
+        self.addCleanup(keyword_stats.flush)
+
+    def ask(self, query_text):
+        return self.engine.generate_response(query_text, self.student)['response']
+
+
+class DashboardQueryCountTests(StudentDataMixin, TestCase):
+    """The dashboard must not issue more queries as a student takes more courses."""
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return len(context.captured_queries)
+
+    def test_service_query_count_is_constant(self):
+        self.add_enrollments(1)
+        few = self.count_queries(lambda: dashboard_data(self.student))
+        self.add_enrollments(11)
+        many = self.count_queries(lambda: dashboard_data(self.student))
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, 5)
+
+    def test_view_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('dashboard'))
+        self.add_enrollments(1)
+        few = self.count_queries(lambda: self.client.get(reverse('dashboard')))
+        self.add_enrollments(11)
+        many = self.count_queries(lambda: self.client.get(reverse('dashboard')))
+        self.assertEqual(few, many)
+
+    def test_dashboard_data(self):
+        self.add_enrollments(8)
+        data = dashboard_data(self.student)
+
+        self.assertEqual(data['total_courses'], 8)
+        self.assertEqual(data['enrolled_count'], 2)
+        self.assertEqual(data['completed_count'], 2)
+        self.assertEqual(len(data['enrolled_courses']), 2)
+
+        # Soonest five, at most three per course
+        upcoming = data['upcoming_assignments']
+        self.assertEqual(len(upcoming), 5)
+        self.assertEqual([a.due_date for a in upcoming], sorted(a.due_date for a in upcoming))
+        per_course = {}
+        for assignment in upcoming:
+            per_course[assignment.course_id] = per_course.get(assignment.course_id, 0) + 1
+        self.assertLessEqual(max(per_course.values()), 3)
+
+        # The latest grade of every course is 70%, a C (3.0)
+        for enrollment in data['completed_courses']:
+            self.assertEqual(enrollment.latest_grade.percentage, 70)
+        self.assertEqual(data['gpa'], 3.0)
+        self.assertEqual(data['avg_grade'], 65)
+
+
+class StudentStatsTests(StudentDataMixin, TestCase):
+    """Signal-maintained stats must match a rebuild from the raw rows."""
+
+    def counters(self):
+        stats = StudentStats.objects.get(student=self.student)
+        return {field: getattr(stats, field) for field in COUNTER_FIELDS}
+
+    def assert_matches_rebuild(self):
+        incremental = self.counters()
+        gpa = Student.objects.get(pk=self.student.pk).gpa
+        rebuild()
+        self.assertEqual(incremental, self.counters())
+        self.assertEqual(gpa, Student.objects.get(pk=self.student.pk).gpa)
+
+    def test_new_student_has_stats(self):
+        self.assertEqual(self.counters()['grade_count'], 0)
+
+    def test_changes_are_applied_incrementally(self):
+        self.add_enrollments(8)
+        self.assert_matches_rebuild()
+        self.assertEqual(Student.objects.get(pk=self.student.pk).gpa, 3)
+
+        # A better latest grade in a completed course moves the GPA
+        grade = Grade.objects.filter(course__enrollments__status='Completed').order_by('-graded_date').first()
+        grade.percentage = 90
+        grade.save()
+        self.assert_matches_rebuild()
+
+        enrollment = Enrollment.objects.filter(status='Enrolled').first()
+        enrollment.status = 'Completed'
+        enrollment.save()
+        self.assert_matches_rebuild()
+
+        Grade.objects.filter(course__enrollments__status='Completed').first().delete()
+        Enrollment.objects.filter(status='Failed').first().delete()
+        self.assert_matches_rebuild()
+
+        other = Student.objects.create(user=User.objects.create_user('other'), student_id='KOI900002', program='IT')
+        grade = Grade.objects.filter(student=self.student).first()
+        grade.student = other
+        grade.save()
+        self.assert_matches_rebuild()
+        self.assertEqual(StudentStats.objects.get(student=other).grade_count, 1)
+
+    def test_gpa_follows_the_latest_grade(self):
+        self.add_enrollments(2)
+        course = Enrollment.objects.get(status='Completed').course
+        latest = Grade.objects.filter(course=course).order_by('-graded_date').first()
+        # Graded before the other one, which becomes the latest
+        latest.graded_date -= timedelta(days=30)
+        latest.save()
+        self.assert_matches_rebuild()
+        self.assertEqual(Student.objects.get(pk=self.student.pk).gpa, 2)
+
+        for grade in Grade.objects.filter(course=course):
+            grade.delete()
+        self.assert_matches_rebuild()
+        Grade.objects.create(
+            grade_id='G9999', student=self.student, course=course, assessment_id='A9999',
+            assessment_type='Exam', marks_obtained=90, max_marks=100, percentage=90,
+            submitted_date=timezone.now(), graded_date=timezone.now(),
+        )
+        self.assert_matches_rebuild()
+        self.assertEqual(Student.objects.get(pk=self.student.pk).gpa, 4)
+
+    def test_save_query_count(self):
+        self.add_enrollments(4)
+        for status, queries in (('Completed', 5), ('Enrolled', 4)):
+            grade = Grade.objects.filter(course__enrollments__status=status).order_by('-graded_date').first()
+            grade.percentage = 91
+            # Snapshot, latest grades, the row, the counters and (when the GPA moved) Student.gpa
+            with self.assertNumQueries(queries):
+                grade.save()
+            self.assert_matches_rebuild()
+
+        enrollment = Enrollment.objects.filter(status='Enrolled').first()
+        enrollment.status = 'Completed'
+        with self.assertNumQueries(5):
+            enrollment.save()
+        self.assert_matches_rebuild()
+
+    def test_missing_row_is_built_on_read(self):
+        self.add_enrollments(4)
+        StudentStats.objects.filter(student=self.student).delete()
+        self.client.force_login(self.user)
+        self.client.get(reverse('grades'))
+        stats = StudentStats.objects.get(student=self.student)
+        self.assertEqual(stats.grade_count, 8)
+        self.assertEqual(stats.total_courses, 4)
+
+
+class GradesViewTests(StudentDataMixin, TestCase):
+    """The grades page runs the same queries however many courses are graded."""
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('grades'), params)
+        return response, len(context.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('grades'))
+        self.add_enrollments(1)
+        _, few = self.get()
+        self.add_enrollments(11)
+        response, many = self.get()
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.context['course_grades']), 12)
+        self.assertEqual(response.context['course_grades'][0]['average'], 65)
+
+    def test_paginates_by_term(self):
+        self.client.force_login(self.user)
+        self.add_enrollments(3)
+        for n, term in enumerate(['T2 2025', 'T3 2025'], 1):
+            Course.objects.filter(course_id=f'C{n:03d}').update(term=term, start_date=date(2025, 2 + 4 * n, 1))
+
+        response, _ = self.get()
+        self.assertEqual([term for term, _ in response.context['term_grades']], ['T3 2025', 'T2 2025'])
+        response, _ = self.get(page=2)
+        self.assertEqual([term for term, _ in response.context['term_grades']], ['T1 2025'])
+        self.assertFalse(response.context['terms'].has_next())
+
+
+class PageCacheTests(StudentDataMixin, TestCase):
+    """Unchanged student pages are served without queries beyond session and auth."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_enrollments(3)
+        self.client.force_login(self.user)
+        self.pages = [
+            reverse('dashboard'), reverse('grades'), reverse('assignments'),
+            reverse('course_detail', args=['C001']),
+        ]
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        tables = {query['sql'].split(' FROM ')[1].split()[0].strip('"') for query in context.captured_queries}
+        return response, tables
+
+    def test_warm_pages_only_load_session_and_user(self):
+        for url in self.pages:
+            self.get(url)
+            _, tables = self.get(url)
+            self.assertLessEqual(tables, {'django_session', 'auth_user'}, url)
+
+    def test_changes_bump_the_versions(self):
+        other_course = reverse('course_detail', args=['C002'])
+        for url in self.pages + [other_course]:
+            self.get(url)
+
+        grade = Grade.objects.get(grade_id='G0011')
+        grade.percentage = 42
+        grade.save()
+        response, tables = self.get(reverse('grades'))
+        self.assertIn('lms_core_grade', tables)
+        self.assertContains(response, '42.00%')
+        self.get(other_course)
+
+        Assignment.objects.filter(assignment_id='A0010').first().delete()
+        _, tables = self.get(reverse('course_detail', args=['C001']))
+        self.assertIn('lms_core_assignment', tables)
+        # Other courses' pages stay cached
+        _, tables = self.get(other_course)
+        self.assertLessEqual(tables, {'django_session', 'auth_user'})
+
+
+class StudentListPaginationTests(StudentDataMixin, TestCase):
+    """Assignments, quizzes and forums load a page at a time, in order, without gaps."""
+
+    def setUp(self):
+        super().setUp()
+        # 24 active courses, 4 assignments each, several sharing a due date
+        self.add_enrollments(96)
+        due = timezone.now() + timedelta(days=30)
+        Assignment.objects.filter(assignment_id__endswith='0').update(due_date=due)
+        self.client.force_login(self.user)
+
+    def test_pages_cover_the_list_in_order(self):
+        from .views import LIST_PAGE_SIZE, _enrolled_courses
+
+        expected = list(
+            Assignment.objects.filter(course__in=_enrolled_courses(self.student))
+            .order_by('due_date', 'pk').values_list('pk', flat=True)
+        )
+        seen = []
+        cursor = None
+        while True:
+            context = self.client.get(reverse('assignments'), {'cursor': cursor} if cursor else {}).context
+            self.assertLessEqual(len(context['assignments']), LIST_PAGE_SIZE)
+            seen += [assignment.pk for assignment in context['assignments']]
+            if not context['next_cursor']:
+                break
+            # "Load more" returns the rows of the same page the view would show
+            data = self.client.get(reverse('api_list_page', args=['assignments']), {'cursor': context['next_cursor']}).json()
+            self.assertTrue(data['success'])
+            cursor = context['next_cursor']
+            self.assertEqual(data['next_cursor'], self.client.get(reverse('assignments'), {'cursor': cursor}).context['next_cursor'])
+        self.assertEqual(seen, expected)
+        self.assertGreater(len(expected), 2 * LIST_PAGE_SIZE)
+
+    def test_bad_requests(self):
+        url = reverse('api_list_page', args=['forums'])
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        null_cursor = base64.urlsafe_b64encode(b'[null, 1]').decode('ascii')
+        self.assertEqual(self.client.get(url, {'cursor': null_cursor}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_list_page', args=['grades'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('forums'), {'cursor': 'not-a-cursor'}).status_code, 200)
+
+
+class QueryLogTests(TransactionTestCase):
+    """Spilled queries reach the database however their worker ended."""
+
+    def setUp(self):
+        self.spill_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.spill_dir, ignore_errors=True)
+        # Flushed by the tests, not the background thread
+        self.log = QueryLog(self.spill_dir, batch_size=1000, flush_interval=3600)
+        self.user = User.objects.create_user('student')
+        self.student = Student.objects.create(user=self.user, student_id='KOI900001', program='IT')
+
+    def write_segment(self, name, query_ids):
+        path = self.spill_dir / name
+        with open(path, 'w', encoding='utf-8') as segment:
+            for query_id in query_ids:
+                segment.write(json.dumps({
+                    'query_id': query_id, 'student_id': self.student.pk, 'query_text': 'When is it due?',
+                    'intent': 'assignment_deadline', 'status': 'Resolved', 'priority': 'Medium',
+                    'response_text': 'Friday', 'timestamp': timezone.now().isoformat(),
+                }) + '\n')
+            segment.write('{"query_id": "torn')
+        return path
+
+    def test_replays_segments_nobody_holds(self):
+        # A dead worker whose pid this process happens to have now
+        dead = self.write_segment(f'queries.{os.getpid()}-0dead0.1.jsonl', ['QT1', 'QT2'])
+        live = self.write_segment('queries.1-0live0.1.jsonl', ['QT3'])
+        with open(live) as held:
+            fcntl.flock(held.fileno(), fcntl.LOCK_EX)
+            self.assertEqual(self.log.replay(), 2)
+
+        self.assertEqual(set(Query.objects.values_list('query_id', flat=True)), {'QT1', 'QT2'})
+        self.assertFalse(dead.exists())
+        self.assertTrue(live.exists())
+
+    def test_rejected_rows_do_not_block_the_queue(self):
+        doomed = Student.objects.create(user=User.objects.create_user('doomed'), student_id='KOI900002', program='IT')
+        self.log.log(student=doomed, query_text='Bad', intent='general_inquiry', status='Resolved')
+        Student.objects.filter(pk=doomed.pk).delete()
+        self.log.log(student=self.student, query_text='Good', intent='general_inquiry', status='Resolved')
+
+        with self.assertLogs('lms_core.query_log', 'ERROR'):
+            self.assertEqual(self.log.flush(), 1)
+        self.assertEqual(list(Query.objects.values_list('query_text', flat=True)), ['Good'])
+        self.assertEqual(self.log.stats()['queue_depth'], 0)
+        dead_letter = (self.spill_dir / QueryLog.DEAD_LETTER).read_text().splitlines()
+        self.assertEqual([json.loads(line)['query_text'] for line in dead_letter], ['Bad'])
+
+        # The queue keeps moving
+        self.log.log(student=self.student, query_text='Next', intent='general_inquiry', status='Resolved')
+        self.assertEqual(self.log.flush(), 1)
+        self.assertEqual(list(self.spill_dir.glob('queries.*.jsonl')), [Path(self.log._segment.name)])
+
+    def test_duplicate_query_ids_are_dead_lettered(self):
+        self.log.log(student=self.student, query_id='QD1', query_text='First', intent='general_inquiry')
+        self.assertEqual(self.log.flush(), 1)
+        self.log.log(student=self.student, query_id='QD1', query_text='Second', intent='general_inquiry')
+        self.log.log(student=self.student, query_id='QD2', query_text='Third', intent='general_inquiry')
+
+        with self.assertLogs('lms_core.query_log', 'ERROR'):
+            self.assertEqual(self.log.flush(), 1)
+        self.assertEqual(dict(Query.objects.values_list('query_id', 'query_text')), {'QD1': 'First', 'QD2': 'Third'})
+        dead_letter = (self.spill_dir / QueryLog.DEAD_LETTER).read_text().splitlines()
+        self.assertEqual([json.loads(line)['query_text'] for line in dead_letter], ['Second'])
+        self.assertEqual(self.log.stats()['dead_letters'], 1)
+
+    def test_replayed_rows_already_written_are_skipped(self):
+        path = self.write_segment('queries.1-0dead0.1.jsonl', ['QT1', 'QT2'])
+        with open(path, encoding='utf-8') as segment:
+            self.log._write(self.log._read_segment(segment)[:1])
+        self.assertEqual(self.log.replay(), 2)
+        self.assertEqual(set(Query.objects.values_list('query_id', flat=True)), {'QT1', 'QT2'})
+        self.assertFalse((self.spill_dir / QueryLog.DEAD_LETTER).exists())
+
+
+class IdAllocatorTests(TransactionTestCase):
+    def allocator(self):
+        return IdAllocator('query', Query, 'query_id', 'Q', 6, block_size=3)
+
+    def test_workers_hand_out_unique_ids(self):
+        first, second = self.allocator(), self.allocator()
+        ids = [allocator.next_id() for _ in range(10) for allocator in (first, second)]
+        self.assertEqual(len(set(ids)), 20)
+
+    def test_sync_moves_past_imported_ids(self):
+        allocator = self.allocator()
+        allocator.next_id()
+        Query.objects.bulk_create([Query(query_id=f'Q{n:06d}', query_text='imported') for n in range(1, 101)])
+        allocator.sync()
+        self.assertEqual(allocator.next_id(), 'Q000101')
+        self.assertEqual(self.allocator().next_id(), 'Q000104')
+
+    def test_rolled_back_reservations_are_not_reused(self):
+        first, second = self.allocator(), self.allocator()
+        try:
+            with transaction.atomic():
+                Query.objects.create(query_id=first.next_id(), query_text='rolled back')
+                raise ValueError
+        except ValueError:
+            pass
+        ids = [allocator.next_id() for _ in range(5) for allocator in (first, second)]
+        self.assertEqual(len(set(ids)), 10)
+
+
+class AdmissionTests(TestCase):
+    def assertSheds(self, controller, reason):
+        with self.assertRaises(Shed) as shed:
+            with controller.admit(('student', 1)):
+                pass
+        self.assertEqual(shed.exception.reason, reason)
+        self.assertEqual(controller.stats()['shed'][reason], 1)
+
+    def test_clients_over_their_rate_are_shed(self):
+        controller = AdmissionController(rate=0.001, burst=2)
+        for _ in range(2):
+            with controller.admit(('student', 1)):
+                pass
+        self.assertSheds(controller, 'rate_limited')
+        with controller.admit(('student', 2)):
+            pass
+
+    def test_requests_beyond_the_queue_are_shed(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=0, rate=0)
+        with controller.admit():
+            self.assertSheds(controller, 'queue_full')
+
+    def test_queued_requests_time_out(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05, rate=0)
+        with controller.admit():
+            self.assertSheds(controller, 'timeout')
+        self.assertEqual(controller.stats()['waiting'], 0)
+
+    def test_busy_engine_pool_is_recorded(self):
+        User.objects.create_user('student', password='secret')
+        self.client.login(username='student', password='secret')
+        before = admission.stats()['shed']['pool_busy']
+        with mock.patch.object(views.engine_pool, 'run', side_effect=EngineBusy):
+            response = self.client.post(
+                reverse('api_ai_query_async'), json.dumps({'query': 'When is it due?'}), content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(admission.stats()['shed']['pool_busy'], before + 1)
+
+
+class EnginePoolTests(TestCase):
+    def pool(self, **options):
+        pool = EnginePool(**options)
+        self.addCleanup(pool.executor.shutdown)
+        return pool
+
+    def test_calls_run_on_the_engine_threads(self):
+        pool = self.pool(max_workers=2)
+        name = asyncio.run(pool.run(lambda: threading.current_thread().name))
+        self.assertTrue(name.startswith('ai-engine'))
+
+    def test_timed_out_calls_hold_their_slot_until_they_finish(self):
+        pool = self.pool(max_workers=1, max_concurrency=1, queue_timeout=0.05, timeout=0.05)
+        release = threading.Event()
+
+        async def requests():
+            with self.assertRaises(EngineTimeout):
+                await pool.run(release.wait, 5.0)
+            # The engine is still busy with the abandoned call
+            with self.assertRaises(EngineBusy):
+                await pool.run(str, 'next')
+            release.set()
+            pool.queue_timeout = pool.timeout = 5.0
+            return await pool.run(str, 'next')
+
+        self.assertEqual(asyncio.run(requests()), 'next')
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_identical_queries_compute_once(self):
+        flights = SingleFlight(wait_timeout=5.0)
+        key = ('when is comp101 assignment 2 due', 'assignment_deadline', (), None)
+        computed = []
+        answers = []
+        release = threading.Event()
+
+        def ask():
+            flight, leader = flights.begin(key)
+            if leader:
+                answer = None
+                try:
+                    computed.append(key)
+                    release.wait(5.0)
+                    answer = {'response': 'Friday'}
+                finally:
+                    flights.finish(key, flight, answer)
+            else:
+                answer = flights.wait(key, flight)
+            answers.append(answer)
+
+        threads = [threading.Thread(target=ask) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        # Everyone has joined the leader's flight before it answers
+        for _ in range(500):
+            if flights.stats()['coalesced'] == len(threads) - 1:
+                break
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5.0)
+
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(answers, [{'response': 'Friday'}] * len(threads))
+        self.assertEqual(flights.stats()['in_flight'], 0)
+
+    def test_workers_share_one_computation_through_the_cache(self):
+        self.addCleanup(cache.clear)
+        key = ('where is the library', 'resource_access', (), None)
+        first, second = (SingleFlight(wait_timeout=5.0, shared_cache='default', poll_interval=0.01) for _ in range(2))
+        flight, leader = first.begin(key)
+        self.assertTrue(leader)
+        remote, leader = second.begin(key)
+        self.assertFalse(leader)
+        self.assertTrue(remote.remote)
+
+        answers = []
+        waiter = threading.Thread(target=lambda: answers.append(second.wait(key, remote)))
+        waiter.start()
+        first.finish(key, flight, {'response': 'Level 2'})
+        waiter.join(5.0)
+
+        self.assertEqual(answers, [{'response': 'Level 2'}])
+        # The lock went with the answer
+        self.assertTrue(SingleFlight(shared_cache='default').begin(key)[1])
+
+
+class ResponseCacheTests(EngineMixin, StudentDataMixin, TestCase):
+    """Cached answers never outlive the rows they were built from."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_enrollments(1)
+        self.course = Course.objects.get(course_code='TEST101')
+
+    def change(self, action, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            action(*args, **kwargs)
+
+    def test_assignment_changes(self):
+        question = 'When are the assignments due for TEST101?'
+        self.assertIn('Assignment 1', self.ask(question))
+        assignment = Assignment.objects.get(course=self.course, title='Assignment 1')
+        assignment.title = 'Renamed Essay'
+        self.change(assignment.save)
+        self.assertIn('Renamed Essay', self.ask(question))
+        self.change(assignment.delete)
+        self.assertNotIn('Renamed Essay', self.ask(question))
+        self.change(
+            Assignment.objects.create, assignment_id='A9999', course=self.course, title='Brand New Lab',
+            assignment_type='Lab', description='', max_marks=10, weight=5,
+            due_date=timezone.now() + timedelta(days=1), submission_type='Online',
+        )
+        self.assertIn('Brand New Lab', self.ask(question))
+
+    def test_grade_changes(self):
+        question = 'What is my grade for TEST101?'
+        self.assertIn('(60.00%)', self.ask(question))
+        grade = Grade.objects.get(course=self.course, percentage=60)
+        grade.marks_obtained = grade.percentage = 95
+        self.change(grade.save)
+        self.assertIn('(95.00%)', self.ask(question))
+        self.change(grade.delete)
+        self.assertNotIn('(95.00%)', self.ask(question))
+
+    def test_course_changes(self):
+        self.assertIn('Assignment 1', self.ask('When are the assignments due for TEST101?'))
+        self.assertIn('TEST101', self.ask('What are my grades?'))
+        self.course.course_code = 'TEST199'
+        self.change(self.course.save)
+        self.assertIn('Assignment 1', self.ask('When are the assignments due for TEST199?'))
+        self.assertNotIn('TEST101', self.ask('What are my grades?'))
+        self.change(self.course.delete)
+        self.assertIn("couldn't find the course", self.ask('When are the assignments due for TEST199?'))
+
+    def test_knowledge_base_changes(self):
+        question = 'How do I get a parking permit?'
+        article = KnowledgeBase(category='Campus', title='Parking', content='Permits cost $50.', keywords=['parking permit'])
+        self.change(article.save)
+        self.assertIn('Permits cost $50.', self.ask(question))
+        article.content = 'Permits are free this year.'
+        self.change(article.save)
+        self.assertIn('Permits are free this year.', self.ask(question))
+        # Its keyword hits are written before the article goes
+        keyword_stats.flush()
+        self.change(article.delete)
+        self.assertNotIn('Permits', self.ask(question))
+
+    def test_other_workers_drop_only_published_tags(self):
+        worker = ResponseCache(check_interval=0)
+        for course_pk in (1, 2):
+            worker.set(('deadline', course_pk), {'response': 'cached'}, {('course', course_pk)}, token=worker.token())
+        ResponseCache(check_interval=0).publish(('course', 1))
+        worker.token()
+        self.assertIsNone(worker.get(('deadline', 1)))
+        self.assertEqual(worker.get(('deadline', 2)), {'response': 'cached'})
+
+        ResponseCache(check_interval=0).publish(ResponseCache.EVERYTHING)
+        worker.token()
+        self.assertEqual(len(worker), 0)
+
+
+class KnowledgeBaseIndexTests(EngineMixin, TestCase):
+    ARTICLES = [
+        ('Library', 'Library hours', 'The library opens at 8am. Library study rooms can be booked online.'),
+        ('Campus', 'Gym', 'The gym opens at 6am and has free weights.'),
+        ('Campus', 'Cafeteria', 'The cafeteria serves lunch from noon until 2pm.'),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.articles = KnowledgeBase.objects.bulk_create(
+            KnowledgeBase(category=category, title=title, content=content)
+            for category, title, content in self.ARTICLES
+        )
+        kb_index.build()
+
+    def change(self, action, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            action(*args, **kwargs)
+
+    def test_split_passages(self):
+        sentences = ' '.join(f'Sentence {n} has exactly ten words in it right here.' for n in range(30))
+        passages = KnowledgeBaseIndex.split_passages(sentences)
+        self.assertEqual(len(passages), 3)
+        self.assertTrue(all(len(passage.split()) <= KnowledgeBaseIndex.PASSAGE_WORDS for passage in passages))
+        self.assertEqual(' '.join(passages), sentences)
+
+        run_on = ' '.join(f'word{n}' for n in range(250))
+        self.assertEqual([len(p.split()) for p in KnowledgeBaseIndex.split_passages(run_on)], [120, 120, 10])
+        self.assertEqual(KnowledgeBaseIndex.split_passages('First.\n\nSecond.'), ['First.', 'Second.'])
+
+    def test_top_k_orders_by_score(self):
+        results = kb_index.top_k('Which opens first, the library?')
+        self.assertEqual(results[0][0], self.articles[0].pk)
+        self.assertEqual({pk for pk, *_ in results}, {self.articles[0].pk, self.articles[1].pk})
+        scores = [score for *_, score in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(kb_index.top_k('library', k=1)[0][0], self.articles[0].pk)
+
+    def test_scores_against_answer_cutoff(self):
+        # The engine answers (and caches) knowledge base matches scoring above 0.3
+        self.assertGreater(kb_index.search('library study rooms')[3], 0.3)
+        self.assertLess(kb_index.search('library parking permit refund deadline')[3], 0.3)
+        self.assertIsNone(kb_index.search('quantum chromodynamics'))
+        self.assertTrue(all(score <= 1 for *_, score in kb_index.top_k('library library library study')))
+
+    def test_saved_and_deleted_articles(self):
+        article = KnowledgeBase(category='Campus', title='Parking', content='Parking permits cost $50 per term.')
+        with mock.patch.object(KnowledgeBaseIndex, '_save') as save:
+            self.change(article.save)
+            self.change(self.articles[1].delete)
+            # Persisted later, off the request that changed the articles
+            save.assert_not_called()
+        self.assertEqual(kb_index.search('parking permits')[0], article.pk)
+        self.assertEqual({pk for pk, *_ in kb_index.top_k('opens')}, {self.articles[0].pk})
+
+        # Document frequencies match a full rebuild
+        fresh = KnowledgeBaseIndex(path=Path(tempfile.mkdtemp()) / KnowledgeBaseIndex.FILENAME)
+        self.addCleanup(shutil.rmtree, fresh.get_path().parent)
+        rebuilt, patched = fresh.build(), kb_index.ensure()
+        for term in ('library', 'opens', 'parking', 'gym'):
+            expected = rebuilt['df'][rebuilt['vocabulary'][term]] if term in rebuilt['vocabulary'] else 0
+            self.assertEqual(patched['df'][patched['vocabulary'][term]], expected, term)
+        self.assertEqual(patched['n_passages'], len(rebuilt['passages']))
+
+        with mock.patch.object(KnowledgeBaseIndex, 'COMPACT_SIZE', 1):
+            kb_index.flush()
+        self.assertFalse(kb_index.ensure()['deleted'] or kb_index.ensure()['delta_rows'])
+        loaded = KnowledgeBaseIndex(path=kb_index.get_path())._load()
+        self.assertIsNotNone(loaded)
+        self.assertEqual(kb_index._top_k(loaded, 'parking permits', 1)[0][0], article.pk)
+        self.assertEqual({pk for pk, *_ in kb_index._top_k(loaded, 'opens', 5)}, {self.articles[0].pk})
+
+    def test_saved_index_is_reused_until_articles_change(self):
+        worker = KnowledgeBaseIndex(path=kb_index.get_path())
+        with mock.patch.object(KnowledgeBaseIndex, 'build') as build:
+            self.assertEqual(worker.search('library study rooms')[0], self.articles[0].pk)
+        build.assert_not_called()
+
+        # bulk_create sends no signals; the saved signature no longer matches
+        KnowledgeBase.objects.bulk_create([KnowledgeBase(category='Campus', title='Parking', content='Permits.')])
+        self.assertIsNone(KnowledgeBaseIndex(path=kb_index.get_path())._load())
+
+
+class KeywordMatcherTests(EngineMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.matcher = KeywordMatcher({
+            'fee_payment': ['pay', 'fee'],
+            'extension_request': ['late', 'extension'],
+            'enrollment_help': ['enroll', 'add course'],
+            'exam_schedule': ['test'],
+        })
+
+    def test_keywords_match_whole_words_only(self):
+        self.assertEqual(self.matcher.find('How do I repay my loan?'), set())
+        self.assertEqual(self.matcher.find('What is the latest news?'), set())
+        self.assertEqual(self.matcher.find('Is the contest open?'), set())
+        self.assertEqual(self.matcher.find('Can I PAY the Fee online?'), {'pay', 'fee'})
+
+    def test_inflections_match(self):
+        self.assertEqual(self.matcher.find('Where are the tests?'), {'test'})
+        self.assertEqual(self.matcher.find('Are the fees paid? Which fees?'), {'fee'})
+        self.assertEqual(self.matcher.find('My payment for the enrollment I enrolled in'), {'pay', 'enroll'})
+        self.assertEqual(self.matcher.find('I am paying and testing'), {'pay', 'test'})
+        self.assertEqual(self.matcher.find('Extensions for late work'), {'extension', 'late'})
+        self.assertEqual(self.matcher.find('How do I add   course units?'), {'add course'})
+        self.assertEqual(
+            self.matcher.scores('late extension fee'),
+            {'fee_payment': 1, 'extension_request': 2, 'enrollment_help': 0, 'exam_schedule': 0}
+        )
+
+    def test_intent_keywords_extend_the_vocabulary(self):
+        question = 'Is there a bursary form?'
+        self.assertEqual(self.engine.detect_intent_by_keywords(question), 'general_inquiry')
+        with self.captureOnCommitCallbacks(execute=True):
+            keyword = IntentKeyword.objects.create(intent='fee_payment', keyword='bursary')
+        # The generation bump is picked up on the next request
+        self.engine.refresh_if_stale()
+        self.assertEqual(self.engine.detect_intent_by_keywords(question), 'fee_payment')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            keyword.delete()
+        self.engine.refresh_if_stale()
+        self.assertEqual(self.engine.detect_intent_by_keywords(question), 'general_inquiry')
+
+
+class StreamingTests(EngineMixin, StudentDataMixin, TestCase):
+    QUESTION = 'When are the assignments due for TEST101?'
+
+    def setUp(self):
+        super().setUp()
+        self.add_enrollments(1)
+        self.client.force_login(self.user)
+        log = mock.patch.object(views.query_log, 'log')
+        self.log = log.start()
+        self.addCleanup(log.stop)
+
+    def stream(self):
+        response = self.client.post(
+            reverse('api_ai_query_stream'), json.dumps({'query': self.QUESTION}), content_type='application/json'
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response
+
+    @staticmethod
+    def parse(message):
+        event, data = message.decode().rstrip('\n').split('\n')
+        return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    def test_engine_yields_intent_then_text_then_done(self):
+        events = list(self.engine.stream_response(self.QUESTION, self.student))
+        kinds = [kind for kind, _ in events]
+        self.assertEqual(kinds[0], 'intent')
+        self.assertEqual(kinds[-1], 'done')
+        self.assertEqual(set(kinds[1:-1]), {'text'})
+        self.assertGreater(len(kinds), 3)
+        self.assertEqual(''.join(value for kind, value in events if kind == 'text'), events[-1][1]['response'])
+        self.assertEqual(events[-1][1]['intent'], events[0][1])
+
+    def test_events_arrive_in_order_and_are_logged_at_the_end(self):
+        content = self.stream().streaming_content
+        events = [self.parse(next(content))]
+        self.assertEqual(events[0], ('intent', {'intent': 'assignment_deadline'}))
+        events.append(self.parse(next(content)))
+        self.log.assert_not_called()
+
+        events.extend(self.parse(message) for message in content)
+        self.assertEqual([event for event, _ in events[1:-1]], ['chunk'] * (len(events) - 2))
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(events[-1][1]['intent'], 'assignment_deadline')
+
+        self.log.assert_called_once()
+        logged = self.log.call_args.kwargs
+        self.assertEqual(logged['query_text'], self.QUESTION)
+        self.assertEqual(logged['response_text'], ''.join(data['text'] for _, data in events[1:-1]))
+
+    def test_disconnected_client_is_still_logged(self):
+        response = self.stream()
+        content = response.streaming_content
+        self.assertEqual(self.parse(next(content))[0], 'intent')
+        self.assertEqual(self.parse(next(content))[0], 'chunk')
+        # What the server does when the client goes away
+        response.close()
+
+        self.log.assert_called_once()
+        self.assertIn('Assignment 4', self.log.call_args.kwargs['response_text'])
+        self.assertEqual(self.log.call_args.kwargs['intent'], 'assignment_deadline')
+
+
+class SimilarQueryTests(StudentDataMixin, TestCase):
+    ASKED = [
+        ('When are my assignments due?', 'assignment_deadline', 'TEST101 Assignment 1 is due tomorrow.'),
+        ('When is my exam?', 'exam_schedule', 'Your TEST101 final exam is on Monday.'),
+        ('What is my grade?', 'grade_inquiry', 'TEST101: 60.00%'),
+        ('How do I pay my fees?', 'fee_payment', 'Fees are paid through the student portal.'),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.add_enrollments(1)
+        Query.objects.bulk_create(
+            Query(query_id=f'Q9{n}{i}', student=self.student, query_text=text, intent=intent,
+                  response_text=answer, status='Resolved')
+            for n, (text, intent, answer) in enumerate(self.ASKED) for i in range(2)
+        )
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        self.index = SimilarQueryIndex(path=Path(index_dir) / SimilarQueryIndex.FILENAME, min_score=0.1)
+        self.index.build()
+
+    def test_answers_about_a_student_are_never_suggested(self):
+        for question in ('Which assignments are due this week?', 'When is the exam held?', 'Where can I see my grade?'):
+            suggestions = self.index.similar(question)
+            self.assertFalse(
+                [s for s in suggestions if 'TEST101' in s['response']], f'{question}: {suggestions}'
+            )
+        self.assertEqual(
+            [s['response'] for s in self.index.similar('Can I pay my tuition fees online?')],
+            ['Fees are paid through the student portal.']
+        )
+
+
+class ScheduleDigestTests(EngineMixin, StudentDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_enrollments(2)
+        self.first, self.second = Course.objects.order_by('course_code')
+        now = timezone.now()
+        Assignment.objects.create(
+            assignment_id='A9990', course=self.first, title='Past Essay', assignment_type='Essay', description='',
+            max_marks=100, weight=10, due_date=now - timedelta(days=1), submission_type='Online',
+        )
+        for n, days in enumerate((-1, 3)):
+            Quiz.objects.create(
+                quiz_id=f'QZ{n}', course=self.first, title=f'Quiz {n}', quiz_type='Quiz', max_marks=10,
+                duration_minutes=30, date=now + timedelta(days=days), attempts_allowed='1',
+            )
+        # Another worker, told about changes only through the shared generation
+        self.other = ScheduleDigests(check_interval=0)
+
+    def titles(self, digests, course):
+        return [row['title'] for row in digests.assignments([course.pk])[course.pk].data]
+
+    def test_only_upcoming_rows_are_listed(self):
+        digest = schedule_digests.assignments([self.first.pk])[self.first.pk]
+        self.assertEqual(self.titles(schedule_digests, self.first), [f'Assignment {a}' for a in range(1, 5)])
+        self.assertEqual(digest.expires, Assignment.objects.get(course=self.first, title='Assignment 1').due_date)
+        exams = schedule_digests.exams([self.first.pk, self.second.pk])
+        self.assertEqual([line.split('\n')[0] for line in exams[self.first.pk].lines], ['• Quiz 1'])
+        self.assertEqual(exams[self.second.pk], ((), None))
+
+    def test_digest_expires_at_its_first_due_date(self):
+        self.assertEqual(len(self.titles(schedule_digests, self.first)), 4)
+        first_due = Assignment.objects.get(course=self.first, title='Assignment 1').due_date
+        with mock.patch('lms_core.schedule_digest.timezone.now', return_value=first_due + timedelta(minutes=1)):
+            self.assertEqual(self.titles(schedule_digests, self.first), [f'Assignment {a}' for a in range(2, 5)])
+
+    def test_moved_rows_leave_both_courses(self):
+        for digests in (schedule_digests, self.other):
+            digests.assignments([self.first.pk, self.second.pk])
+            digests.exams([self.first.pk, self.second.pk])
+
+        assignment = Assignment.objects.get(course=self.first, title='Assignment 1')
+        assignment.course, assignment.title = self.second, 'Moved Lab'
+        quiz = Quiz.objects.get(quiz_id='QZ1')
+        quiz.course = self.second
+        with self.captureOnCommitCallbacks(execute=True):
+            assignment.save()
+            quiz.save()
+
+        for digests in (schedule_digests, self.other):
+            self.assertNotIn('Moved Lab', self.titles(digests, self.first))
+            self.assertIn('Moved Lab', self.titles(digests, self.second))
+            exams = digests.exams([self.first.pk, self.second.pk])
+            self.assertEqual(exams[self.first.pk].lines, ())
+            self.assertEqual(len(exams[self.second.pk].lines), 1)
+        self.assertIn('Moved Lab', self.ask('When are the assignments due for TEST102?'))
+        self.assertIn('No upcoming exams', self.ask('When is the exam for TEST101?'))
+
+
+class IntentClassifierTests(EngineMixin, TestCase):
+    EXAMPLES = {
+        'fee_payment': [
+            'How do I pay my tuition fees?', 'When is the fee payment due?', 'Can I pay fees in instalments?',
+            'Where do I pay tuition?', 'What payment methods are accepted for fees?',
+            'Is there a late fee for tuition?', 'How much are my tuition fees?', 'Can I get a fee receipt?',
+        ],
+        'exam_schedule': [
+            'When is the final exam?', 'What time is my midterm?', 'Where is the exam held?',
+            'Is the exam timetable out?', 'How long is the final exam?', 'When are the exams this term?',
+            'Which room is my exam in?', 'Is there a supplementary exam date?',
+        ],
+        'technical_issue': [
+            'I cannot log in to the portal', 'The website shows an error', 'My password reset is broken',
+            'The page will not load', 'I get a server error when uploading', 'The video player is broken',
+            'Login keeps failing', 'The app crashes on start',
+        ],
+    }
+
+    def test_trained_model_is_saved_and_evaluated_on_held_out_queries(self):
+        data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, data_dir)
+        csv_path = data_dir / 'labelled.csv'
+        rows = [(text, intent) for intent, texts in self.EXAMPLES.items() for text in texts]
+        csv_path.write_text('query_text,intent\n' + ''.join(f'"{text}",{intent}\n' for text, intent in rows))
+        output = data_dir / IntentClassifier.FILENAME
+
+        out = StringIO()
+        call_command('train_intent_classifier', csv_files=[str(csv_path)], no_db=True, output=str(output), stdout=out)
+        # A stratified 20% of the 24 queries
+        self.assertRegex(out.getvalue(), r'Held-out accuracy \d+\.\d% on 5 queries')
+        self.assertIn('Trained on 24 unique queries', out.getvalue())
+
+        classifier = IntentClassifier.load(output)
+        self.assertEqual(sorted(classifier.intents), sorted(self.EXAMPLES))
+        predictions = classifier.predict_many([text for text, _ in rows])
+        self.assertEqual([intent for intent, _ in predictions], [intent for _, intent in rows])
+        self.assertEqual(classifier.predict('How do I pay the tuition fee?')[0], 'fee_payment')
+
+    def test_low_confidence_predictions_fall_back_to_keywords(self):
+        question = 'When is the assignment deadline?'
+        classifier = mock.Mock()
+        classifier.predict_many.return_value = [
+            ('fee_payment', self.engine.intent_confidence_threshold - 0.01),
+            ('fee_payment', self.engine.intent_confidence_threshold + 0.01),
+        ]
+        with mock.patch.object(self.engine, 'get_intent_classifier', return_value=classifier):
+            self.assertEqual(self.engine.detect_intents([question, question]), ['assignment_deadline', 'fee_payment'])
+        with mock.patch.object(self.engine, 'get_intent_classifier', return_value=None):
+            self.assertEqual(self.engine.detect_intents([question]), ['assignment_deadline'])
+
+
+class EngineGenerationTests(EngineMixin, TestCase):
+    """Workers pick up engine data another worker changed through the shared generation."""
+
+    def setUp(self):
+        super().setUp()
+        self.engine.reload()
+
+    def bump_elsewhere(self, name):
+        # Another worker's bump, which this process is not told about
+        generation = generations.current(name) + 1
+        EngineGeneration.objects.update_or_create(name=name, defaults={'generation': generation})
+        return generation
+
+    def test_watcher_reads_the_counter_at_most_every_interval(self):
+        watcher = generations.GenerationWatcher(generations.AI_ENGINE, interval=3600)
+        watcher.mark(generations.current(generations.AI_ENGINE))
+        generation = self.bump_elsewhere(generations.AI_ENGINE)
+        with self.assertNumQueries(0):
+            self.assertIsNone(watcher.poll())
+        watcher.interval = 0
+        self.assertEqual(watcher.poll(), generation)
+        watcher.mark(generation)
+        self.assertIsNone(watcher.poll())
+
+        # Bumps made by this process are seen without waiting for the interval
+        watcher.interval = 3600
+        generation = generations.bump(generations.AI_ENGINE)
+        self.assertEqual(watcher.poll(), generation)
+
+    def test_workers_reload_once_the_generation_moves(self):
+        worker = AIQueryEngine()
+        worker.generation_watcher.interval = 3600
+        ResponseTemplate.objects.create(intent='fee_payment', template='Pay at the Finance Office.')
+        self.bump_elsewhere(generations.AI_ENGINE)
+
+        worker.refresh_if_stale()
+        self.assertNotIn('fee_payment', worker.templates)
+        worker.generation_watcher.interval = 0
+        worker.refresh_if_stale()
+        self.assertEqual(worker.templates['fee_payment'], 'Pay at the Finance Office.')
+
+    def test_failed_reload_keeps_the_snapshot(self):
+        snapshot = self.engine.snapshot
+        with mock.patch.object(ResponseTemplate.objects, 'all', side_effect=DatabaseError('database is locked')):
+            with self.assertLogs('lms_core.ai_engine', 'WARNING'):
+                self.assertFalse(self.engine.reload())
+        self.assertIs(self.engine.snapshot, snapshot)
+
+    def test_own_knowledge_base_changes_keep_the_patched_index(self):
+        kb_index.ensure()
+        article = KnowledgeBase(category='Campus', title='Parking', content='Parking permits cost $50 per term.')
+        with self.captureOnCommitCallbacks(execute=True):
+            article.save()
+        patched = kb_index.ensure()
+
+        self.engine.refresh_if_stale()
+        self.assertIs(kb_index.ensure(), patched)
+        self.assertEqual(kb_index.search('parking permits')[0], article.pk)
+
+        # A bump by another worker in between still reloads
+        self.bump_elsewhere(generations.AI_ENGINE)
+        self.engine.generation_watcher.interval = 0
+        self.addCleanup(setattr, self.engine.generation_watcher, 'interval', 1.0)
+        self.engine.refresh_if_stale()
+        self.assertIsNot(kb_index.ensure(), patched)
+
+
+class LazyEngineTests(TestCase):
+    def test_engine_is_built_once_on_first_use(self):
+        engines = []
+        with mock.patch.object(ai_engine, '_engine', None), \
+                mock.patch.object(ai_engine, 'AIQueryEngine') as engine_class:
+            # Nothing to tell an engine that was never built
+            ai_engine.engine_bumped(1)
+            engine_class.assert_not_called()
+
+            threads = [threading.Thread(target=lambda: engines.append(ai_engine.get_engine())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5.0)
+
+            engine_class.assert_called_once_with()
+            self.assertEqual(engines, [engine_class.return_value] * len(threads))
+            ai_engine.engine_bumped(1)
+            engine_class.return_value.bumped.assert_called_once_with(1)
+
+
+class BatchResponseTests(EngineMixin, StudentDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_enrollments(3)
+
+    def answer(self, queries):
+        response_cache.clear()
+        return self.engine.generate_responses(queries, [self.student] * len(queries))
+
+    def test_batch_answers_match_single_answers_in_order(self):
+        queries = [
+            'When are the assignments due for TEST101?',
+            'What is my grade for TEST102?',
+            'How do I pay my fees?',
+            'When are the assignments due for TEST103?',
+        ]
+        batch = [(r['intent'], r['response']) for r in self.answer(queries)]
+        single = [(r['intent'], r['response']) for query in queries for r in self.answer([query])]
+        self.assertEqual(batch, single)
+
+    def test_one_round_trip_per_intent(self):
+        def count_queries(n):
+            for index in (course_index, schedule_digests):
+                index.invalidate()
+            course_index.invalidate_student(self.student.pk)
+            queries = [f'When are the assignments due for TEST{101 + i}?' for i in range(n)]
+            # Shared generation checks happen at most once a second, whatever the batch
+            with mock.patch.object(generations.GenerationWatcher, 'poll', return_value=None), \
+                    CaptureQueriesContext(connection) as context:
+                self.answer(queries)
+            return len(context)
+
+        self.assertEqual(count_queries(1), count_queries(3))
+
+
+class InstrumentationTests(EngineMixin, StudentDataMixin, TestCase):
+    QUESTION = 'When are the assignments due for TEST101?'
+
+    def setUp(self):
+        super().setUp()
+        self.add_enrollments(1)
+        latency_recorder.reset()
+        self.addCleanup(latency_recorder.reset)
+
+    def test_stages_are_logged_with_their_queries(self):
+        with self.assertLogs('lms_core.timing', 'INFO') as logs:
+            self.ask(self.QUESTION)
+        spans = {record.ai_stage: record for record in logs.records}
+        self.assertLessEqual({'reload_check', 'intent_detection', 'entity_extraction', 'cache_lookup', 'total'}, set(spans))
+        self.assertEqual(spans['assignment_lookup'].ai_intent, 'assignment_deadline')
+        self.assertGreater(spans['assignment_lookup'].queries, 0)
+
+        self.ask(self.QUESTION)
+        stages = latency_recorder.summary()['assignment_deadline']
+        self.assertEqual(stages['total']['count'], 2)
+        # The second answer came from the response cache
+        self.assertEqual(stages['assignment_lookup']['count'], 1)
+        self.assertGreater(stages['assignment_lookup']['avg_queries'], 0)
+
+    def test_metrics_are_for_staff(self):
+        self.ask(self.QUESTION)
+        self.client.login(username='student', password='secret')
+        self.assertEqual(self.client.get(reverse('api_ai_metrics')).status_code, 302)
+
+        User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.login(username='admin', password='secret')
+        metrics = self.client.get(reverse('api_ai_metrics')).json()
+        self.assertEqual(metrics['stages']['assignment_deadline']['total']['count'], 1)
+        metrics = self.client.post(reverse('api_ai_metrics'), {'reset': '1'}).json()
+        self.assertEqual(metrics['stages'], {})
+
+
+class CourseIndexTests(EngineMixin, StudentDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # An earlier offering of TEST101 the student did not take
+        self.other = Course.objects.create(
+            course_id='C900', course_code='TEST101', course_name='Test Course 1',
+            instructor='Dr Test', term='T1 2024', level=1, credits=3, department='IT',
+            start_date=date(2024, 2, 1), end_date=date(2024, 6, 1), description='',
+        )
+        self.add_enrollments(1)
+        self.enrolled = Course.objects.get(course_id='C001')
+
+    def test_codes_and_names_resolve_to_the_students_offering(self):
+        for text in ('when is test101 due?', 'When is TEST 101 due?', 'Deadlines for Test Course 1 please'):
+            entities = self.engine.extract_entities(text, self.student)
+            self.assertEqual((entities['course_code'], entities['course_id']), ('TEST101', self.enrolled.pk), text)
+        self.assertEqual(course_index.resolve('TEST101'), self.other)
+        self.assertIsNone(course_index.find_course_code('When is COMP999 due?'))
+        with self.assertNumQueries(0):
+            self.assertEqual(course_index.resolve('test101', self.student), self.enrolled)
+
+    def test_index_is_rebuilt_when_the_generation_moves(self):
+        course_index.ensure()
+        Course.objects.filter(pk=self.enrolled.pk).update(course_code='TEST150')
+        generations.bump(generations.COURSES)
+        self.assertEqual(course_index.find_course_code('test150 deadlines'), 'TEST150')
+        self.assertEqual(course_index.resolve('TEST101', self.student), self.other)
+
+
+class KeywordAnswerTests(EngineMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.article = KnowledgeBase.objects.create(
+            category='Finance', title='Bursaries', content='Bursary forms are due in March.',
+            keywords=['Bursary Form', 'hardship'],
+        )
+        KnowledgeBase.objects.create(category='Campus', title='Parking', content='Parking permits cost $50.')
+        kb_index.build()
+        self.stats = KeywordStats(flush_interval=3600)
+        stats = mock.patch('lms_core.kb_index.keyword_stats', self.stats)
+        stats.start()
+        self.addCleanup(stats.stop)
+
+    def test_keywords_answer_without_scoring(self):
+        with mock.patch.object(KnowledgeBaseIndex, '_top_k') as top_k:
+            pk, title, passage, score = kb_index.search('Where do I hand in the bursary form?')
+        top_k.assert_not_called()
+        self.assertEqual((pk, score), (self.article.pk, KnowledgeBaseIndex.KEYWORD_SCORE))
+        self.assertEqual(kb_index.search('parking permits')[1], 'Parking')
+        self.assertEqual(self.stats.summary(), {'lookups': 2, 'hits': 1, 'hit_rate': 0.5})
+
+    def test_hits_are_flushed_for_the_admin(self):
+        for query in ('bursary form', 'HARDSHIP help', 'hardship', 'parking'):
+            kb_index.search(query)
+        self.stats.flush()
+        self.assertEqual(dict(KeywordStat.objects.values_list('keyword', 'hits')), {'bursary form': 1, 'hardship': 2})
+        day = KeywordLookupDay.objects.get()
+        self.assertEqual((day.lookups, day.hits), (4, 3))
+
+        User.objects.create_superuser('admin', password='secret')
+        self.client.login(username='admin', password='secret')
+        response = self.client.get(reverse('admin:lms_core_keywordstat_changelist'))
+        self.assertContains(response, 'Hit rate: 75.0% of 4 keyword lookups')
+
+
+class EvaluateAIEngineTests(EngineMixin, TransactionTestCase):
+    def test_report(self):
+        data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, data_dir)
+        csv_path = data_dir / 'queries.csv'
+        csv_path.write_text(
+            'query_text,intent\n'
+            'How do I pay my fees?,fee_payment\n'
+            'When is the final exam for TEST101?,exam_schedule\n'
+            'I cannot log in,technical_issue\n'
+            'Where is the library?,resource_access\n'
+        )
+        output = data_dir / 'report.json'
+        with mock.patch.object(response_cache, 'clear', wraps=response_cache.clear) as clear:
+            call_command(
+                'evaluate_ai_engine', csv=str(csv_path), limit=3, rounds=2, workers=2, output=str(output),
+                stdout=StringIO(),
+            )
+        # Every round of the three runs starts cold
+        self.assertEqual(clear.call_count, 3 * 2)
+
+        report = json.loads(output.read_text())
+        self.assertEqual((report['queries'], report['rounds'], report['workers']), (3, 2, 2))
+        self.assertEqual(sum(scores['support'] for scores in report['accuracy']['per_intent'].values()), 6)
+        self.assertTrue(0 <= report['accuracy']['overall'] <= 1)
+        for name in ('single_thread', 'concurrent'):
+            self.assertEqual(report[name]['queries'], 6)
+            self.assertEqual(report[name]['latency']['count'], 6)
+            self.assertLessEqual(report[name]['latency']['p50_ms'], report[name]['latency']['max_ms'])
+        self.assertEqual(report['batch']['queries'], 6)
+        self.assertIn('KnowledgeBase', report['dataset']['rows'])
+        intents = {intent: stages for intent, stages in report['stages'].items() if intent != 'all'}
+        self.assertEqual(sum(stages['total']['count'] for stages in intents.values()), 6)
+        # The second round was answered by the handlers again, not the cache
+        for stages in intents.values():
+            handler = set(stages) - {'cache_lookup', 'entity_extraction', 'intent_detection', 'total'}
+            self.assertEqual([stages[name]['count'] for name in handler], [2])
@@ -14,4 +14,11 @@ urlpatterns = [
     path('grades/', views.grades_view, name='grades'),
     path('forums/', views.forums_view, name='forums'),
     path('ai-query/', views.ai_query_view, name='ai_query'),
+    path('ai-query/async/', views.ai_query_async_view, name='ai_query_async'),
+    path('api/lists/<str:name>/', views.api_list_page, name='api_list_page'),
+    path('api/ai-query/', views.api_query, name='api_ai_query'),
+    path('api/ai-query/stream/', views.api_query_stream, name='api_ai_query_stream'),
+    path('api/ai-query/async/', views.api_query_async, name='api_ai_query_async'),
+    path('api/ai-query/batch/', views.api_query_batch, name='api_ai_query_batch'),
+    path('api/ai-metrics/', views.ai_metrics, name='api_ai_metrics'),
 ]
@@ -5,9 +5,10 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.paginator import Paginator
 from django.db.models import Avg, Q
-from django.http import JsonResponse
-from django.utils import timezone
+from django.http import JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from .forms import ProfileUpdateForm
 
 from .models import (
@@ -15,11 +16,37 @@ from .models import (
     Quiz, Grade, Forum, Query
 )
 from .forms import SignUpForm, QueryForm
-from .ai_engine import AIQueryEngine
+from .ai_engine import get_engine
+from .engine_pool import engine_pool, EngineBusy, EngineTimeout
+from .admission import admission, client_key, Shed
+from .query_log import query_log
+from .similar_queries import similar_queries
+from .dashboard import dashboard_data
+from .student_stats import stats_for
+from .page_cache import page_cache
+from .keyset import InvalidCursor, KeysetPaginator
+from .keyword_stats import keyword_stats
+from .single_flight import single_flight
+from .instrumentation import latency_recorder
+from django.contrib.admin.views.decorators import staff_member_required
+from asgiref.sync import sync_to_async
 import json
+import logging
+import re
 
-# Initialize AI Engine
-ai_engine = AIQueryEngine()
+logger = logging.getLogger(__name__)
+
+# Upper bound on queries accepted by api_query_batch
+API_BATCH_MAX_QUERIES = 50
+
+# Rows per page of the assignments, quizzes and forums lists; the pages
+# fetch more from api_list_page as the student scrolls
+LIST_PAGE_SIZE = 20
+
+# Terms shown per page of the grades page
+GRADE_TERMS_PER_PAGE = 2
+
+SHED_MESSAGE = 'The AI Assistant is very busy, so this is a general answer. Please try again in a moment.'
 
 def home(request):
     """Redirect to dashboard or login"""
@@ -100,261 +127,259 @@ def update_profile(request):
 @login_required
 def dashboard(request):
     """Main dashboard view"""
-    try:
-        student = request.user.student_profile
-    except:
-        messages.warning(request, 'Student profile not found. Please contact administration.')
-        return redirect('login')
-    
-    # Get all enrollments with different statuses
-    enrollments = Enrollment.objects.filter(
-        student=student
-    ).select_related('course').order_by('-enrollment_date')
-    
-    # Get enrolled courses (active)
-    enrolled_courses = enrollments.filter(status='Enrolled')
-    
-    # Get completed courses
-    completed_courses = enrollments.filter(status='Completed')
-    
-    # Get failed courses
-    failed_courses = enrollments.filter(status='Failed')
-    
-    # Get withdrawn courses
-    withdrawn_courses = enrollments.filter(status='Withdrawn')
-    
-    # Get all active courses for assignments
-    active_courses = enrollments.filter(status='Enrolled')
-    
-    # Get upcoming assignments from active courses
-    upcoming_assignments = []
-    for enrollment in active_courses:
-        assignments = Assignment.objects.filter(
-            course=enrollment.course,
-            due_date__gte=timezone.now()
-        ).order_by('due_date')[:3]
-        upcoming_assignments.extend(assignments)
-    
-    # Sort by due date and limit
-    upcoming_assignments = sorted(upcoming_assignments, key=lambda x: x.due_date)[:5]
-    
-    # Get recent grades from all courses
-    recent_grades = Grade.objects.filter(
-        student=student
-    ).select_related('course').order_by('-graded_date')[:5]
-    
-    # Calculate statistics
-    all_grades = Grade.objects.filter(student=student)
-    avg_grade = all_grades.aggregate(Avg('percentage'))['percentage__avg'] or 0
-    
-    # Calculate GPA (example calculation)
-    total_credits = 0
-    weighted_points = 0
-    
-    for enrollment in completed_courses:
-        # Get the latest grade for this course
-        latest_grade = Grade.objects.filter(
-            student=student,
-            course=enrollment.course
-        ).order_by('-graded_date').first()
+    key = page_cache.page_key('dashboard', request.user)
+    context = page_cache.get(key)
+    if context is None:
+        try:
+            student = request.user.student_profile
+        except:
+            messages.warning(request, 'Student profile not found. Please contact administration.')
+            return redirect('login')
         
-        if latest_grade and latest_grade.percentage is not None:
-            # Convert percentage to GPA points
-            if latest_grade.percentage >= 85:
-                points = 4.0  # HD
-            elif latest_grade.percentage >= 75:
-                points = 3.5  # D
-            elif latest_grade.percentage >= 65:
-                points = 3.0  # C
-            elif latest_grade.percentage >= 50:
-                points = 2.0  # P
-            else:
-                points = 0.0  # F
-            
-            # Assume each course has 3 credits (adjust based on your model)
-            credits = 3
-            weighted_points += points * credits
-            total_credits += credits
+        context = dashboard_data(student)
+        page_cache.set(key, context)
     
-    gpa = weighted_points / total_credits if total_credits > 0 else 0.0
-    
-    context = {
-        'student': student,
-        'enrollments': enrollments,
-        'enrolled_courses': enrolled_courses,
-        'completed_courses': completed_courses,
-        'failed_courses': failed_courses,
-        'withdrawn_courses': withdrawn_courses,
-        'active_courses': active_courses,
-        'upcoming_assignments': upcoming_assignments,
-        'recent_grades': recent_grades,
-        'avg_grade': round(avg_grade, 2),
-        'gpa': round(gpa, 2),
-        'total_courses': enrollments.count(),
-        'enrolled_count': enrolled_courses.count(),
-        'completed_count': completed_courses.count(),
-        'failed_count': failed_courses.count(),
-        'withdrawn_count': withdrawn_courses.count(),
-    }
-    
-    return render(request, 'lms_core/dashboard.html', context)
+    return render(request, 'lms_core/dashboard.html', {**context, **page_cache.fragment_context(key)})
 
 @login_required
 def course_detail(request, course_id):
     """View course details"""
-    try:
-        student = request.user.student_profile
-    except:
-        messages.error(request, 'Student profile not found.')
-        return redirect('dashboard')
-    
-    course = get_object_or_404(Course, course_id=course_id)
-    
-    # Check enrollment
-    enrollment = Enrollment.objects.filter(
-        student=student,
-        course=course
-    ).first()
-    
-    if not enrollment:
-        messages.error(request, 'You are not enrolled in this course.')
-        return redirect('dashboard')
-    
-    # Get course materials
-    assignments = Assignment.objects.filter(course=course).order_by('due_date')
-    quizzes = Quiz.objects.filter(course=course).order_by('date')
-    forums = Forum.objects.filter(course=course).order_by('-created_date')
-    grades = Grade.objects.filter(student=student, course=course).order_by('-graded_date')
-    
-    context = {
-        'course': course,
-        'enrollment': enrollment,
-        'assignments': assignments,
-        'quizzes': quizzes,
-        'forums': forums,
-        'grades': grades,
-    }
-    
-    return render(request, 'lms_core/course_detail.html', context)
+    key = page_cache.page_key('course_detail', request.user, course_id)
+    context = page_cache.get(key)
+    if context is None:
+        try:
+            student = request.user.student_profile
+        except:
+            messages.error(request, 'Student profile not found.')
+            return redirect('dashboard')
+        
+        course = get_object_or_404(Course, course_id=course_id)
+        
+        # Check enrollment
+        enrollment = Enrollment.objects.filter(
+            student=student,
+            course=course
+        ).first()
+        
+        if not enrollment:
+            messages.error(request, 'You are not enrolled in this course.')
+            return redirect('dashboard')
+        
+        # Get course materials
+        assignments = Assignment.objects.filter(course=course).order_by('due_date')
+        quizzes = Quiz.objects.filter(course=course).order_by('date')
+        forums = Forum.objects.filter(course=course).order_by('-created_date')
+        grades = Grade.objects.filter(student=student, course=course).order_by('-graded_date')
+        
+        context = {
+            'course': course,
+            'enrollment': enrollment,
+            'assignments': list(assignments),
+            'quizzes': list(quizzes),
+            'forums': list(forums),
+            'grades': list(grades),
+        }
+        page_cache.set(key, context)
+    
+    return render(request, 'lms_core/course_detail.html', {**context, **page_cache.fragment_context(key)})
 
-@login_required
-def assignments_view(request):
-    """View all assignments"""
-    try:
-        student = request.user.student_profile
-    except:
-        messages.error(request, 'Student profile not found.')
-        return redirect('dashboard')
-    
-    enrolled_courses = Course.objects.filter(
+def _enrolled_courses(student):
+    return Course.objects.filter(
         enrollments__student=student,
         enrollments__status='Enrolled'
     )
-    
-    assignments = Assignment.objects.filter(
-        course__in=enrolled_courses
-    ).select_related('course').order_by('due_date')
+
+def _assignments_page(student, cursor=None):
+    """One keyset page of the student's assignments, soonest due first"""
+    assignments, next_cursor = KeysetPaginator(
+        Assignment.objects.filter(course__in=_enrolled_courses(student)).select_related('course'),
+        'due_date', page_size=LIST_PAGE_SIZE,
+    ).page(cursor)
     
     submitted_assignments = Grade.objects.filter(
         student=student,
-        assessment_type='Assignment'
+        assessment_type='Assignment',
+        assessment_id__in=[assignment.assignment_id for assignment in assignments]
     ).values_list('assessment_id', flat=True)
     
-    context = {
+    return {
         'assignments': assignments,
-        'submitted_assignments': submitted_assignments,
+        'submitted_assignments': set(submitted_assignments),
+        'next_cursor': next_cursor,
     }
-    
-    return render(request, 'lms_core/assignments.html', context)
 
-@login_required
-def quizzes_view(request):
-    """View all quizzes"""
-    try:
-        student = request.user.student_profile
-    except:
-        messages.error(request, 'Student profile not found.')
-        return redirect('dashboard')
-    
-    enrolled_courses = Course.objects.filter(
-        enrollments__student=student,
-        enrollments__status='Enrolled'
-    )
-    
-    quizzes = Quiz.objects.filter(
-        course__in=enrolled_courses
-    ).select_related('course').order_by('date')
+def _quizzes_page(student, cursor=None):
+    """One keyset page of the student's quizzes, earliest first"""
+    quizzes, next_cursor = KeysetPaginator(
+        Quiz.objects.filter(course__in=_enrolled_courses(student)).select_related('course'),
+        'date', page_size=LIST_PAGE_SIZE,
+    ).page(cursor)
     
     completed_quizzes = Grade.objects.filter(
         student=student,
-        assessment_type='Quiz'
+        assessment_type='Quiz',
+        assessment_id__in=[quiz.quiz_id for quiz in quizzes]
     ).values_list('assessment_id', flat=True)
     
-    context = {
+    return {
         'quizzes': quizzes,
-        'completed_quizzes': completed_quizzes,
+        'completed_quizzes': set(completed_quizzes),
+        'next_cursor': next_cursor,
+    }
+
+def _forums_page(student, cursor=None):
+    """One keyset page of the student's forum topics, newest first"""
+    forums, next_cursor = KeysetPaginator(
+        Forum.objects.filter(course__in=_enrolled_courses(student)).select_related('course'),
+        'created_date', descending=True, page_size=LIST_PAGE_SIZE,
+    ).page(cursor)
+    
+    return {
+        'forums': forums,
+        'next_cursor': next_cursor,
     }
+
+# Page builder and row template of each lazily loaded list
+STUDENT_LISTS = {
+    'assignments': (_assignments_page, 'lms_core/partials/assignment_rows.html'),
+    'quizzes': (_quizzes_page, 'lms_core/partials/quiz_rows.html'),
+    'forums': (_forums_page, 'lms_core/partials/forum_rows.html'),
+}
+
+def _list_context(name, student, cursor):
+    build, _ = STUDENT_LISTS[name]
+    try:
+        return build(student, cursor)
+    except InvalidCursor:
+        return build(student)
+
+@login_required
+def assignments_view(request):
+    """View assignments, a page at a time"""
+    cursor = request.GET.get('cursor')
+    key = page_cache.page_key('assignments', request.user, None, cursor)
+    context = page_cache.get(key)
+    if context is None:
+        try:
+            student = request.user.student_profile
+        except:
+            messages.error(request, 'Student profile not found.')
+            return redirect('dashboard')
+        
+        context = _list_context('assignments', student, cursor)
+        page_cache.set(key, context)
     
-    return render(request, 'lms_core/quizzes.html', context)
+    return render(request, 'lms_core/assignments.html', {**context, **page_cache.fragment_context(key)})
 
 @login_required
-def grades_view(request):
-    """View all grades"""
+def quizzes_view(request):
+    """View quizzes, a page at a time"""
     try:
         student = request.user.student_profile
     except:
         messages.error(request, 'Student profile not found.')
         return redirect('dashboard')
     
-    enrolled_courses = Course.objects.filter(
-        enrollments__student=student
-    ).distinct()
+    context = _list_context('quizzes', student, request.GET.get('cursor'))
     
-    course_grades = []
-    for course in enrolled_courses:
-        grades = Grade.objects.filter(
-            student=student,
-            course=course
-        ).order_by('assessment_type', '-graded_date')
+    return render(request, 'lms_core/quizzes.html', context)
+
+@login_required
+def grades_view(request):
+    """View grades by term, newest terms first"""
+    page_number = request.GET.get('page')
+    key = page_cache.page_key('grades', request.user, None, page_number)
+    context = page_cache.get(key)
+    if context is None:
+        try:
+            student = request.user.student_profile
+        except:
+            messages.error(request, 'Student profile not found.')
+            return redirect('dashboard')
         
-        if grades.exists():
-            avg = grades.aggregate(Avg('percentage'))['percentage__avg']
-            course_grades.append({
-                'course': course,
-                'grades': grades,
-                'average': round(avg, 2) if avg else 0
-            })
-    
-    context = {
-        'course_grades': course_grades,
-    }
-    
-    return render(request, 'lms_core/grades.html', context)
+        # Grades of courses the student is enrolled in
+        grades = Grade.objects.filter(student=student, course__enrollments__student=student)
+        
+        # One grouped query: each graded course with its term and average
+        courses = list(
+            grades.values('course_id', 'course__term', 'course__course_code', 'course__start_date')
+            .annotate(average=Avg('percentage'))
+            .order_by('course__course_code', 'course__term')
+        )
+        term_starts = {}
+        for row in courses:
+            term = row['course__term']
+            term_starts[term] = max(term_starts.get(term, row['course__start_date']), row['course__start_date'])
+        terms = sorted(term_starts, key=lambda term: (term_starts[term], term), reverse=True)
+        
+        # Newest terms first, a few terms per page
+        page_obj = Paginator(terms, GRADE_TERMS_PER_PAGE).get_page(page_number)
+        page_terms = set(page_obj.object_list)
+        page_courses = [row for row in courses if row['course__term'] in page_terms]
+        
+        # One ordered query for the grades on this page, bucketed in a single pass
+        course_grades_by_pk = {row['course_id']: {
+            'course': None,
+            'grades': [],
+            'average': round(row['average'], 2) if row['average'] else 0,
+        } for row in page_courses}
+        page_grades = grades.filter(course_id__in=course_grades_by_pk).select_related('course').order_by(
+            'course_id', 'assessment_type', '-graded_date'
+        )
+        for grade in page_grades:
+            course_data = course_grades_by_pk[grade.course_id]
+            course_data['course'] = grade.course
+            course_data['grades'].append(grade)
+        
+        term_grades = {term: [] for term in page_obj.object_list}
+        for row in page_courses:
+            term_grades[row['course__term']].append(course_grades_by_pk[row['course_id']])
+        
+        context = {
+            'term_grades': list(term_grades.items()),
+            'course_grades': [course_grades_by_pk[row['course_id']] for row in page_courses],
+            'terms': page_obj,
+            'stats': stats_for(student),
+        }
+        page_cache.set(key, context)
+    
+    return render(request, 'lms_core/grades.html', {**context, **page_cache.fragment_context(key)})
 
 @login_required
 def forums_view(request):
-    """View forum discussions"""
+    """View forum discussions, a page at a time"""
     try:
         student = request.user.student_profile
     except:
         messages.error(request, 'Student profile not found.')
         return redirect('dashboard')
     
-    enrolled_courses = Course.objects.filter(
-        enrollments__student=student,
-        enrollments__status='Enrolled'
-    )
-    
-    forums = Forum.objects.filter(
-        course__in=enrolled_courses
-    ).select_related('course').order_by('-created_date')
-    
-    context = {
-        'forums': forums,
-    }
+    context = _list_context('forums', student, request.GET.get('cursor'))
     
     return render(request, 'lms_core/forums.html', context)
 
+@login_required
+def api_list_page(request, name):
+    """Next page of the assignments, quizzes or forums list as rendered rows"""
+    if name not in STUDENT_LISTS:
+        return JsonResponse({'success': False, 'error': 'Unknown list'}, status=404)
+    try:
+        student = request.user.student_profile
+    except:
+        return JsonResponse({'success': False, 'error': 'Student profile not found'}, status=404)
+    
+    build, rows_template = STUDENT_LISTS[name]
+    try:
+        context = build(student, request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'html': render_to_string(rows_template, context, request=request),
+        'next_cursor': context['next_cursor'],
+    })
+
 @login_required
 def ai_query_view(request):
     """AI-powered query interface"""
@@ -369,41 +394,62 @@ def ai_query_view(request):
             query_text = form.cleaned_data['query_text']
             
             # Generate AI response
-            ai_response = ai_engine.generate_response(query_text, student)
-            
-            # Save query
-            query = Query.objects.create(
-                query_id=f"Q{Query.objects.count() + 1:06d}",
-                student=student,
-                query_text=query_text,
-                intent=ai_response['intent'],
-                response_text=ai_response['response'],
-                status='Resolved'
-            )
+            try:
+                with admission.admit(client_key(request.user, student)):
+                    ai_response = get_engine().generate_response(query_text, student)
+            except Shed:
+                # Saturated or rate limited: answer at once with the default reply
+                ai_response = get_engine().degraded_response(query_text)
+                messages.warning(request, SHED_MESSAGE)
+            else:
+                # Queue the query; it is written to the database in batches
+                query_log.log(
+                    student=student,
+                    query_text=query_text,
+                    intent=ai_response['intent'],
+                    response_text=ai_response['response'],
+                    status='Resolved'
+                )
             
             context = {
                 'form': QueryForm(),
                 'query': query_text,
                 'response': ai_response['response'],
                 'intent': ai_response['intent'],
-                'confidence': ai_response.get('confidence', 0.5)
+                'confidence': ai_response.get('confidence', 0.5),
+                'suggestions': [] if ai_response.get('degraded') else _suggestions(query_text)
             }
             
             return render(request, 'lms_core/ai_query.html', context)
     else:
         form = QueryForm()
     
-    recent_queries = Query.objects.filter(
-        student=student
-    ).order_by('-timestamp')[:10] if student else []
-    
     context = {
         'form': form,
-        'recent_queries': recent_queries
+        'recent_queries': _recent_queries(student)
     }
     
     return render(request, 'lms_core/ai_query.html', context)
 
+def _suggestions(query_text):
+    """"Students also asked" entries for a question; never fails the request"""
+    try:
+        return similar_queries.similar(query_text)
+    except Exception as e:
+        logger.warning("Could not look up similar questions: %s", e)
+        return []
+
+def _recent_queries(student, limit=10):
+    """Latest queries of a student, including ones still queued in the query log"""
+    if not student:
+        return []
+    queued = query_log.pending(student)
+    saved = Query.objects.filter(student=student).order_by('-timestamp')[:limit]
+    merged = {query.query_id: query for query in saved}
+    for query in queued:
+        merged[query.query_id] = query
+    return sorted(merged.values(), key=lambda query: query.timestamp, reverse=True)[:limit]
+
 @login_required
 def api_query(request):
     """API endpoint for AI queries"""
@@ -418,7 +464,11 @@ def api_query(request):
             except:
                 pass
             
-            ai_response = ai_engine.generate_response(query_text, student)
+            try:
+                with admission.admit(client_key(request.user, student)):
+                    ai_response = get_engine().generate_response(query_text, student)
+            except Shed as shed:
+                return _degraded_json([query_text], shed.reason)
             
             return JsonResponse({
                 'success': True,
@@ -433,3 +483,290 @@ def api_query(request):
             }, status=400)
     
     return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+def _sse(event, data):
+    """One Server-Sent Events message"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+def _response_chunks(text):
+    """Split a reply into lines and sentences, the units it is streamed in"""
+    return [chunk for chunk in re.split(r'(?<=\n)|(?<=[a-z][.!?] )', text) if chunk]
+
+def _stream_answer(user, student, query_text):
+    engine = get_engine()
+    events = engine.stream_response(query_text, student)
+    ai_response = None
+    answering = False
+    try:
+        try:
+            # Detecting the intent is cheap, so the client learns it before any lookup runs
+            _, intent = next(events)
+            yield _sse('intent', {'intent': intent})
+            
+            with admission.admit(client_key(user, student)):
+                answering = True
+                for kind, value in events:
+                    if kind == 'text':
+                        for chunk in _response_chunks(value):
+                            yield _sse('chunk', {'text': chunk})
+                    else:
+                        ai_response = value
+        except Shed as shed:
+            ai_response = engine.degraded_response(query_text)
+            ai_response['reason'] = shed.reason
+            for chunk in _response_chunks(ai_response['response']):
+                yield _sse('chunk', {'text': chunk})
+        except Exception as e:
+            answering = False
+            yield _sse('error', {'error': str(e)})
+            return
+        
+        yield _sse('done', {
+            'intent': ai_response['intent'],
+            'confidence': ai_response.get('confidence', 0.5),
+            'degraded': ai_response.get('degraded', False),
+            'reason': ai_response.get('reason'),
+            'suggestions': [] if ai_response.get('degraded') else _suggestions(query_text),
+        })
+    finally:
+        if ai_response is None and answering:
+            # The client went away mid-answer; the rest of it is already looked up
+            ai_response = next((value for kind, value in events if kind == 'done'), None)
+        # Saved once the answer has been streamed, or the client has gone away
+        if ai_response is not None and not ai_response.get('degraded'):
+            query_log.log(
+                student=student,
+                query_text=query_text,
+                intent=ai_response['intent'],
+                response_text=ai_response['response'],
+                status='Resolved'
+            )
+
+@login_required
+def api_query_stream(request):
+    """API endpoint streaming an AI answer as Server-Sent Events
+    
+    Sends an ``intent`` event as soon as the intent is detected, then the
+    answer as ``chunk`` events and a final ``done`` event with the
+    confidence and similar questions (or an ``error`` event).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        query_text = data.get('query', '')
+        if not isinstance(query_text, str) or not query_text.strip():
+            raise ValueError('"query" must be a non-empty string')
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    
+    student = None
+    try:
+        student = request.user.student_profile
+    except:
+        pass
+    
+    response = StreamingHttpResponse(
+        _stream_answer(request.user, student, query_text.strip()),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def api_query_batch(request):
+    """API endpoint answering a list of AI queries in one request"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            queries = data.get('queries', [])
+            
+            if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+                raise ValueError('"queries" must be a list of strings')
+            if len(queries) > API_BATCH_MAX_QUERIES:
+                raise ValueError(f'At most {API_BATCH_MAX_QUERIES} queries per request')
+            
+            student = None
+            try:
+                student = request.user.student_profile
+            except:
+                pass
+            
+            try:
+                with admission.admit(client_key(request.user, student)):
+                    ai_responses = get_engine().generate_responses(queries, [student] * len(queries))
+            except Shed as shed:
+                return _degraded_json(queries, shed.reason, batch=True)
+            
+            return JsonResponse({
+                'success': True,
+                'results': [{
+                    'query': query_text,
+                    'response': ai_response['response'],
+                    'intent': ai_response['intent'],
+                    'confidence': ai_response.get('confidence', 0.5)
+                } for query_text, ai_response in zip(queries, ai_responses)]
+            })
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+    
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+def _degraded_json(queries, reason, batch=False):
+    """Default replies for shed API requests; 429 when the client is over its rate"""
+    results = [
+        {
+            'query': query_text,
+            'response': ai_response['response'],
+            'intent': ai_response['intent'],
+            'confidence': ai_response['confidence'],
+        }
+        for query_text, ai_response in zip(queries, map(get_engine().degraded_response, queries))
+    ]
+    payload = {'success': True, 'degraded': True, 'reason': reason}
+    if batch:
+        payload['results'] = results
+    else:
+        del results[0]['query']
+        payload.update(results[0])
+    response = JsonResponse(payload, status=429 if reason == 'rate_limited' else 200)
+    response['Retry-After'] = '1'
+    return response
+
+
+@staff_member_required
+def ai_metrics(request):
+    """p50/p95/p99 latency and query counts per intent and engine stage in this worker"""
+    if request.method == 'POST' and request.POST.get('reset'):
+        latency_recorder.reset()
+    return JsonResponse({
+        'stages': latency_recorder.summary(),
+        'query_log': query_log.stats(),
+        'kb_keywords': keyword_stats.summary(),
+        'single_flight': single_flight.stats(),
+        'admission': admission.stats(),
+    })
+
+# ============================================
+# Async AI endpoints (ASGI deployments)
+# ============================================
+
+def _generate_response(query_text, student):
+    # Runs in an engine pool thread, where building the engine may touch the database
+    return get_engine().generate_response(query_text, student)
+
+async def _get_student_async(request):
+    user = await request.auser()
+    try:
+        return await Student.objects.aget(user=user)
+    except Student.DoesNotExist:
+        return None
+
+async def _admit_async(request, student):
+    """Per-student rate check; the engine pool bounds concurrency for async views"""
+    admission.check_rate(client_key(await request.auser(), student))
+
+@login_required
+async def ai_query_async_view(request):
+    """AI query interface that keeps engine work off the event loop"""
+    student = await _get_student_async(request)
+    context = {}
+    
+    if request.method == 'POST':
+        form = QueryForm(request.POST)
+        if form.is_valid():
+            query_text = form.cleaned_data['query_text']
+            
+            try:
+                await _admit_async(request, student)
+                ai_response = await engine_pool.run(_generate_response, query_text, student)
+            except (Shed, EngineBusy, EngineTimeout) as e:
+                if isinstance(e, EngineBusy):
+                    admission.record_shed('pool_busy')
+                # Saturated or rate limited: answer at once with the default reply
+                ai_response = (await sync_to_async(get_engine)()).degraded_response(query_text)
+                messages.warning(request, SHED_MESSAGE)
+            else:
+                await sync_to_async(query_log.log)(
+                    student=student,
+                    query_text=query_text,
+                    intent=ai_response['intent'],
+                    response_text=ai_response['response'],
+                    status='Resolved'
+                )
+            
+            context = {
+                'form': QueryForm(),
+                'query': query_text,
+                'response': ai_response['response'],
+                'intent': ai_response['intent'],
+                'confidence': ai_response.get('confidence', 0.5),
+                'suggestions': [] if ai_response.get('degraded') else await sync_to_async(_suggestions)(query_text)
+            }
+            # Templates read request.user, which may still hit the database
+            return await sync_to_async(render)(request, 'lms_core/ai_query.html', context)
+    else:
+        form = QueryForm()
+    
+    context = {
+        'form': form,
+        'recent_queries': await sync_to_async(_recent_queries)(student)
+    }
+    
+    return await sync_to_async(render)(request, 'lms_core/ai_query.html', context)
+
+@login_required
+async def api_query_async(request):
+    """Async API endpoint for AI queries with bounded concurrency and a timeout"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        query_text = data.get('query', '')
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    
+    student = await _get_student_async(request)
+    
+    try:
+        await _admit_async(request, student)
+        ai_response = await engine_pool.run(_generate_response, query_text, student)
+    except Shed as shed:
+        return await sync_to_async(_degraded_json)([query_text], shed.reason)
+    except EngineBusy:
+        admission.record_shed('pool_busy')
+        return JsonResponse({
+            'success': False,
+            'error': 'The AI Assistant is busy, please retry shortly.'
+        }, status=503)
+    except EngineTimeout:
+        return JsonResponse({
+            'success': False,
+            'error': 'The AI Assistant took too long to answer.'
+        }, status=504)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'response': ai_response['response'],
+        'intent': ai_response['intent'],
+        'confidence': ai_response.get('confidence', 0.5)
+    })